@@ -1,66 +1,173 @@
 import os
 import json
-import google.generativeai as genai
-from PIL import Image
 from dotenv import load_dotenv, find_dotenv
 import sys
 import time
 import re
+import random
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from ResponseCache import ResponseCache, make_cache_key
+from ResultStore import ResultStore
+from FrameDedup import iter_dedup_frames
+from JsonStream import iter_json_array_chunks, NotAnArrayError
+from FrameLoader import load_frames, list_frame_files, iter_decoded_frames, MIME_TYPES
+from RankCheck import check_ranks, frames_for_ranks, merge_records, dedupe_records, record_rank, score_records
+import Config
+import Metrics
+from Preprocess import preprocess_image, encode_image, preprocess_signature
 
-# 检查.env文件是否存在
-env_path = find_dotenv()
-if not env_path:
-    print("错误: 未找到.env文件。请创建.env文件并添加GEMINI_API_KEY")
-    print("\n创建.env文件步骤：")
-    print("1. 在当前目录创建名为'.env'的文本文件")
-    print("2. 文件内容添加: GEMINI_API_KEY=你的API密钥")
-    print("3. 保存文件并重新运行程序\n")
-    
-    print("获取Gemini API密钥的步骤：")
-    print("1. 访问 https://makersuite.google.com/app/apikey")
-    print("2. 登录Google账号")
-    print("3. 点击'Create API Key'创建新密钥")
-    print("4. 将生成的密钥复制到.env文件中")
-    sys.exit(1)
-
-# 加载环境变量
-load_dotenv()
-
-# 获取API密钥
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    print("错误: 未找到GEMINI_API_KEY环境变量。请在.env文件中添加GEMINI_API_KEY=你的API密钥")
-    sys.exit(1)
-
-# 清理API密钥（移除可能的空格或换行符）
-api_key = api_key.strip()
-
-# 配置Gemini API
-try:
-    # 使用正确的SDK接口
-    genai.configure(api_key=api_key)
-    
-    # 尝试简单调用测试连接
-    models = genai.list_models()
-    print("成功连接到Gemini API")
-except Exception as e:
-    print(f"连接Gemini API失败: {e}")
-    print("请检查API密钥是否正确，或尝试重新生成API密钥")
-    sys.exit(1)
-
-# 使用Gemini 2.0 Flash-Lite模型
-try:
-    model = genai.GenerativeModel('gemini-2.0-flash-lite')
-    print(f"成功加载模型 gemini-2.0-flash-lite")
-except Exception as e:
-    print(f"加载模型失败: {e}")
-    print("尝试使用备用模型...")
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        print("成功加载备用模型 gemini-1.5-flash")
-    except Exception as e2:
-        print(f"加载备用模型也失败: {e2}")
-        sys.exit(1)
+# Gemini模型在第一次请求时才配置和加载（导入SDK较慢），由init_model初始化
+genai = None
+model = None
+model_name = None
+model_lock = threading.Lock()
+
+def init_model(check_connection=False):
+    """配置Gemini API并加载模型（只执行一次），返回模型
+
+    check_connection为True时先调用list_models测试连接，默认跳过这次网络请求
+    """
+    global genai, model, model_name
+    with model_lock:
+        if model is not None:
+            return model
+
+        # 检查.env文件是否存在
+        env_path = find_dotenv()
+        if not env_path:
+            print("错误: 未找到.env文件。请创建.env文件并添加GEMINI_API_KEY")
+            print("\n创建.env文件步骤：")
+            print("1. 在当前目录创建名为'.env'的文本文件")
+            print("2. 文件内容添加: GEMINI_API_KEY=你的API密钥")
+            print("3. 保存文件并重新运行程序\n")
+
+            print("获取Gemini API密钥的步骤：")
+            print("1. 访问 https://makersuite.google.com/app/apikey")
+            print("2. 登录Google账号")
+            print("3. 点击'Create API Key'创建新密钥")
+            print("4. 将生成的密钥复制到.env文件中")
+            sys.exit(1)
+
+        # 加载环境变量
+        load_dotenv()
+
+        # 获取API密钥
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            print("错误: 未找到GEMINI_API_KEY环境变量。请在.env文件中添加GEMINI_API_KEY=你的API密钥")
+            sys.exit(1)
+
+        # 清理API密钥（移除可能的空格或换行符）
+        api_key = api_key.strip()
+
+        import google.generativeai
+        genai = google.generativeai
+
+        # 配置Gemini API
+        try:
+            # 使用正确的SDK接口
+            genai.configure(api_key=api_key)
+
+            # 尝试简单调用测试连接（需要一次网络往返，只在要求时执行）
+            if check_connection:
+                genai.list_models()
+                print("成功连接到Gemini API")
+        except Exception as e:
+            print(f"连接Gemini API失败: {e}")
+            print("请检查API密钥是否正确，或尝试重新生成API密钥")
+            sys.exit(1)
+
+        # 使用Gemini 2.0 Flash-Lite模型
+        try:
+            model_name = 'gemini-2.0-flash-lite'
+            model = genai.GenerativeModel(model_name)
+            print(f"成功加载模型 gemini-2.0-flash-lite")
+        except Exception as e:
+            print(f"加载模型失败: {e}")
+            print("尝试使用备用模型...")
+            try:
+                model_name = 'gemini-1.5-flash'
+                model = genai.GenerativeModel(model_name)
+                print("成功加载备用模型 gemini-1.5-flash")
+            except Exception as e2:
+                print(f"加载备用模型也失败: {e2}")
+                sys.exit(1)
+        return model
+
+def get_model(name=None):
+    """返回指定名称的模型（按需创建），name为None时返回init_model加载的默认模型"""
+    if name is None:
+        return init_model()
+    with model_lock:
+        if name in models:
+            return models[name]
+    # 先配置API密钥
+    init_model()
+    with model_lock:
+        if name not in models:
+            models[name] = genai.GenerativeModel(name)
+        return models[name]
+
+def cascade_tiers():
+    """本次分析依次使用的模型名称；不使用级联时为[None]，即默认模型"""
+    return [tier["name"] for tier in model_cascade] if cascade_enabled else [None]
+
+def cache_model_name():
+    """缓存键中的模型部分：级联模式下由各级模型和升级阈值组成"""
+    if cascade_enabled:
+        return "cascade:" + ",".join(cascade_tiers()) + f"@{escalation_threshold}"
+    return model_name
+
+def model_stats_entry(name):
+    """返回模型的统计条目（调用方需持有model_stats_lock）"""
+    name = name or model_name
+    if name not in model_stats:
+        model_stats[name] = {"requests": 0, "seconds": [], "input_tokens": 0, "output_tokens": 0,
+                             "cost": 0.0, "folders": 0, "escalated": 0}
+    return model_stats[name]
+
+def record_usage(name, seconds, image_count, response_text, usage=None):
+    """记录一次成功请求的耗时、token用量和费用；响应中没有用量信息时按图片数和响应长度估算"""
+    input_tokens = getattr(usage, "prompt_token_count", None) or image_count * tokens_per_image
+    output_tokens = getattr(usage, "candidates_token_count", None) or len(response_text or "")
+    prices = next((tier for tier in model_cascade if tier["name"] == (name or model_name)), {})
+    cost = (input_tokens * prices.get("input_price", 0) + output_tokens * prices.get("output_price", 0)) / 1e6
+    with model_stats_lock:
+        entry = model_stats_entry(name)
+        entry["requests"] += 1
+        entry["seconds"].append(seconds)
+        entry["input_tokens"] += input_tokens
+        entry["output_tokens"] += output_tokens
+        entry["cost"] += cost
+
+def record_folder(name, escalated):
+    """记录由该模型分析的文件夹，以及是否因得分过低升级到下一个模型"""
+    with model_stats_lock:
+        entry = model_stats_entry(name)
+        entry["folders"] += 1
+        entry["escalated"] += escalated
+
+def model_report():
+    """每个模型的请求数、延迟、升级率、token用量和费用"""
+    with model_stats_lock:
+        stats = {name: dict(entry, seconds=sorted(entry["seconds"])) for name, entry in model_stats.items()}
+    report = {}
+    for name, entry in stats.items():
+        report[name] = {
+            "requests": entry["requests"],
+            "p50_seconds": round(Metrics.percentile(entry["seconds"], 0.5), 3),
+            "p95_seconds": round(Metrics.percentile(entry["seconds"], 0.95), 3),
+            "folders": entry["folders"],
+            "escalated": entry["escalated"],
+            "escalation_rate": round(entry["escalated"] / entry["folders"], 3) if entry["folders"] else 0.0,
+            "input_tokens": entry["input_tokens"],
+            "output_tokens": entry["output_tokens"],
+            "cost_usd": round(entry["cost"], 6),
+        }
+    return report
 
 # 分析提示词
 PROMPT = """帮我识别这些店铺所在的榜单（一个橙色高亮的文字。一般在"大众点评榜单"的正下方的栏目里面，以菜系或者食物种类命名），排名（店铺卡片左上角的灰色部分，储存为int，如1，2，3，4，5，6，7，8，9，10），
@@ -68,98 +175,571 @@ PROMPT = """帮我识别这些店铺所在的榜单（一个橙色高亮的文
 位置，细分榜单（在位置的右边一个空格的地方），价格（在"¥"后面，"人"之前，储存为int）。
 以json数组的形式返回给我。"""
 
+# 打包模式提示词：多个榜单文件夹的截图放在同一个请求中，按组分别返回
+PACK_PROMPT = PROMPT + """
+下面的图片分为{group_count}组，每组前面有"第N组"的文字标记，每组是一个独立的榜单，请分别识别。
+以json对象的形式返回给我，键为组号（"1"、"2"……），值为该组店铺的json数组。"""
+
+# 补全提示词：只发送缺失排名所在的几帧，这些截图是榜单中间的一部分
+REPAIR_PROMPT = PROMPT + """
+这些截图只是榜单的一部分，顶部可能看不到榜单名称。只需要返回{ranks}的店铺。"""
+
+# 并发分析配置
+max_concurrency = 4  # 同时分析的文件夹数量上限
+requests_per_minute = 15  # 每分钟最多发送的API请求数（令牌桶限速）
+max_retries = 5  # 单个文件夹的最大尝试次数
+backoff_base = 2  # 指数退避的基础等待秒数
+backoff_max = 60  # 指数退避的最大等待秒数
+
+class TokenBucket:
+    """线程安全的令牌桶限速器，按每分钟请求数匀速发放令牌"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1, min(rate_per_minute, max_concurrency))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+rate_limiter = TokenBucket(requests_per_minute)
+
+# 帧去重配置：剔除与上一帧几乎相同的截图，可选裁掉相邻帧的重叠部分
+dedup_enabled = True
+dedup_max_distance = 8  # dHash汉明距离阈值（共256位）
+dedup_crop_overlap = False
+
+# 响应缓存（以图片字节、提示词和模型名称为键），在main中初始化，None表示禁用
+response_cache = None
+
+# 打包模式：把多个截图较少的细分榜单文件夹合并成一次请求，减少往返次数
+pack_enabled = False
+pack_max_images = 16  # 每个请求最多包含的图片数
+pack_max_folders = 5  # 每个请求最多包含的文件夹数
+
+# 本地结果库（默认启用，由enable_store初始化）
+result_store = None
+
+# 流式模式：边生成边解析响应，每条记录一闭合就可以使用
+stream_enabled = False
+
+# 排名校验：检查排名是否连续、有无重复，缺失时只重新分析缺失排名所在的帧
+validate_enabled = True
+expected_counts = {}  # 按榜单文件夹名称指定预期的店铺数量，如{"主榜单": 50}；未指定时以识别到的最大排名为准
+rank_reports = {}  # {文件夹路径: 校验报告}，由main写入会话的rank_report.jsonl
+# 报告不使用.json扩展名：Upload和ResultStore会把结果文件夹中的每个.json文件当作榜单读取
+rank_report_file_name = "rank_report.jsonl"
+rank_reports_lock = threading.Lock()
+
+# 模型级联：每个文件夹先交给第一个（最快、最便宜的）模型，结果得分低于阈值时依次升级到后面更强的模型
+cascade_enabled = False
+model_cascade = [
+    {"name": "gemini-2.0-flash-lite", "input_price": 0.075, "output_price": 0.30},  # 价格为美元/百万token
+    {"name": "gemini-2.0-flash", "input_price": 0.10, "output_price": 0.40},
+    {"name": "gemini-2.5-flash", "input_price": 0.30, "output_price": 2.50},
+]
+escalation_threshold = 0.95  # 得分（JSON完整性×字段完整率×排名连续性）低于该值时升级
+tokens_per_image = 258  # 响应中没有用量信息时按每张图片的token数估算输入用量
+models = {}  # {模型名称: 模型}，级联模式下按需创建
+model_stats = {}  # {模型名称: 请求数、耗时、token用量、费用、处理和升级的文件夹数}
+model_stats_lock = threading.Lock()
+model_report_file_name = "model_report.jsonl"  # 与rank_report.jsonl一样不使用.json扩展名
+
+def get_error_status(error):
+    """从API异常中提取HTTP状态码，无法识别时返回None"""
+    code = getattr(error, "code", None)
+    if callable(code):
+        # gRPC异常的code是方法，返回StatusCode枚举
+        try:
+            code = code()
+        except Exception:
+            code = None
+        grpc_status = {"RESOURCE_EXHAUSTED": 429, "INTERNAL": 500, "UNAVAILABLE": 503, "DEADLINE_EXCEEDED": 504}
+        code = grpc_status.get(getattr(code, "name", None))
+    if isinstance(code, int):
+        return code
+    match = re.match(r"\s*(\d{3})\b", str(error))
+    return int(match.group(1)) if match else None
+
+def is_retryable_error(error):
+    """429和5xx错误（以及无状态码的网络错误）可以重试，其余4xx错误直接放弃"""
+    status = get_error_status(error)
+    return status is None or status == 429 or status >= 500
+
+def backoff_delay(attempt):
+    """计算第attempt次失败后的指数退避等待时间（带随机抖动）"""
+    delay = min(backoff_max, backoff_base * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
 # 自然排序函数
 def natural_sort_key(s):
     """提取数字用于自然排序"""
     return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
 
-def process_folder(folder_path):
-    """处理文件夹中的所有图片并一次性发送到Gemini API"""
+def load_images(folder_path):
+    """按帧序号读取文件夹中的所有截图，返回[(路径, 格式, 原始字节)]
+
+    每个文件只读取一次，只检查文件头尾而不解码；像素在prepare_image_parts中逐张解码
+    """
     # 检查文件夹是否存在
     if not os.path.exists(folder_path):
         print(f"文件夹不存在: {folder_path}")
         return []
-    
-    # 获取文件夹中的所有图片文件
-    image_files = [f for f in os.listdir(folder_path) if f.endswith('.png') or f.endswith('.jpg')]
-    image_files.sort(key=lambda x: int(x.split('.')[0]) if x.split('.')[0].isdigit() else -1)
-    
-    if not image_files:
+
+    frames = load_frames(folder_path)
+    if not frames and not list_frame_files(folder_path):
         print(f"文件夹中没有图片: {folder_path}")
-        return []
-    
-    # 加载所有图片
-    images = []
-    for image_file in image_files:
-        image_path = os.path.join(folder_path, image_file)
-        try:
-            img = Image.open(image_path)
-            # 检查图片是否有效
-            img.verify()  # 验证图片完整性
-            # 重新打开，因为verify会消耗图片对象
-            img = Image.open(image_path)
-            images.append(img)
-            print(f"已加载图片: {image_path}")
-        except Exception as e:
-            print(f"加载图片 {image_path} 时出错: {e}")
-    
-    if not images:
+    return frames
+
+def prepare_image_parts(frames, folder_path=""):
+    """逐张解码、去重并预处理截图，返回可直接放入请求的blob字典列表
+
+    同一时间最多只有当前帧和上一张保留帧处于解码状态，内存占用与帧数无关
+    """
+    if not dedup_enabled and not Config.preprocess_enabled:
+        # 不去重也不预处理时直接发送原始文件，不需要解码
+        return [{"mime_type": MIME_TYPES[image_format], "data": data} for _, image_format, data in frames]
+
+    images = iter_decoded_frames(frames)
+    # 剔除重复帧（列表底部多次下滑后的截图往往完全相同）
+    if dedup_enabled:
+        images = iter_dedup_frames(images, dedup_max_distance, dedup_crop_overlap)
+    else:
+        images = ((index, image, 0) for index, image in images)
+
+    image_parts = []
+    for index, image, overlap in images:
+        _, image_format, data = frames[index]
+        if Config.preprocess_enabled:
+            # 裁剪、缩放并重新编码
+            image_parts.append(preprocess_image(image))
+        elif overlap:
+            image_parts.append(encode_image(image, "PNG"))
+        else:
+            # 关闭预处理且没有裁剪时直接发送原始文件，不再重新编码
+            image_parts.append({"mime_type": MIME_TYPES[image_format], "data": data})
+
+    if dedup_enabled and len(image_parts) < len(frames):
+        print(f"去重后保留 {len(image_parts)}/{len(frames)} 张图片: {folder_path}")
+    return image_parts
+
+def request_variant():
+    """当前去重与预处理设置的描述，作为缓存键的一部分"""
+    dedup = f"dedup={dedup_max_distance},crop={dedup_crop_overlap}" if dedup_enabled else "dedup=off"
+    return f"{dedup};{preprocess_signature()}"
+
+def load_folder_request(folder_path):
+    """加载文件夹中的截图并查询缓存，返回(缓存结果, 图片数据, 缓存键)
+
+    命中缓存时图片数据为None；没有图片时缓存结果为空列表
+    """
+    with Metrics.span("process_folder.load", folder=folder_path):
+        frames = load_images(folder_path)
+    if not frames:
         print("没有成功加载任何图片")
-        return []
-    
-    # 构建请求内容
-    content_parts = [PROMPT]
-    content_parts.extend(images)
-    
-    # 重试机制
-    max_retries = 3
+        return [], None, None
+
+    # 先查询缓存，未变化的文件夹直接使用本地保存的响应
+    cache_key = None
+    if response_cache is not None:
+        # 缓存键包含实际加载的模型名称
+        init_model()
+        cache_key = make_cache_key(cache_model_name(), PROMPT, (data for _, _, data in frames), request_variant())
+        cached_text = response_cache.get(cache_key)
+        if cached_text is not None:
+            print(f"命中缓存，跳过API调用: {folder_path}")
+            results = extract_json_from_response(cached_text)
+            if validate_enabled:
+                # 缓存的响应在保存前已经补全过，这里只记录校验结果
+                record_report(folder_path, check_ranks(results, expected_count(folder_path)))
+            return results, None, cache_key
+
+    with Metrics.span("process_folder.prepare", folder=folder_path):
+        image_parts = prepare_image_parts(frames, folder_path)
+    return None, image_parts, cache_key
+
+def process_folder(folder_path, on_record=None):
+    """处理文件夹中的所有图片并一次性发送到Gemini API
+
+    流式模式下每收到一条完整的记录就调用一次on_record(record)
+    """
+    results, image_parts, cache_key = load_folder_request(folder_path)
+    if results is not None:
+        return results
+    return request_analysis(image_parts, folder_path, cache_key, on_record)
+
+def process_pack(folder_paths):
+    """把多个文件夹的截图合并成一次请求，返回{文件夹路径: 记录列表}
+
+    打包响应无法解析或缺少某一组时，对应的文件夹单独重新请求
+    """
+    results = {}
+    requests = []
+    for folder_path in folder_paths:
+        cached, image_parts, cache_key = load_folder_request(folder_path)
+        if cached is not None:
+            results[folder_path] = cached
+        else:
+            requests.append((folder_path, image_parts, cache_key))
+
+    if len(requests) == 1:
+        folder_path, image_parts, cache_key = requests[0]
+        results[folder_path] = request_analysis(image_parts, folder_path, cache_key)
+        return results
+
+    groups = {}
+    if requests:
+        groups = request_packed_analysis([image_parts for _, image_parts, _ in requests],
+                                         ", ".join(folder_path for folder_path, _, _ in requests))
+
+    for index, (folder_path, image_parts, cache_key) in enumerate(requests):
+        group = groups.get(index)
+        report = None
+        if group and validate_enabled:
+            group, report = validate_results(group, image_parts, folder_path, model=cascade_tiers()[0])
+        if group and cascade_enabled:
+            score = score_records(group, True, expected_count(folder_path))[0]
+            escalate = score < escalation_threshold and len(cascade_tiers()) > 1
+            record_folder(cascade_tiers()[0], escalate)
+            if escalate:
+                print(f"打包结果得分低于 {escalation_threshold}，升级模型单独重新请求: {folder_path}")
+                # 打包结果作为起点，升级后的模型得分不如它时仍保留打包结果
+                packed = (group, json.dumps(group, ensure_ascii=False), True, report, score, cascade_tiers()[0])
+                results[folder_path] = request_analysis(image_parts, folder_path, cache_key, first_tier=1, best=packed)
+                continue
+        if group:
+            results[folder_path] = group
+            # 按单个文件夹的缓存键保存，之后单独或打包分析时都能命中
+            if cache_key is not None:
+                response_cache.put(cache_key, cascade_tiers()[0] or model_name, json.dumps(group, ensure_ascii=False))
+        else:
+            print(f"打包响应中没有该组的结果，单独重新请求: {folder_path}")
+            results[folder_path] = request_analysis(image_parts, folder_path, cache_key)
+    return results
+
+def call_with_retry(request, image_count, folder_path="", model=None):
+    """带限速和指数退避重试地调用request()，返回其结果
+
+    request返回None表示空响应，会重试；全部失败时返回None
+    """
     for attempt in range(max_retries):
         try:
             # 一次性发送所有图片进行分析
-            print(f"正在发送 {len(images)} 张图片到Gemini API进行分析... (尝试 {attempt+1}/{max_retries})")
-            
-            # 使用正确的API调用方式
-            response = model.generate_content(content_parts)
-            
+            with Metrics.span("rate_limit"):
+                rate_limiter.acquire()
+            print(f"正在发送 {image_count} 张图片到Gemini API进行分析: {folder_path} (尝试 {attempt+1}/{max_retries})")
+
+            with Metrics.span("process_folder.request", folder=folder_path, images=image_count, attempt=attempt + 1,
+                              model=model or model_name):
+                result = request()
+
             # 检查响应是否有效
-            if response.text and len(response.text) > 0:
-                print("分析完成，正在处理结果...")
-                return extract_json_from_response(response.text)
-            else:
-                print(f"API返回空响应 (尝试 {attempt+1}/{max_retries})")
-                if attempt < max_retries - 1:
-                    print("等待2秒后重试...")
-                    time.sleep(2)
-                    continue
+            if result is not None:
+                print(f"分析完成，正在处理结果: {folder_path}")
+                return result
+            print(f"API返回空响应: {folder_path} (尝试 {attempt+1}/{max_retries})")
         except Exception as e:
-            print(f"API调用出错 (尝试 {attempt+1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                print("等待3秒后重试...")
-                time.sleep(3)
-                continue
-    
-    print(f"在 {max_retries} 次尝试后仍无法成功调用API，跳过当前文件夹")
-    return []
+            print(f"API调用出错: {folder_path} (尝试 {attempt+1}/{max_retries}): {e}")
+            if not is_retryable_error(e):
+                print("该错误不可重试，跳过当前文件夹")
+                return None
+
+        if attempt < max_retries - 1:
+            delay = backoff_delay(attempt)
+            print(f"等待{delay:.1f}秒后重试...")
+            time.sleep(delay)
+
+    print(f"在 {max_retries} 次尝试后仍无法成功调用API，跳过当前文件夹: {folder_path}")
+    return None
+
+def generate_with_retry(content_parts, image_count, folder_path="", model=None):
+    """发送请求，带限速和指数退避重试，返回响应文本；全部失败时返回None
+
+    model为模型名称，None表示默认模型
+    """
+    def request():
+        started = time.perf_counter()
+        response = get_model(model).generate_content(content_parts)
+        if not response.text:
+            return None
+        record_usage(model, time.perf_counter() - started, image_count, response.text,
+                     getattr(response, "usage_metadata", None))
+        return response.text
+
+    return call_with_retry(request, image_count, folder_path, model)
+
+def stream_with_retry(content_parts, image_count, folder_path="", on_record=None, model=None):
+    """以流式响应发送请求，返回(记录列表, 完整响应文本)；全部失败时返回None
+
+    响应片段一到达就增量解析，每条记录一闭合就调用on_record。
+    还没收到任何记录时出错按普通请求的规则重试；收到部分记录后响应中断或格式错误时，
+    保留已收到的记录，响应文本为None（不完整的响应不缓存）
+    """
+    def request():
+        started = time.perf_counter()
+        texts = []
+        stream_error = None
+        usage = None
+
+        def iter_text():
+            nonlocal stream_error, usage
+            try:
+                for chunk in get_model(model).generate_content(content_parts, stream=True):
+                    texts.append(chunk.text)
+                    # 用量信息在最后一个片段中
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    yield chunk.text
+            except Exception as e:
+                # 连接中断时结束文本流，由解析器处理不完整的数组
+                stream_error = e
+
+        records = []
+        parse_error = None
+        try:
+            for record in iter_json_array_chunks(iter_text(), skip_prefix=True):
+                if not records:
+                    Metrics.record("process_folder.first_record", time.perf_counter() - started, folder=folder_path)
+                records.append(record)
+                if on_record is not None:
+                    on_record(record)
+        except NotAnArrayError:
+            if stream_error is None and "".join(texts).strip():
+                print(f"无法在响应中找到JSON数组: {''.join(texts)}")
+                return records, None
+        except ValueError as e:
+            parse_error = e
+
+        if stream_error is not None and not records:
+            raise stream_error
+        if not records and not "".join(texts).strip():
+            return None
+        record_usage(model, time.perf_counter() - started, image_count, "".join(texts), usage)
+        if stream_error is not None or parse_error is not None:
+            print(f"响应不完整，保留已收到的 {len(records)} 条记录: {folder_path} ({stream_error or parse_error})")
+            return records, None
+        return records, "".join(texts)
+
+    return call_with_retry(request, image_count, folder_path, model)
+
+def request_model(image_parts, folder_path="", model=None, on_record=None):
+    """用指定的模型分析一组图片，返回(记录列表, 响应文本, 是否完整)；请求全部失败时返回([], None, False)"""
+    # 构建请求内容
+    content_parts = [PROMPT]
+    content_parts.extend(image_parts)
+
+    if stream_enabled:
+        result = stream_with_retry(content_parts, len(image_parts), folder_path, on_record, model)
+        if result is None:
+            return [], None, False
+        results, response_text = result
+        return results, response_text, response_text is not None
+
+    response_text = generate_with_retry(content_parts, len(image_parts), folder_path, model)
+    if response_text is None:
+        return [], None, False
+    with Metrics.span("process_folder.parse", folder=folder_path):
+        results, complete = parse_response(response_text)
+    return results, response_text, complete
+
+def request_analysis(image_parts, folder_path="", cache_key=None, on_record=None, first_tier=0, best=None):
+    """把提示词和图片发送到Gemini API，返回解析出的记录
+
+    流式模式下每收到一条完整的记录就调用一次on_record(record)（升级后的模型不再调用）。
+    级联模式下从第first_tier级模型开始，结果得分低于escalation_threshold时升级到下一级，保留得分最高的结果；
+    best为之前得到的(记录列表, 响应文本, 是否完整, 校验报告, 得分, 模型名称)，如打包请求的结果
+    """
+    tiers = cascade_tiers()[first_tier:]
+    for index, tier in enumerate(tiers):
+        record_callback = on_record if index == 0 else None
+        results, response_text, complete = request_model(image_parts, folder_path, tier, record_callback)
+
+        report = None
+        if validate_enabled:
+            results, report = validate_results(results, image_parts, folder_path, complete, record_callback, tier)
+            if report["repaired"]:
+                # 缓存补全后的记录，下次命中缓存时不必再补
+                response_text = json.dumps(results, ensure_ascii=False)
+                complete = not report["truncated"]
+
+        if not cascade_enabled:
+            best = (results, response_text, complete, report, None, tier)
+            break
+        score, parts = score_records(results, complete, expected_count(folder_path))
+        escalate = score < escalation_threshold and index < len(tiers) - 1
+        record_folder(tier, escalate)
+        if best is None or score > best[4]:
+            best = (results, response_text, complete, report, score, tier)
+        if not escalate:
+            break
+        print(f"{tier} 的结果得分 {score:.2f}（JSON {parts['json']:.2f}，字段 {parts['fields']:.2f}，"
+              f"排名 {parts['ranks']:.2f}），升级到 {tiers[index + 1]}: {folder_path}")
+
+    if best is None:
+        return []
+    results, response_text, complete, report, _, tier = best
+    if report is not None and cascade_enabled:
+        # 保留得分最高的那次结果对应的校验报告
+        with rank_reports_lock:
+            rank_reports[folder_path] = report
+
+    # 只缓存完整解析出数据的响应，解析失败或不完整的文件夹下次仍会重新请求
+    if cache_key is not None and results and complete:
+        # 缓存条目记录实际给出该结果的模型（级联时可能是升级后的模型）
+        response_cache.put(cache_key, tier or model_name, response_text)
+    return results
+
+def request_packed_analysis(image_groups, label=""):
+    """把多组图片放在同一个请求中，返回{组序号(从0开始): 记录列表}，解析失败时返回空字典"""
+    content_parts = [PACK_PROMPT.format(group_count=len(image_groups))]
+    for index, image_parts in enumerate(image_groups):
+        content_parts.append(f"第{index + 1}组（{len(image_parts)}张图片）：")
+        content_parts.extend(image_parts)
+
+    image_count = sum(len(image_parts) for image_parts in image_groups)
+    response_text = generate_with_retry(content_parts, image_count, f"打包{len(image_groups)}个文件夹: {label}",
+                                        cascade_tiers()[0])
+    if response_text is None:
+        return {}
+    with Metrics.span("process_folder.parse", folder=label):
+        return extract_packed_response(response_text, len(image_groups))
+
+def expected_count(folder_path):
+    """榜单文件夹预期的店铺数量，未在expected_counts中指定时返回None"""
+    return expected_counts.get(os.path.basename(os.path.normpath(folder_path)))
+
+def record_report(folder_path, report):
+    """保存文件夹的校验报告，校验未通过时打印问题"""
+    with rank_reports_lock:
+        rank_reports[folder_path] = report
+    if not report["ok"]:
+        problems = []
+        if report["missing"]:
+            problems.append(f"缺少排名 {report['missing']}")
+        if report["duplicates"]:
+            problems.append(f"重复排名 {report['duplicates']}")
+        if report["truncated"]:
+            problems.append("响应不完整")
+        if not report["records"]:
+            problems.append("没有记录")
+        print(f"排名校验未通过: {folder_path}: {'，'.join(problems)}")
+
+def request_repair(image_parts, report, folder_path="", model=None):
+    """只把缺失排名所在的帧发送到Gemini API，返回(记录列表, 是否完整)"""
+    wanted = []
+    if report["missing"]:
+        wanted.append("排名为" + "、".join(str(rank) for rank in report["missing"]))
+    if report["truncated"]:
+        wanted.append(f"排名大于{report['max_rank']}")
+    content_parts = [REPAIR_PROMPT.format(ranks="以及".join(wanted))]
+    content_parts.extend(image_parts)
+
+    response_text = generate_with_retry(content_parts, len(image_parts), f"{folder_path} (补全)", model)
+    if response_text is None:
+        return [], False
+    with Metrics.span("process_folder.parse", folder=folder_path):
+        return parse_response(response_text)
+
+def validate_results(results, image_parts, folder_path="", complete=True, on_record=None, model=None):
+    """校验排名，缺失或响应被截断时用同一个模型只重新分析相关的几帧并合并结果，返回(记录列表, 校验报告)
+
+    报告中frames为文件夹的帧数，repair_frames为重新分析的帧序号（去重后的顺序），repaired为补上的排名
+    """
+    results = dedupe_records(results)
+    expected = expected_count(folder_path)
+    report = check_ranks(results, expected, complete)
+    frames = [] if report["ok"] else frames_for_ranks(report, len(image_parts))
+    added = []
+    if frames:
+        print(f"重新分析 {len(frames)}/{len(image_parts)} 张图片以补全排名: {folder_path}")
+        with Metrics.span("process_folder.repair", folder=folder_path, images=len(frames)):
+            extra, repair_complete = request_repair([image_parts[index] for index in frames], report, folder_path, model)
+        wanted = None if report["truncated"] else set(report["missing"])
+        results, added = merge_records(results, extra, wanted)
+        if on_record is not None:
+            for record in results:
+                if record_rank(record) in added:
+                    on_record(record)
+        if added:
+            print(f"补上了 {len(added)} 个排名: {folder_path}")
+        report = check_ranks(results, expected, complete or (bool(extra) and repair_complete))
+
+    report["frames"] = len(image_parts)
+    report["repair_frames"] = frames
+    report["repaired"] = added
+    record_report(folder_path, report)
+    return results, report
+
+def save_rank_report(output_folder, folder_paths=None):
+    """把本次分析的校验报告写入rank_report.jsonl（每行一个榜单），返回校验未通过的榜单列表
+
+    folder_paths不为None时只包含这些文件夹的报告（常驻服务同时分析多个会话）
+    """
+    with rank_reports_lock:
+        folders = {os.path.basename(os.path.normpath(folder_path)): report
+                   for folder_path, report in rank_reports.items()
+                   if folder_paths is None or folder_path in folder_paths}
+    session = os.path.basename(os.path.normpath(output_folder))
+    with open(os.path.join(output_folder, rank_report_file_name), 'w', encoding='utf-8') as f:
+        for name, report in sorted(folders.items(), key=lambda item: natural_sort_key(item[0])):
+            f.write(json.dumps(dict({"session": session, "folder": name}, **report), ensure_ascii=False) + "\n")
+    return [name for name, report in folders.items() if not report["ok"]]
+
+def parse_response(response_text):
+    """从Gemini的响应中逐条解析JSON数组，返回(记录列表, 是否完整)
+
+    数组中途格式错误或被截断时，保留出错之前已经完整的记录
+    """
+    records = []
+    try:
+        for record in iter_json_array_chunks([response_text], skip_prefix=True):
+            records.append(record)
+    except NotAnArrayError:
+        print(f"无法在响应中找到JSON数组: {response_text}")
+        return [], False
+    except ValueError as e:
+        print(f"JSON解析错误: {e}")
+        print(f"响应文本: {response_text}")
+        if records:
+            print(f"保留出错之前的 {len(records)} 条记录")
+        return records, False
+    return records, True
 
 def extract_json_from_response(response_text):
     """从Gemini的响应中提取JSON数据"""
+    return parse_response(response_text)[0]
+
+def extract_packed_response(response_text, group_count):
+    """从打包请求的响应中提取每组的JSON数组，返回{组序号(从0开始): 记录列表}"""
     try:
-        # 尝试找到JSON数组的开始和结束
-        start_idx = response_text.find('[')
-        end_idx = response_text.rfind(']') + 1
-        
-        if start_idx != -1 and end_idx != 0:
-            json_text = response_text[start_idx:end_idx]
-            # 解析JSON
-            data = json.loads(json_text)
-            return data
-        else:
-            print(f"无法在响应中找到JSON数组: {response_text}")
-            return []
+        start_idx = response_text.find('{')
+        end_idx = response_text.rfind('}') + 1
+        data = json.loads(response_text[start_idx:end_idx]) if start_idx != -1 and end_idx != 0 else None
     except json.JSONDecodeError as e:
-        print(f"JSON解析错误: {e}")
-        print(f"响应文本: {response_text}")
-        return []
+        print(f"打包响应JSON解析错误: {e}")
+        data = None
+
+    if not isinstance(data, dict):
+        print(f"无法在打包响应中找到JSON对象: {response_text[:200]}")
+        return {}
+
+    groups = {}
+    for index in range(group_count):
+        group = data.get(str(index + 1))
+        if isinstance(group, list):
+            groups[index] = group
+    return groups
 
 def determine_json_filename(data):
     """根据JSON数据确定输出文件名"""
@@ -172,8 +752,45 @@ def determine_json_filename(data):
     
     return f"{banner_name}.json"
 
+def partial_results_path(output_folder, ranking_type):
+    """流式模式下榜单的临时记录文件，每行一条已收到的记录"""
+    return os.path.join(output_folder, f"{ranking_type}.partial.jsonl")
+
+class PartialResultWriter:
+    """流式模式下把收到的记录逐条追加到临时记录文件，中途退出时已收到的记录仍在磁盘上
+
+    保存最终的JSON文件时由save_results删除临时文件
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __call__(self, record):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.path, 'w', encoding='utf-8')
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+def process_folder_streaming(folder_path, partial_path):
+    """流式分析一个文件夹，收到的记录同时写入临时记录文件"""
+    writer = PartialResultWriter(partial_path)
+    try:
+        return process_folder(folder_path, on_record=writer)
+    finally:
+        writer.close()
+
 def save_results(data, output_folder, ranking_type):
     """保存JSON结果到文件"""
+    partial_path = partial_results_path(output_folder, ranking_type)
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
     if not data:
         print(f"没有数据需要保存: {ranking_type}")
         return
@@ -195,64 +812,197 @@ def save_results(data, output_folder, ranking_type):
     
     print(f"结果已保存到: {output_path}")
 
-def main():
-    # 检查命令行参数
-    if len(sys.argv) < 2:
-        print("使用方法: python Analyzer.py <武汉_时间戳文件夹路径>")
-        print("例如: python Analyzer.py 搜索结果截图/武汉_20240801_120000")
-        sys.exit(1)
-    
-    input_folder = sys.argv[1]
-    if not os.path.exists(input_folder):
-        print(f"输入文件夹不存在: {input_folder}")
-        sys.exit(1)
-    
-    # 获取城市名称
-    city_name = os.path.basename(input_folder).split('_')[0]
-    
-    # 创建输出根文件夹
-    output_root = "分析结果文件"
-    if not os.path.exists(output_root):
-        os.makedirs(output_root)
-    
-    # 创建城市输出文件夹
-    city_output_folder = os.path.join(output_root, os.path.basename(input_folder))
-    if not os.path.exists(city_output_folder):
-        os.makedirs(city_output_folder)
-    
-    # 初始化文件夹计数器
-    folder_count = 0
-    
-    # 处理主榜单
+    # 同时写入结果库，便于跨城市、跨日期查询
+    if result_store is not None:
+        session = os.path.basename(os.path.normpath(output_folder))
+        result_store.save_ranking(session, os.path.splitext(output_filename)[0], data)
+
+def list_ranking_folders(input_folder):
+    """按固定顺序列出会话中需要分析的榜单文件夹：主榜单在前，细分榜单按自然数排序"""
+    tasks = []
+
+    # 主榜单
     main_ranking_folder = os.path.join(input_folder, "主榜单")
     if os.path.exists(main_ranking_folder):
-        print(f"\n开始处理主榜单: {main_ranking_folder}")
-        main_ranking_results = process_folder(main_ranking_folder)
-        save_results(main_ranking_results, city_output_folder, "主榜单")
-        folder_count += 1
-    
-    # 处理细分榜单 - 使用自然排序
+        tasks.append(("主榜单", main_ranking_folder))
+
+    # 细分榜单 - 使用自然排序
     subdirectories = []
     for item in os.listdir(input_folder):
         item_path = os.path.join(input_folder, item)
         if os.path.isdir(item_path) and item.startswith("细分榜单"):
             subdirectories.append(item)
-    
-    # 使用自然数排序
     subdirectories.sort(key=natural_sort_key)
-    
-    # 按排序后的顺序处理文件夹
+
     for item in subdirectories:
-        item_path = os.path.join(input_folder, item)
-        print(f"\n开始处理细分榜单: {item_path}")
-        category_results = process_folder(item_path)
-        save_results(category_results, city_output_folder, item)
-        folder_count += 1
-    
-    # 打印分析结果统计
+        tasks.append((item, os.path.join(input_folder, item)))
+
+    return tasks
+
+def count_images(folder_path):
+    """文件夹中截图的数量（去重前）"""
+    if not os.path.exists(folder_path):
+        return 0
+    return sum(1 for f in os.listdir(folder_path) if f.endswith('.png') or f.endswith('.jpg'))
+
+def iter_packs(tasks):
+    """把依次到达的榜单文件夹按图片数和文件夹数上限分组，产出[(榜单类型, 文件夹路径), ...]
+
+    截图数超过上限的文件夹（通常是主榜单）单独成组
+    """
+    pack = []
+    pack_images = 0
+    for ranking_type, folder_path in tasks:
+        image_count = count_images(folder_path)
+        if pack and (pack_images + image_count > pack_max_images or len(pack) >= pack_max_folders):
+            yield pack
+            pack = []
+            pack_images = 0
+        pack.append((ranking_type, folder_path))
+        pack_images += image_count
+    if pack:
+        yield pack
+
+def analyze_stream(tasks, output_folder, concurrency=None):
+    """并发分析依次到达的榜单文件夹，按到达顺序保存结果，返回分析的文件夹数量
+
+    tasks可以是列表，也可以是边采集边产生(榜单类型, 文件夹路径)的迭代器
+    """
+    concurrency = concurrency or max_concurrency
+    print(f"并发数: {concurrency}，限速: 每分钟 {requests_per_minute} 次请求")
+    if pack_enabled:
+        print(f"打包模式: 每个请求最多 {pack_max_folders} 个文件夹、{pack_max_images} 张图片")
+    if stream_enabled:
+        print("流式模式: 边生成边解析响应，收到的记录先写入榜单的.partial.jsonl文件")
+
+    folder_count = 0
+    pending = deque()
+
+    def save_next():
+        ranking_type, folder_path, future, packed = pending.popleft()
+        try:
+            results = future.result()
+            if packed:
+                results = results[folder_path]
+        except Exception as e:
+            print(f"处理文件夹 {folder_path} 时出错: {e}")
+            results = []
+        save_results(results, output_folder, ranking_type)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        packs = iter_packs(tasks) if pack_enabled else ([task] for task in tasks)
+        for pack in packs:
+            packed = len(pack) > 1
+            if packed:
+                future = executor.submit(process_pack, [folder_path for _, folder_path in pack])
+            elif stream_enabled:
+                ranking_type, folder_path = pack[0]
+                future = executor.submit(process_folder_streaming, folder_path,
+                                         partial_results_path(output_folder, ranking_type))
+            else:
+                future = executor.submit(process_folder, pack[0][1])
+
+            for ranking_type, folder_path in pack:
+                print(f"\n开始处理{ranking_type}: {folder_path}")
+                pending.append((ranking_type, folder_path, future, packed))
+                folder_count += 1
+
+            # 按提交顺序保存已经完成的结果，保证输出与串行模式一致
+            while pending and pending[0][2].done():
+                save_next()
+
+        while pending:
+            save_next()
+
+    return folder_count
+
+def analyze_session(input_folder, output_folder, concurrency=None):
+    """并发分析一个会话中的所有榜单文件夹，按固定顺序保存结果，返回分析的文件夹数量"""
+    tasks = list_ranking_folders(input_folder)
+    print(f"共 {len(tasks)} 个榜单文件夹")
+    return analyze_stream(tasks, output_folder, concurrency)
+
+def follow_session(input_folder, poll_interval=2, idle_timeout=900):
+    """跟随正在采集的会话，每当一个榜单文件夹写完完成标记就产出它
+
+    采集端写出会话完成标记后结束；超过idle_timeout秒没有新文件夹完成时放弃等待
+    """
+    yielded = set()
+    last_progress = time.monotonic()
+
+    while True:
+        session_done = os.path.exists(os.path.join(input_folder, Config.session_done_marker))
+        for ranking_type, folder_path in list_ranking_folders(input_folder):
+            if ranking_type in yielded:
+                continue
+            if not os.path.exists(os.path.join(folder_path, Config.folder_done_marker)):
+                continue
+            yielded.add(ranking_type)
+            last_progress = time.monotonic()
+            yield ranking_type, folder_path
+
+        if session_done:
+            return
+        if time.monotonic() - last_progress > idle_timeout:
+            print(f"超过 {idle_timeout} 秒没有新的榜单完成采集，停止等待: {input_folder}")
+            return
+        time.sleep(poll_interval)
+
+def enable_cache():
+    """初始化响应缓存并清除过期条目"""
+    global response_cache
+    response_cache = ResponseCache()
+    evicted = response_cache.evict()
+    if evicted:
+        print(f"已清除 {evicted} 条过期缓存")
+
+def enable_store():
+    """打开本地结果库，之后保存的结果都会同时写入结果库"""
+    global result_store
+    result_store = ResultStore()
+
+def prepare_output_folder(input_folder):
+    """创建与截图会话同名的结果文件夹并返回其路径"""
+    # 创建输出根文件夹
+    output_root = "分析结果文件"
+    if not os.path.exists(output_root):
+        os.makedirs(output_root)
+
+    # 创建城市输出文件夹
+    city_output_folder = os.path.join(output_root, os.path.basename(os.path.normpath(input_folder)))
+    if not os.path.exists(city_output_folder):
+        os.makedirs(city_output_folder)
+    return city_output_folder
+
+def save_model_report(output_folder):
+    """把各模型的统计写入model_report.jsonl（每行一个模型）并返回"""
+    report = model_report()
+    with open(os.path.join(output_folder, model_report_file_name), 'w', encoding='utf-8') as f:
+        for name, entry in report.items():
+            f.write(json.dumps(dict({"model": name}, **entry), ensure_ascii=False) + "\n")
+    return report
+
+def print_model_report(report):
+    """打印各模型的请求数、延迟、升级率和费用"""
+    print(f"\n{'模型':<24}{'请求':>6}{'p50(秒)':>10}{'p95(秒)':>10}{'文件夹':>8}{'升级率':>8}{'费用(美元)':>12}")
+    for name, entry in report.items():
+        print(f"{name:<24}{entry['requests']:>6}{entry['p50_seconds']:>10.2f}{entry['p95_seconds']:>10.2f}"
+              f"{entry['folders']:>8}{entry['escalation_rate']:>8.0%}{entry['cost_usd']:>12.4f}")
+
+def print_summary(folder_count, flagged=None, models_report=None):
+    """打印分析结果统计"""
     print("\n=== 分析结果统计 ===")
     print(f"总共分析了 {folder_count} 个文件夹")
-    
+    if flagged:
+        print(f"警告: {len(flagged)} 个榜单排名校验未通过（详见rank_report.jsonl）: {', '.join(flagged)}")
+    elif flagged is not None:
+        print("所有榜单排名连续且没有重复。")
+    if response_cache is not None:
+        stats = response_cache.stats()
+        print(f"缓存命中 {stats['hits']} 次，未命中 {stats['misses']} 次 (命中率 {stats['hit_rate']:.0%})")
+    if models_report:
+        print_model_report(models_report)
+
     # 判断是否达到标准数量
     if folder_count < 20:
         print(f"警告: 分析的文件夹数量少于标准数量 (20)，可能丢失了一些数据！")
@@ -260,8 +1010,87 @@ def main():
         print("恭喜！分析的文件夹数量符合标准数量 (20)。")
     else:
         print(f"分析的文件夹数量 ({folder_count}) 超过了标准数量 (20)。")
-    
+
     print("\n所有分析完成!")
 
+def main(argv=None):
+    global requests_per_minute, rate_limiter, dedup_enabled, dedup_crop_overlap, pack_enabled, pack_max_images, stream_enabled
+    global validate_enabled, cascade_enabled, escalation_threshold
+
+    parser = argparse.ArgumentParser(
+        description="使用Gemini分析榜单截图",
+        epilog="例如: python Analyzer.py 搜索结果截图/武汉_20240801_120000",
+    )
+    parser.add_argument("input_folder", help="城市_时间戳文件夹路径")
+    parser.add_argument("--concurrency", type=int, default=max_concurrency, help=f"同时分析的文件夹数量 (默认 {max_concurrency})")
+    parser.add_argument("--rpm", type=int, default=requests_per_minute, help=f"每分钟最多请求数 (默认 {requests_per_minute})")
+    parser.add_argument("--no-cache", action="store_true", help="不使用本地响应缓存，全部重新请求API")
+    parser.add_argument("--no-dedup", action="store_true", help="不剔除重复帧")
+    parser.add_argument("--crop-overlap", action="store_true", help="裁掉相邻帧之间重叠的内容")
+    parser.add_argument("--preprocess", action="store_true", help="发送前裁剪、缩放并重新编码截图（见Config.preprocess_*）")
+    parser.add_argument("--no-preprocess", action="store_true", help="不裁剪、缩放和重新编码，按原始PNG发送")
+    parser.add_argument("--pack", action="store_true", help="把多个截图较少的细分榜单合并成一次请求")
+    parser.add_argument("--pack-images", type=int, default=pack_max_images, help=f"打包模式下每个请求最多包含的图片数 (默认 {pack_max_images})")
+    parser.add_argument("--stream", action="store_true", help="使用流式响应，边生成边解析，响应中断时保留已收到的记录（打包请求除外）")
+    parser.add_argument("--cascade", action="store_true", help="模型级联：先用最便宜的模型，结果得分低于阈值时升级到更强的模型")
+    parser.add_argument("--escalation-threshold", type=float, default=escalation_threshold,
+                        help=f"级联模式下升级模型的得分阈值 (默认 {escalation_threshold})")
+    parser.add_argument("--no-validate", action="store_true", help="不校验排名连续性，也不重新分析缺失排名所在的帧")
+    parser.add_argument("--no-store", action="store_true", help="只保存JSON文件，不写入本地结果库")
+    parser.add_argument("--follow", action="store_true", help="跟随正在运行的Search.py，每个榜单采集完成后立即分析")
+    parser.add_argument("--metrics", action="store_true", help="记录各步骤耗时，保存到结果文件夹中的trace.jsonl和metrics.prom")
+    parser.add_argument("--check-connection", action="store_true", help="开始前调用list_models测试与Gemini API的连接")
+    args = parser.parse_args(argv)
+
+    input_folder = args.input_folder
+    if not os.path.exists(input_folder):
+        print(f"输入文件夹不存在: {input_folder}")
+        sys.exit(1)
+
+    init_model(args.check_connection)
+
+    if args.rpm != requests_per_minute:
+        requests_per_minute = args.rpm
+        rate_limiter = TokenBucket(requests_per_minute)
+
+    dedup_enabled = not args.no_dedup
+    dedup_crop_overlap = args.crop_overlap
+    if args.preprocess:
+        Config.preprocess_enabled = True
+    if args.no_preprocess:
+        Config.preprocess_enabled = False
+    pack_enabled = args.pack
+    pack_max_images = args.pack_images
+    stream_enabled = args.stream
+    validate_enabled = not args.no_validate
+    cascade_enabled = args.cascade
+    escalation_threshold = args.escalation_threshold
+    with rank_reports_lock:
+        rank_reports.clear()
+    with model_stats_lock:
+        model_stats.clear()
+
+    if not args.no_cache:
+        enable_cache()
+    if not args.no_store:
+        enable_store()
+
+    city_output_folder = prepare_output_folder(input_folder)
+    if args.metrics:
+        Metrics.enable(city_output_folder)
+
+    # 并发处理主榜单和所有细分榜单
+    if args.follow:
+        print(f"等待采集完成的榜单文件夹: {input_folder}")
+        folder_count = analyze_stream(follow_session(input_folder), city_output_folder, args.concurrency)
+    else:
+        folder_count = analyze_session(input_folder, city_output_folder, args.concurrency)
+
+    flagged = save_rank_report(city_output_folder) if validate_enabled else None
+    models_report = save_model_report(city_output_folder) if cascade_enabled else None
+    print_summary(folder_count, flagged, models_report)
+    if args.metrics:
+        Metrics.close()
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
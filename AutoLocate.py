@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import numpy as np
+from PIL import Image
+
+import Config
+
+# 用作定位锚点的首页按钮：采集开始时模拟器停留在首页，这些按钮总是可见
+ANCHORS = ("city_dropdown_button", "city_search_box", "food_button")
+
+layout_file_name = "layout.json"
+cache_file_name = "cache.json"
+
+def to_gray(image):
+    """把PIL图片转换为float64灰度数组"""
+    return np.asarray(image.convert("L"), dtype=np.float64)
+
+def grab_desktop():
+    """截取整个屏幕并换算到屏幕坐标（Retina屏幕的截图像素是屏幕坐标的整数倍）"""
+    import pyautogui
+    from PIL import ImageGrab
+
+    image = ImageGrab.grab()
+    width, height = pyautogui.size()
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.BILINEAR)
+    return image
+
+def window_sums(values, height, width):
+    """用积分图计算每个height×width窗口内的元素和（向量化，与窗口大小无关）"""
+    integral = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+    integral[1:, 1:] = values.cumsum(axis=0).cumsum(axis=1)
+    return (integral[height:, width:] - integral[:-height, width:]
+            - integral[height:, :-width] + integral[:-height, :-width])
+
+def fft_size(n):
+    """不小于n、且只含2、3、5因子的长度（FFT在这些长度上最快）"""
+    while True:
+        m = n
+        for factor in (2, 3, 5):
+            while m % factor == 0:
+                m //= factor
+        if m == 1:
+            return n
+        n += 1
+
+def match_template(image, template):
+    """归一化互相关模板匹配，返回每个左上角位置的得分（-1到1）
+
+    互相关用FFT计算，窗口均值和方差用积分图计算，整屏匹配一个模板只需几十毫秒
+    """
+    height, width = template.shape
+    if image.shape[0] < height or image.shape[1] < width:
+        return np.full((0, 0), -1.0)
+
+    template = template - template.mean()
+    template_norm = np.sqrt((template ** 2).sum())
+    if template_norm == 0:
+        return np.zeros((image.shape[0] - height + 1, image.shape[1] - width + 1))
+
+    shape = (fft_size(image.shape[0] + height - 1), fft_size(image.shape[1] + width - 1))
+    correlation = np.fft.irfft2(np.fft.rfft2(image, shape) * np.fft.rfft2(template[::-1, ::-1], shape), shape)
+    correlation = correlation[height - 1:image.shape[0], width - 1:image.shape[1]]
+
+    sums = window_sums(image, height, width)
+    squares = window_sums(image ** 2, height, width)
+    variance = np.maximum(squares - sums ** 2 / (height * width), 0)
+    denominator = np.sqrt(variance) * template_norm
+    scores = np.zeros_like(correlation)
+    np.divide(correlation, denominator, out=scores, where=denominator > 1e-6)
+    return scores
+
+def find_peaks(scores, threshold, min_distance, limit=8):
+    """按得分从高到低取出不低于threshold的峰值位置，相邻min_distance内只取一个"""
+    scores = scores.copy()
+    peaks = []
+    while len(peaks) < limit and scores.size:
+        y, x = np.unravel_index(np.argmax(scores), scores.shape)
+        score = scores[y, x]
+        if score < threshold:
+            break
+        peaks.append((int(x), int(y), float(score)))
+        scores[max(0, y - min_distance):y + min_distance + 1, max(0, x - min_distance):x + min_distance + 1] = -1
+    return peaks
+
+def match_near(gray, template, center, radius):
+    """在center附近radius范围内匹配模板，返回(匹配到的中心点, 得分)"""
+    height, width = template.shape
+    left = max(0, int(round(center[0] - width / 2 - radius)))
+    top = max(0, int(round(center[1] - height / 2 - radius)))
+    right = min(gray.shape[1], int(round(center[0] + width / 2 + radius)) + 1)
+    bottom = min(gray.shape[0], int(round(center[1] + height / 2 + radius)) + 1)
+    scores = match_template(gray[top:bottom, left:right], template)
+    if not scores.size:
+        return center, -1.0
+    y, x = np.unravel_index(np.argmax(scores), scores.shape)
+    return (left + x + width / 2, top + y + height / 2), float(scores[y, x])
+
+def normalize_positions(positions):
+    """JSON读取的坐标是列表，转换回元组"""
+    return {
+        name: [tuple(p) for p in value] if name == "categories" else tuple(value)
+        for name, value in positions.items()
+    }
+
+class Templates:
+    """定位模板：首页按钮的模板图片，以及各界面元素相对模拟器左上角的参考布局"""
+
+    def __init__(self, images, layout):
+        self.images = images  # {按钮名称: 灰度数组}
+        self.layout = layout  # {"size": [宽, 高], "positions": {名称: 相对坐标}}
+        self.scaled_cache = {}
+
+    @classmethod
+    def load(cls, template_dir=None):
+        """读取模板目录，没有保存过模板时返回None"""
+        template_dir = template_dir or Config.autolocate_template_dir
+        layout_path = os.path.join(template_dir, layout_file_name)
+        if not os.path.exists(layout_path):
+            return None
+        with open(layout_path, 'r', encoding='utf-8') as f:
+            layout = json.load(f)
+        images = {}
+        for name in ANCHORS:
+            with Image.open(os.path.join(template_dir, f"{name}.png")) as image:
+                images[name] = to_gray(image)
+        return cls(images, layout)
+
+    @staticmethod
+    def save(screenshot, positions, template_dir=None, radius=None):
+        """从首页截图中裁出锚点按钮的模板，并保存参考布局"""
+        template_dir = template_dir or Config.autolocate_template_dir
+        radius = radius or Config.autolocate_template_radius
+        if not os.path.exists(template_dir):
+            os.makedirs(template_dir)
+
+        for name in ANCHORS:
+            x, y = positions[name]
+            screenshot.crop((x - radius, y - radius, x + radius, y + radius)).save(
+                os.path.join(template_dir, f"{name}.png"))
+
+        left, top = positions["simulator_top_left"]
+        right, bottom = positions["simulator_bottom_right"]
+
+        def relative(point):
+            return [point[0] - left, point[1] - top]
+
+        layout = {
+            "size": [right - left, bottom - top],
+            "positions": {
+                name: [relative(p) for p in value] if name == "categories" else relative(value)
+                for name, value in positions.items()
+            },
+        }
+        with open(os.path.join(template_dir, layout_file_name), 'w', encoding='utf-8') as f:
+            json.dump(layout, f, ensure_ascii=False, indent=2)
+
+    def image(self, name, scale=1.0):
+        """按比例缩放后的模板"""
+        if scale == 1.0:
+            return self.images[name]
+        key = (name, scale)
+        if key not in self.scaled_cache:
+            height, width = self.images[name].shape
+            size = (max(3, round(width * scale)), max(3, round(height * scale)))
+            resized = Image.fromarray(self.images[name].astype(np.uint8)).resize(size, Image.BILINEAR)
+            self.scaled_cache[key] = np.asarray(resized, dtype=np.float64)
+        return self.scaled_cache[key]
+
+    def offset(self, name, scale=1.0):
+        """界面元素相对模拟器左上角的偏移（按比例缩放）"""
+        x, y = self.layout["positions"][name]
+        return x * scale, y * scale
+
+    def positions_at(self, origin, scale=1.0):
+        """模拟器左上角位于origin、按scale缩放时各界面元素的屏幕坐标"""
+        def absolute(point):
+            return (int(round(origin[0] + point[0] * scale)), int(round(origin[1] + point[1] * scale)))
+
+        return {
+            name: [absolute(p) for p in value] if name == "categories" else absolute(value)
+            for name, value in self.layout["positions"].items()
+        }
+
+def validate_positions(positions, gray, templates, radius=3):
+    """检查锚点按钮是否仍在positions记录的位置（只匹配几个小区域，耗时可以忽略）"""
+    width = positions["simulator_bottom_right"][0] - positions["simulator_top_left"][0]
+    scale = width / templates.layout["size"][0]
+    for name in ANCHORS:
+        _, score = match_near(gray, templates.image(name, scale), positions[name], radius)
+        if score < Config.autolocate_threshold:
+            return False
+    return True
+
+def locate(gray, templates, near=None):
+    """在整屏灰度图中找到模拟器窗口，返回换算后的全部坐标；找不到时返回None
+
+    先在整屏中查找第一个锚点的候选位置，再在每个候选推算出的位置附近确认其余锚点。
+    屏幕上有多个模拟器时，选择左上角离near最近的窗口（没有near时选得分最高的）
+    """
+    threshold = Config.autolocate_threshold
+    primary = ANCHORS[0]
+    best = None
+    for scale in Config.autolocate_scales:
+        template = templates.image(primary, scale)
+        scores = match_template(gray, template)
+        for x, y, score in find_peaks(scores, threshold, min(template.shape)):
+            center = (x + template.shape[1] / 2, y + template.shape[0] / 2)
+            dx, dy = templates.offset(primary, scale)
+            origins = [(center[0] - dx, center[1] - dy)]
+            anchor_scores = [score]
+            for name in ANCHORS[1:]:
+                dx, dy = templates.offset(name, scale)
+                found, anchor_score = match_near(gray, templates.image(name, scale),
+                                                 (origins[0][0] + dx, origins[0][1] + dy),
+                                                 Config.autolocate_search_radius * scale)
+                anchor_scores.append(anchor_score)
+                origins.append((found[0] - dx, found[1] - dy))
+            if min(anchor_scores) < threshold:
+                continue
+
+            # 用所有锚点推算出的左上角取平均，减小单个模板的取整误差
+            origin = (sum(o[0] for o in origins) / len(origins), sum(o[1] for o in origins) / len(origins))
+            candidate = {"origin": origin, "scale": scale, "score": sum(anchor_scores) / len(anchor_scores)}
+            if best is None:
+                best = candidate
+            elif near is not None:
+                if np.hypot(origin[0] - near[0], origin[1] - near[1]) < np.hypot(best["origin"][0] - near[0],
+                                                                                  best["origin"][1] - near[1]):
+                    best = candidate
+            elif candidate["score"] > best["score"]:
+                best = candidate
+
+    if best is None:
+        return None
+    return templates.positions_at(best["origin"], best["scale"])
+
+def geometry_key(positions):
+    """窗口位置和大小，作为坐标缓存的键"""
+    left, top = positions["simulator_top_left"]
+    right, bottom = positions["simulator_bottom_right"]
+    return f"{left},{top},{right - left}x{bottom - top}"
+
+def load_cache(template_dir=None):
+    path = os.path.join(template_dir or Config.autolocate_template_dir, cache_file_name)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return {key: normalize_positions(value) for key, value in json.load(f).items()}
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(positions, template_dir=None):
+    """把一组坐标按窗口位置加入缓存（多个进程同时写入时以最后一次为准）"""
+    template_dir = template_dir or Config.autolocate_template_dir
+    cache = load_cache(template_dir)
+    cache[geometry_key(positions)] = positions
+    path = os.path.join(template_dir, cache_file_name)
+    with open(path + f".{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(path + f".{os.getpid()}.tmp", path)
+
+def auto_locate(screenshot=None, templates=None, near=None):
+    """用一张整屏截图自动定位全部界面元素，返回坐标字典；找不到模拟器时返回None"""
+    templates = templates or Templates.load()
+    if templates is None:
+        raise FileNotFoundError(f"没有找到定位模板，请先运行 python Locate.py --save-templates（{Config.autolocate_template_dir}）")
+    gray = to_gray(screenshot if screenshot is not None else grab_desktop())
+    positions = locate(gray, templates, near)
+    if positions is not None:
+        save_cache(positions)
+    return positions
+
+def ensure_positions(positions, screenshot=None, relocate=True):
+    """采集开始时校验坐标：仍然有效时直接返回；否则依次尝试缓存中的窗口位置和整屏自动定位
+
+    没有保存过模板时不做任何检查；全部失败时返回原坐标。模拟器可能不在首页（例如续采）时
+    relocate设为False，锚点按钮本来就不可见，整屏定位只会白白耗时
+    """
+    templates = Templates.load()
+    if templates is None:
+        return positions
+
+    started = time.perf_counter()
+    gray = to_gray(screenshot if screenshot is not None else grab_desktop())
+    if validate_positions(positions, gray, templates):
+        print(f"界面坐标校验通过 ({(time.perf_counter() - started) * 1000:.0f} ms)")
+        return positions
+
+    for key, cached in load_cache().items():
+        if validate_positions(cached, gray, templates):
+            print(f"模拟器窗口位置已变化，使用缓存的坐标: {key}")
+            return cached
+
+    if not relocate:
+        print("界面坐标校验未通过，模拟器可能不在首页，跳过整屏自动定位")
+        return positions
+    located = locate(gray, templates, near=positions["simulator_top_left"])
+    if located is None:
+        print("自动定位失败，继续使用原有坐标（请确认模拟器停留在首页）")
+        return positions
+    save_cache(located)
+    print(f"模拟器窗口位置已变化，已重新定位: {geometry_key(located)} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    return located
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import contextlib
+import multiprocessing
+from queue import Empty
+from datetime import datetime
+
+import Config
+
+def load_profiles(profiles_path=None, names=None):
+    """读取设备配置：默认使用Config.device_profiles，也可以从JSON文件读取
+
+    每个设备配置是一组Config覆盖项，至少包含positions
+    """
+    if profiles_path:
+        with open(profiles_path, 'r', encoding='utf-8') as f:
+            profiles = json.load(f)
+    else:
+        profiles = Config.device_profiles
+
+    if names:
+        missing = [name for name in names if name not in profiles]
+        if missing:
+            raise ValueError(f"未找到设备配置: {', '.join(missing)}")
+        profiles = {name: profiles[name] for name in names}
+
+    for name, profile in profiles.items():
+        if "positions" not in profile:
+            raise ValueError(f"设备配置 {name} 缺少positions")
+
+    # 多个adb设备同时采集时必须各自指定序列号，否则都会连到同一台设备
+    adb_profiles = [name for name, profile in profiles.items() if profile_driver(profile) == "adb"]
+    if len(adb_profiles) > 1:
+        serials = {}
+        for name in adb_profiles:
+            serial = profiles[name].get("adb_serial", Config.adb_serial)
+            if not serial:
+                raise ValueError(f"设备配置 {name} 使用adb驱动但没有指定adb_serial")
+            if serial in serials:
+                raise ValueError(f"设备配置 {serials[serial]} 和 {name} 使用了同一个adb_serial: {serial}")
+            serials[serial] = name
+    return profiles
+
+def profile_driver(profile):
+    """设备配置使用的驱动，未指定时为Config.driver"""
+    return profile.get("driver", Config.driver)
+
+def load_cities(cities, cities_file=None):
+    """合并命令行和文件中的城市列表（文件每行一个城市），保持顺序并去重"""
+    all_cities = list(cities)
+    if cities_file:
+        with open(cities_file, 'r', encoding='utf-8') as f:
+            all_cities.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    return list(dict.fromkeys(all_cities))
+
+def apply_profile(profile):
+    """把设备配置写入当前进程的Config"""
+    for key, value in profile.items():
+        if key == "positions":
+            # JSON读取的坐标是列表，转换回元组
+            value = {
+                name: [tuple(p) for p in pos] if name == "categories" else tuple(pos)
+                for name, pos in value.items()
+            }
+        setattr(Config, key, value)
+
+def capture_worker(profile_name, profile, city_queue, status_queue, analyze, desktop_lock):
+    """设备采集进程：不断从队列取城市，用本设备的配置完成采集
+
+    桌面驱动的设备共用一套鼠标、剪贴板和屏幕截图，持有desktop_lock时才能采集，多个桌面设备依次采集
+    """
+    apply_profile(profile)
+    # 在应用设备配置之后再导入，Search在导入时会检查坐标
+    import Search
+
+    while True:
+        city = city_queue.get()
+        if city is None:
+            break
+
+        Config.search_city = city
+        with desktop_lock if Config.driver == "desktop" else contextlib.nullcontext():
+            status_queue.put({"city": city, "profile": profile_name, "status": "running"})
+            started = time.monotonic()
+            try:
+                session_dir = Search.main(analyze=analyze)
+                status = {"status": "success", "session_dir": session_dir}
+            except Exception as e:
+                traceback.print_exc()
+                status = {"status": "failed", "error": repr(e)}
+
+        status.update({"city": city, "profile": profile_name, "seconds": round(time.monotonic() - started, 1)})
+        status_queue.put(status)
+
+def run_batch(cities, profiles, analyze=False):
+    """把城市分配给各设备并行采集，返回每个城市的结果列表"""
+    city_queue = multiprocessing.Queue()
+    status_queue = multiprocessing.Queue()
+    desktop_lock = multiprocessing.Lock()
+    desktop_profiles = [name for name, profile in profiles.items() if profile_driver(profile) == "desktop"]
+    if len(desktop_profiles) > 1:
+        print(f"警告: {', '.join(desktop_profiles)} 都使用桌面驱动，共用鼠标和键盘，将依次采集而不是并行")
+    for city in cities:
+        city_queue.put(city)
+
+    workers = []
+    for profile_name, profile in profiles.items():
+        # 每个设备一个结束信号
+        city_queue.put(None)
+        worker = multiprocessing.Process(
+            target=capture_worker,
+            args=(profile_name, profile, city_queue, status_queue, analyze, desktop_lock),
+            name=f"capture-{profile_name}",
+        )
+        worker.start()
+        workers.append(worker)
+
+    results = {}
+    while len(results) < len(cities):
+        try:
+            status = status_queue.get(timeout=1)
+        except Empty:
+            # 所有设备进程都已退出（例如导入时出错）时不再等待
+            if not any(worker.is_alive() for worker in workers):
+                break
+            continue
+
+        if status["status"] == "running":
+            print(f"[{status['profile']}] 开始采集 {status['city']}")
+            continue
+        results[status["city"]] = status
+        if status["status"] == "success":
+            print(f"[{status['profile']}] {status['city']} 采集完成，用时 {status['seconds']} 秒 ({len(results)}/{len(cities)})")
+        else:
+            print(f"[{status['profile']}] {status['city']} 采集失败: {status['error']} ({len(results)}/{len(cities)})")
+
+    for worker in workers:
+        worker.join()
+
+    return [results.get(city, {"city": city, "status": "not_run"}) for city in cities]
+
+def print_report(results, elapsed, profiles):
+    """打印每个城市的状态、用时以及总体吞吐量"""
+    print("\n=== 批量采集报告 ===")
+    for result in results:
+        line = f"{result['city']}\t{result['status']}"
+        if "profile" in result:
+            line += f"\t{result['profile']}\t{result['seconds']} 秒"
+        if result["status"] == "success":
+            line += f"\t{result['session_dir']}"
+        print(line)
+
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    print(f"\n成功 {succeeded}/{len(results)} 个城市，设备数 {len(profiles)}，总用时 {elapsed / 60:.1f} 分钟")
+    if elapsed > 0:
+        print(f"吞吐量: {succeeded / elapsed * 3600:.1f} 个城市/小时")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多城市批量采集，按设备配置并行运行")
+    parser.add_argument("cities", nargs="*", help="要采集的城市")
+    parser.add_argument("--cities-file", help="城市列表文件，每行一个城市")
+    parser.add_argument("--profiles", help="设备配置JSON文件（默认使用Config.device_profiles）")
+    parser.add_argument("--devices", nargs="+", help="只使用指定名称的设备配置")
+    parser.add_argument("--analyze", action="store_true", help="边采集边分析")
+    args = parser.parse_args(argv)
+
+    cities = load_cities(args.cities, args.cities_file)
+    if not cities:
+        print("请至少指定一个城市")
+        sys.exit(1)
+
+    try:
+        profiles = load_profiles(args.profiles, args.devices)
+    except (OSError, ValueError) as e:
+        print(f"读取设备配置失败: {e}")
+        sys.exit(1)
+
+    print(f"=== 批量采集 {len(cities)} 个城市，使用 {len(profiles)} 个设备: {', '.join(profiles)} ===")
+    started = time.monotonic()
+    results = run_batch(cities, profiles, args.analyze)
+    elapsed = time.monotonic() - started
+    print_report(results, elapsed, profiles)
+
+    # 保存报告
+    report_dir = "批量采集报告"
+    if not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    report_path = os.path.join(report_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({"elapsed_seconds": round(elapsed, 1), "devices": list(profiles), "results": results},
+                  f, ensure_ascii=False, indent=4)
+    print(f"报告已保存到: {report_path}")
+
+if __name__ == "__main__":
+    main()
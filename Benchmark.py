@@ -0,0 +1,768 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+import contextlib
+
+def payload_size(image_parts):
+    """请求中图片数据的总字节数"""
+    return sum(len(part["data"]) for part in image_parts)
+
+def record_key(record):
+    return (record.get("排名"), record.get("品牌"))
+
+def compare_records(baseline, candidate):
+    """以基准结果为准，统计候选结果的记录召回率和字段一致率"""
+    candidate_by_key = {record_key(r): r for r in candidate if isinstance(r, dict)}
+    matched = 0
+    fields_total = 0
+    fields_equal = 0
+    for record in baseline:
+        if not isinstance(record, dict):
+            continue
+        other = candidate_by_key.get(record_key(record))
+        if other is None:
+            continue
+        matched += 1
+        for field, value in record.items():
+            fields_total += 1
+            fields_equal += other.get(field) == value
+    return {
+        "recall": matched / len(baseline) if baseline else 1.0,
+        "field_agreement": fields_equal / fields_total if fields_total else 1.0,
+    }
+
+def bench_preprocess(args):
+    """对比原始PNG与预处理后图片的请求大小、耗时和识别结果"""
+    import Analyzer
+    import Config
+
+    Analyzer.init_model()
+    tasks = Analyzer.list_ranking_folders(args.session_dir)[:args.folders]
+    if not tasks:
+        print(f"没有找到榜单文件夹: {args.session_dir}")
+        sys.exit(1)
+
+    totals = {"raw_bytes": 0, "processed_bytes": 0, "raw_seconds": 0.0, "processed_seconds": 0.0}
+    recalls = []
+    agreements = []
+    print("榜单\t原始KB\t预处理KB\t原始条数\t预处理条数\t召回率\t字段一致率")
+
+    for ranking_type, folder_path in tasks:
+        frames = Analyzer.load_images(folder_path)
+        if not frames:
+            continue
+
+        results = {}
+        for label, enabled in (("raw", False), ("processed", True)):
+            Config.preprocess_enabled = enabled
+            parts = Analyzer.prepare_image_parts(frames, folder_path)
+            started = time.perf_counter()
+            results[label] = Analyzer.request_analysis(parts, folder_path)
+            totals[f"{label}_seconds"] += time.perf_counter() - started
+            totals[f"{label}_bytes"] += payload_size(parts)
+            results[f"{label}_bytes"] = payload_size(parts)
+
+        comparison = compare_records(results["raw"], results["processed"])
+        recalls.append(comparison["recall"])
+        agreements.append(comparison["field_agreement"])
+        print(
+            f"{ranking_type}\t{results['raw_bytes'] / 1024:.1f}\t{results['processed_bytes'] / 1024:.1f}\t"
+            f"{len(results['raw'])}\t{len(results['processed'])}\t"
+            f"{comparison['recall']:.0%}\t{comparison['field_agreement']:.0%}"
+        )
+
+    print("\n=== 预处理基准汇总 ===")
+    print(f"请求大小: {totals['raw_bytes'] / 1024:.1f} KB → {totals['processed_bytes'] / 1024:.1f} KB "
+          f"({totals['processed_bytes'] / max(1, totals['raw_bytes']):.0%})")
+    print(f"请求耗时: {totals['raw_seconds']:.1f} 秒 → {totals['processed_seconds']:.1f} 秒")
+    if recalls:
+        print(f"平均记录召回率: {sum(recalls) / len(recalls):.1%}，平均字段一致率: {sum(agreements) / len(agreements):.1%}")
+
+def bench_upload(args):
+    """在本地PostgREST替身上对比逐文件串行上传与批量并行上传的吞吐量"""
+    from Fakes import FakePostgREST, write_fake_results
+
+    server = FakePostgREST(latency=args.latency, error_rate=args.error_rate, seed=0)
+    os.environ["SUPABASE_URL"] = server.start()
+    os.environ["SUPABASE_KEY"] = "fake.service.key"
+    import Upload
+
+    with tempfile.TemporaryDirectory() as root:
+        Upload.MANIFEST_PATH = os.path.join(root, "manifest.sqlite")
+        session_dirs = write_fake_results(root, cities=[f"城市{i}" for i in range(args.cities)],
+                                          sessions=args.sessions, records=args.records)
+        total = sum(1 for d in session_dirs for _ in Upload.iter_json_files(d)) * args.records
+        print(f"数据集: {len(session_dirs)} 个会话，共 {total} 条记录，请求延迟 {args.latency * 1000:.0f} ms")
+
+        # 基准：逐个文件串行upsert（改造前的上传方式）
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(None):
+            for session_dir in session_dirs:
+                for file_path in Upload.iter_json_files(session_dir):
+                    Upload.upload_with_retry(Upload.process_json_file(file_path))
+        serial_seconds = time.perf_counter() - started
+
+        with contextlib.redirect_stdout(None):
+            stats = Upload.process_directories(session_dirs, args.batch_size, args.workers)
+            # 数据没有变化时再上传一次，只需对比本地清单
+            delta_stats = Upload.process_directories(session_dirs, args.batch_size, args.workers)
+
+    server.stop()
+    print(f"逐文件串行: {serial_seconds:.2f} 秒，{total / serial_seconds:.0f} 条/秒")
+    print(f"批量并行 (批次 {args.batch_size}，通道 {args.workers}): {stats['seconds']:.2f} 秒，"
+          f"{stats['records_per_second']:.0f} 条/秒，失败 {stats['failed']} 条")
+    print(f"重复上传未变化的数据: {delta_stats['seconds']:.2f} 秒，上传 {delta_stats['uploaded']} 条，"
+          f"跳过 {delta_stats['unchanged']} 条")
+    print(f"服务端共收到 {server.request_count} 个请求，其中 {server.error_count} 个模拟失败，表中 {len(server.rows())} 条记录")
+
+def load_normalized_whole(Upload, file_path):
+    """改造前的整理方式：json.load读入整个文件后多次遍历并复制列表"""
+    filename = os.path.basename(file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not data or not isinstance(data, list):
+        raise ValueError(f"Invalid JSON format in {filename}: Must be a non-empty list")
+    data = list(Upload.handle_missing_required_fields(data))
+    for record in data:
+        record["榜单"] = os.path.splitext(filename)[0]
+        record["城市"] = Upload.extract_city_from_path(file_path)
+    data = list(Upload.handle_duplicate_keys(data))
+    Upload.validate_data(data)
+    return data
+
+def measure(func):
+    """运行func，返回(结果, 秒数, 峰值内存字节)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+def bench_normalize(args):
+    """对比整文件读入与流式整理在整个结果归档上的吞吐量和峰值内存"""
+    import Upload
+
+    with tempfile.TemporaryDirectory() as root:
+        if args.archive:
+            session_dirs = [os.path.join(args.archive, d) for d in sorted(os.listdir(args.archive))
+                            if os.path.isdir(os.path.join(args.archive, d))]
+        else:
+            from Fakes import write_fake_results
+            session_dirs = write_fake_results(root, cities=[f"城市{i}" for i in range(args.cities)],
+                                              sessions=args.sessions, records=args.records)
+        file_paths = [path for d in session_dirs for path in Upload.iter_json_files(d)]
+        print(f"数据集: {len(session_dirs)} 个会话，{len(file_paths)} 个文件")
+
+        def run_whole():
+            count = 0
+            for path in file_paths:
+                count += len(load_normalized_whole(Upload, path))
+            return count
+
+        def run_streaming():
+            count = 0
+            for path in file_paths:
+                for _ in Upload.iter_json_file_records(path):
+                    count += 1
+            return count
+
+        with contextlib.redirect_stdout(None):
+            whole_count, whole_seconds, whole_peak = measure(run_whole)
+            stream_count, stream_seconds, stream_peak = measure(run_streaming)
+
+    for label, count, seconds, peak in (("整文件读入", whole_count, whole_seconds, whole_peak),
+                                        ("流式整理", stream_count, stream_seconds, stream_peak)):
+        print(f"{label}: {count} 条，{seconds:.2f} 秒，{count / seconds:.0f} 条/秒，峰值内存 {peak / 1024:.0f} KB")
+
+def time_command(command, runs):
+    """在新的Python进程中运行命令runs次，返回(耗时中位数, 最后一次的返回码)"""
+    durations = []
+    returncode = 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        returncode = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations), returncode
+
+def bench_startup(args):
+    """测量各入口的启动时间，以及被延迟加载的SDK本身的导入时间"""
+    commands = [("python -c pass（解释器本身）", [sys.executable, "-c", "pass"])]
+    for name in ("locate", "search", "analyze", "daemon", "upload", "batch", "store"):
+        commands.append((f"dzdp.py {name} --help", [sys.executable, "dzdp.py", name, "--help"]))
+    for module in ("Analyzer", "Upload", "Search", "Locate", "Daemon"):
+        commands.append((f"import {module}", [sys.executable, "-c", f"import {module}"]))
+    # 改造前这些SDK在导入模块时就会加载
+    for module in ("google.generativeai", "supabase", "pyautogui"):
+        commands.append((f"import {module}（延迟加载的SDK）", [sys.executable, "-c", f"import {module}"]))
+
+    print(f"每项运行 {args.runs} 次，取中位数")
+    for label, command in commands:
+        seconds, returncode = time_command(command, args.runs)
+        note = "" if returncode == 0 else f"（返回码 {returncode}）"
+        print(f"{label}: {seconds * 1000:.0f} ms{note}")
+
+def prepare_eager(folder_path):
+    """改造前的加载方式：每张截图verify后重新打开，所有解码后的图片一直保留到预处理结束"""
+    from PIL import Image
+    import Analyzer
+    from FrameDedup import dedup_frames
+    from FrameLoader import list_frame_files
+    from Preprocess import preprocess_image
+
+    images = []
+    image_blobs = []
+    for image_path in list_frame_files(folder_path):
+        img = Image.open(image_path)
+        img.verify()
+        img = Image.open(image_path)
+        images.append(img)
+        with open(image_path, 'rb') as f:
+            image_blobs.append(f.read())
+    images, _ = dedup_frames(images, Analyzer.dedup_max_distance, Analyzer.dedup_crop_overlap)
+    return [preprocess_image(img) for img in images]
+
+def prepare_streaming(folder_path):
+    """当前的加载方式：每个文件只读一次，逐张解码"""
+    import Analyzer
+    return Analyzer.prepare_image_parts(Analyzer.load_images(folder_path), folder_path)
+
+def peak_rss_kb():
+    """当前进程的峰值常驻内存（KB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS以字节为单位，Linux以KB为单位
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def run_loader_child(args):
+    """在子进程中运行一种加载方式，输出JSON：耗时、峰值内存增量、请求大小"""
+    import Analyzer  # 先导入依赖，峰值内存增量只计算加载本身
+    import Preprocess
+    import FrameDedup
+    prepare = prepare_eager if args.child == "eager" else prepare_streaming
+    rss_before = peak_rss_kb()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(None):
+        parts = prepare(args.folder)
+    seconds = time.perf_counter() - started
+    rss_after = peak_rss_kb()
+    print(json.dumps({
+        "seconds": seconds,
+        "peak_rss_kb": rss_after - rss_before if rss_before is not None else None,
+        "parts": len(parts),
+        "bytes": payload_size(parts),
+    }))
+
+def write_synthetic_frames(folder_path, frames, width, height, seed=0):
+    """写入随机色块截图（与采集时相同的PNG压缩级别）"""
+    import numpy as np
+    from PIL import Image
+    import Config
+
+    rng = np.random.default_rng(seed)
+    for index in range(frames):
+        blocks = rng.integers(0, 256, (height // 32 + 1, width // 32 + 1, 3), dtype=np.uint8)
+        image = Image.fromarray(blocks).resize((blocks.shape[1] * 32, blocks.shape[0] * 32), Image.NEAREST)
+        image.crop((0, 0, width, height)).save(os.path.join(folder_path, f"{index}.png"),
+                                               compress_level=Config.capture_compress_level)
+
+def bench_loader(args):
+    """对比改造前后加载一个榜单文件夹的耗时和峰值内存，每种方式在独立的子进程中运行"""
+    if args.child:
+        run_loader_child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as root:
+        folder_path = args.folder
+        if not folder_path:
+            folder_path = os.path.join(root, "主榜单")
+            os.makedirs(folder_path)
+            write_synthetic_frames(folder_path, args.frames, args.width, args.height)
+        frame_count = sum(1 for f in os.listdir(folder_path) if f.endswith('.png') or f.endswith('.jpg'))
+        print(f"数据集: {frame_count} 张截图，每种方式运行 {args.runs} 次，取中位数")
+
+        script = os.path.abspath(__file__)
+        for label, variant in (("改造前（verify+重新打开，全部解码）", "eager"), ("单次读取、逐张解码", "streaming")):
+            runs = []
+            for _ in range(args.runs):
+                output = subprocess.run([sys.executable, script, "loader", "--child", variant, "--folder", folder_path],
+                                        capture_output=True, text=True, check=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            seconds = statistics.median(run["seconds"] for run in runs)
+            peaks = [run["peak_rss_kb"] for run in runs if run["peak_rss_kb"] is not None]
+            peak = f"{statistics.median(peaks) / 1024:.1f} MB" if peaks else "不可用"
+            print(f"{label}: {seconds:.2f} 秒，峰值内存增量 {peak}，"
+                  f"{runs[-1]['parts']} 张图片，请求 {runs[-1]['bytes'] / 1024:.0f} KB")
+
+def bench_settle(args):
+    """用录制帧回放测试ScreenWait.wait_until_stable：静止画面、一直变化的画面、延迟稳定的画面，结果不符合预期时退出码为1"""
+    import Config
+    from ScreenWait import wait_until_stable
+    from Fakes import ReplayScreen
+
+    Config.settle_interval = args.interval
+    with tempfile.TemporaryDirectory() as root:
+        write_synthetic_frames(root, 6, args.width, args.height)
+        frames = ReplayScreen.from_folder(root).frames
+
+    stable_frames = Config.settle_stable_frames
+    never_stable = frames * (int(args.timeout / args.interval) + 10)  # 回放时间超过超时时间
+    late = [frames[0]] * 3 + frames[1:5] + [frames[5]]  # 界面先没反应，然后动画几帧，最后停在frames[5]
+    cases = [
+        # (名称, 回放帧, before, 预期结果, 返回前至少截取的次数)
+        ("静止画面", [frames[0]], None, True, 1 + stable_frames),
+        ("一直变化", never_stable, None, False, 0),
+        ("延迟稳定", late, frames[0], True, len(late) + stable_frames),
+    ]
+
+    failures = []
+    for name, replay_frames, before, expected, min_grabs in cases:
+        replay = ReplayScreen(replay_frames)
+        started = time.perf_counter()
+        stable = wait_until_stable(grab=replay, before=before, timeout=args.timeout, change_timeout=args.timeout)
+        elapsed = time.perf_counter() - started
+        print(f"{name}: 返回 {stable}，截取 {replay.grab_count} 次，用时 {elapsed:.2f} 秒")
+        if stable != expected:
+            failures.append(f"{name}: 预期返回 {expected}，实际返回 {stable}")
+        elif stable and replay.grab_count < min_grabs:
+            failures.append(f"{name}: 画面稳定前就返回了（截取 {replay.grab_count} 次，至少需要 {min_grabs} 次）")
+        elif stable and elapsed >= args.timeout:
+            failures.append(f"{name}: 用时 {elapsed:.2f} 秒，没有在超时前返回")
+        elif not stable and elapsed < args.timeout:
+            failures.append(f"{name}: 用时 {elapsed:.2f} 秒，没有等到超时")
+
+    if failures:
+        print("\n等待逻辑不符合预期:")
+        for line in failures:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\n等待逻辑符合预期")
+
+def bench_stream(args):
+    """用Gemini替身对比普通响应与流式响应的首条记录时间、总耗时，以及响应中断时保留的记录数"""
+    import Analyzer
+    from Fakes import FakeGemini
+
+    Analyzer.model_name = "fake-gemini"
+    Analyzer.rate_limiter = Analyzer.TokenBucket(6000)
+    Analyzer.max_retries = 1
+    image_parts = [{"mime_type": "image/jpeg", "data": os.urandom(256)} for _ in range(args.images)]
+    print(f"每个请求 {args.images} 张图片，替身延迟 {args.latency:.1f} 秒，每种方式运行 {args.runs} 次，取中位数")
+
+    for label, stream, truncate_rate in (("普通响应", False, 0.0), ("流式响应", True, 0.0),
+                                         ("流式响应（中途断开）", True, 1.0)):
+        Analyzer.model = FakeGemini(latency=args.latency, records_per_image=args.records_per_image,
+                                    seed=0, truncate_rate=truncate_rate)
+        Analyzer.stream_enabled = stream
+        first_records = []
+        totals = []
+        counts = []
+        for _ in range(args.runs):
+            first_record_at = []
+            started = time.perf_counter()
+
+            def on_record(record):
+                if not first_record_at:
+                    first_record_at.append(time.perf_counter() - started)
+
+            with contextlib.redirect_stdout(None):
+                results = Analyzer.request_analysis(image_parts, "基准", on_record=on_record)
+            totals.append(time.perf_counter() - started)
+            # 普通响应要等整个响应返回后才有记录
+            first_records.append(first_record_at[0] if first_record_at else totals[-1])
+            counts.append(len(results))
+        print(f"{label}: 首条记录 {statistics.median(first_records):.2f} 秒，总计 {statistics.median(totals):.2f} 秒，"
+              f"{statistics.median(counts):.0f}/{args.images * args.records_per_image} 条记录")
+
+def synthetic_desktop(screen_size, windows, seed=0):
+    """生成带渐变背景的整屏截图，windows为[(模拟器画面, 左上角)]"""
+    import numpy as np
+    from PIL import Image
+
+    width, height = screen_size
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(40, 200, width)[None, :] + np.linspace(0, 40, height)[:, None]
+    noise = rng.normal(0, 3, (height, width))
+    desktop = Image.fromarray(np.clip(gradient + noise, 0, 255).astype(np.uint8)).convert("RGB")
+    for frame, origin in windows:
+        desktop.paste(frame, origin)
+    return desktop
+
+def bench_locate(args):
+    """在合成的整屏截图上测试自动定位：保存模板后移动模拟器窗口，检查定位耗时和误差"""
+    import random
+    import Config
+    import AutoLocate
+    from Fakes import FakeDevice
+
+    reference = dict(Config.positions)
+    left, top = reference["simulator_top_left"]
+    right, bottom = reference["simulator_bottom_right"]
+    home = FakeDevice.synthetic(reference, main_frames=1, category_frames=1, categories=1).home
+    screen_size = (args.width, args.height)
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as root:
+        Config.autolocate_template_dir = root
+        AutoLocate.Templates.save(synthetic_desktop(screen_size, [(home, (left, top))]), reference)
+        templates = AutoLocate.Templates.load()
+
+        locate_durations = []
+        validate_durations = []
+        errors = []
+        failures = 0
+        for trial in range(args.trials):
+            origin = (rng.randrange(0, args.width - (right - left)), rng.randrange(0, args.height - (bottom - top)))
+            windows = [(home, origin)]
+            if args.instances > 1:
+                # 其他实例放在固定位置，定位时以目标窗口原来的位置作为参考
+                windows += [(home, (10 + i * 40, 10 + i * 30)) for i in range(args.instances - 1)]
+            desktop = synthetic_desktop(screen_size, windows, seed=trial)
+            expected = (origin[0] - left, origin[1] - top)
+
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(None):
+                located = AutoLocate.locate(AutoLocate.to_gray(desktop), templates, near=origin)
+            locate_durations.append(time.perf_counter() - started)
+            if located is None:
+                failures += 1
+                continue
+            errors.append(max(
+                max(abs(located[name][0] - reference[name][0] - expected[0]),
+                    abs(located[name][1] - reference[name][1] - expected[1]))
+                for name in reference if name != "categories"
+            ))
+
+            gray = AutoLocate.to_gray(desktop)
+            started = time.perf_counter()
+            AutoLocate.validate_positions(located, gray, templates)
+            validate_durations.append(time.perf_counter() - started)
+
+    print(f"屏幕 {args.width}x{args.height}，{args.instances} 个模拟器实例，随机移动窗口 {args.trials} 次")
+    print(f"定位成功 {args.trials - failures}/{args.trials} 次，最大误差 {max(errors) if errors else '-'} 像素")
+    print(f"整屏定位（含灰度转换）: 中位数 {statistics.median(locate_durations) * 1000:.0f} ms，"
+          f"最长 {max(locate_durations) * 1000:.0f} ms")
+    if validate_durations:
+        print(f"坐标校验: 中位数 {statistics.median(validate_durations) * 1000:.1f} ms")
+
+def run_stage(name, func, verbose=False):
+    """运行一个阶段，返回(结果, 秒数, 峰值内存字节)，默认隐藏阶段内的输出"""
+    print(f"运行{name}...")
+    if verbose:
+        return measure(func)
+    with contextlib.redirect_stdout(None), contextlib.redirect_stderr(None):
+        return measure(func)
+
+def count_images(session_dir):
+    return sum(1 for _, _, files in os.walk(session_dir) for f in files if f.endswith('.png') or f.endswith('.jpg'))
+
+def bench_e2e(args):
+    """用替身驱动完整流程：Search.main采集 → Analyzer.main分析 → Upload.process_directory上传"""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    corpus_dir = os.path.abspath(args.corpus) if args.corpus else None
+    original_cwd = os.getcwd()
+
+    from Fakes import FakeDevice, FakeGemini, FakePostgREST, install_fake_gui, write_fake_adb
+
+    server = FakePostgREST(latency=args.db_latency, error_rate=args.db_error_rate, seed=0)
+    os.environ["SUPABASE_URL"] = server.start()
+    os.environ["SUPABASE_KEY"] = "fake.service.key"
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Search在当前目录检查Config.py，所有输出目录也都相对于当前目录
+        shutil.copy(os.path.join(repo_dir, "Config.py"), workdir)
+        os.chdir(workdir)
+        try:
+            import Config
+            import Metrics
+
+            if not args.real_waits:
+                # 替身画面切换是即时的，缩短等待使结果主要反映代码本身的耗时
+                Config.settle_interval = 0.01
+                Config.settle_change_timeout = 0.05
+                Config.scroll_tick_pause = 0.0
+                Config.category_load_min_wait = 0.0
+
+            if corpus_dir:
+                device = FakeDevice.from_session(corpus_dir, Config.positions)
+            else:
+                device = FakeDevice.synthetic(Config.positions, args.main_frames, args.category_frames)
+            if args.driver == "adb":
+                # 通过假adb可执行文件驱动，每条命令都是一个子进程，与真实adb的调用方式一致
+                Config.driver = "adb"
+                Config.adb_path = write_fake_adb(os.path.join(workdir, "fake_adb"), device)
+                Config.adb_serial = "emulator-5554"
+            else:
+                install_fake_gui(device)
+            gemini = FakeGemini(latency=args.gemini_latency, jitter=args.gemini_latency / 2,
+                                error_rate=args.gemini_error_rate, drop_rate=args.gemini_drop_rate, seed=0)
+
+            import Search
+            import Analyzer
+            import Upload
+            import RankCheck
+            Analyzer.model = gemini
+            Analyzer.model_name = "fake-gemini"
+            if args.cascade:
+                # 第一级是更快但会出错的替身，后面几级与普通替身相同
+                cheap = FakeGemini(latency=args.gemini_latency / 2, jitter=args.gemini_latency / 4,
+                                   drop_rate=args.gemini_drop_rate, field_error_rate=args.gemini_field_error_rate, seed=1)
+                Analyzer.models = {tier["name"]: cheap if index == 0 else gemini
+                                   for index, tier in enumerate(Analyzer.model_cascade)}
+            Analyzer.backoff_base = 0.1
+            # 提前创建Supabase客户端，上传阶段只计上传本身的耗时
+            Upload.get_supabase()
+
+            Metrics.enable(os.path.join(workdir, "metrics"), session="e2e")
+            session_dir, search_seconds, search_peak = run_stage("采集", Search.main, args.verbose)
+            frames = count_images(session_dir)
+
+            analyzer_argv = [session_dir, "--no-cache", "--no-store", "--concurrency", str(args.concurrency),
+                             "--rpm", str(args.rpm)] + (["--pack"] if args.pack else []) + (["--stream"] if args.stream else []) \
+                + (["--cascade"] if args.cascade else [])
+            _, analyze_seconds, analyze_peak = run_stage("分析", lambda: Analyzer.main(analyzer_argv), args.verbose)
+            output_folder = Analyzer.prepare_output_folder(session_dir)
+
+            upload_stats, upload_seconds, upload_peak = run_stage(
+                "上传", lambda: Upload.process_directory(output_folder), args.verbose)
+            span_summary = Metrics.summary()
+            Metrics.close(report=False)
+        finally:
+            os.chdir(original_cwd)
+    server.stop()
+
+    stages = {
+        "search": {"seconds": search_seconds, "peak_bytes": search_peak, "items": frames, "unit": "帧"},
+        "analyze": {"seconds": analyze_seconds, "peak_bytes": analyze_peak,
+                    "items": gemini.request_count, "unit": "请求"},
+        "upload": {"seconds": upload_seconds, "peak_bytes": upload_peak, "items": upload_stats["uploaded"], "unit": "条记录"},
+    }
+    print(f"\n=== 端到端基准（{'录制画面' if corpus_dir else '合成画面'}，{frames} 帧）===")
+    for name, stage in stages.items():
+        rate = stage["items"] / stage["seconds"] if stage["seconds"] else 0.0
+        print(f"{name:<8} {stage['seconds']:>8.2f} 秒  {stage['items']:>6} {stage['unit']}  {rate:>8.1f}/秒  "
+              f"峰值内存 {stage['peak_bytes'] / 1024 / 1024:.1f} MB")
+    print(f"Gemini替身: {gemini.request_count} 个请求，其中 {gemini.error_count} 个模拟失败；"
+          f"PostgREST替身: {server.request_count} 个请求，表中 {len(server.rows())} 条记录")
+    rank_reports = list(Analyzer.rank_reports.values())
+    if rank_reports:
+        repaired = [report for report in rank_reports if report["repair_frames"]]
+        print(f"排名校验: {len(rank_reports)} 个榜单，{len(repaired)} 个重新分析了 "
+              f"{sum(len(report['repair_frames']) for report in repaired)} 张图片，"
+              f"{sum(1 for report in rank_reports if not report['ok'])} 个未通过")
+        # 补全只重新发送少数几帧，超过上限就与重新上传整个文件夹差不多了
+        over_limit = []
+        for folder_path, report in Analyzer.rank_reports.items():
+            if len(report["repair_frames"]) > max(1, int(report["frames"] * RankCheck.max_repair_fraction)):
+                over_limit.append(f"{os.path.basename(folder_path)}: {len(report['repair_frames'])}/{report['frames']} 帧")
+        if over_limit:
+            print(f"补全重新发送的帧超过 {RankCheck.max_repair_fraction:.0%}: {', '.join(over_limit)}")
+            sys.exit(1)
+    if args.cascade:
+        Analyzer.print_model_report(Analyzer.model_report())
+    Metrics.print_report(span_summary)
+
+    report = {"stages": stages, "spans": span_summary}
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        print(f"报告已保存到: {json_path}")
+
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, stage in stages.items():
+            previous = baseline.get("stages", {}).get(name)
+            if previous and stage["seconds"] > previous["seconds"] * (1 + args.tolerance):
+                regressions.append(f"{name}: {previous['seconds']:.2f} → {stage['seconds']:.2f} 秒")
+        if regressions:
+            print(f"\n性能回退（超过基准 {args.tolerance:.0%}）:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\n与基准相比没有超过 {args.tolerance:.0%} 的回退")
+
+def configure_fake_analyzer(latency):
+    """让Analyzer使用Gemini替身（不限速、失败不重试）"""
+    import Analyzer
+    from Fakes import FakeGemini
+
+    Analyzer.model = FakeGemini(latency=latency, jitter=latency / 2, seed=0)
+    Analyzer.model_name = "fake-gemini"
+    Analyzer.rate_limiter = Analyzer.TokenBucket(60000)
+    return Analyzer
+
+def run_daemon_child(args):
+    """每个会话一个进程的方式：与真实的Analyzer.py进程一样加载SDK，再分析一个会话"""
+    try:
+        import google.generativeai  # 真实进程在init_model中导入SDK
+    except ImportError:
+        pass
+    Analyzer = configure_fake_analyzer(args.latency)
+    with contextlib.redirect_stdout(None):
+        Analyzer.main([args.child, "--no-cache", "--no-store", "--concurrency", str(args.concurrency)])
+
+def bench_daemon(args):
+    """对比每个会话启动一个Analyzer进程与常驻服务分析同一批会话的总耗时"""
+    if args.child:
+        run_daemon_child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as root:
+        sessions = []
+        for index in range(args.sessions):
+            session_dir = os.path.join(root, "搜索结果截图", f"城市{index + 1}_20240101_{index:06d}")
+            folders = [("主榜单", args.main_frames)] + [(f"细分榜单{n + 1}", args.category_frames) for n in range(args.categories)]
+            for name, frames in folders:
+                folder_path = os.path.join(session_dir, name)
+                os.makedirs(folder_path)
+                write_synthetic_frames(folder_path, frames, 270, 600, seed=index * 100 + len(sessions))
+            sessions.append(session_dir)
+        folder_count = args.sessions * (args.categories + 1)
+        print(f"{args.sessions} 个会话，共 {folder_count} 个榜单文件夹；替身延迟 {args.latency:.2f} 秒，并发 {args.concurrency}")
+
+        # 方式一：采集机器每完成一个会话就启动一次Analyzer.py
+        script = os.path.abspath(__file__)
+        started = time.perf_counter()
+        for session_dir in sessions:
+            subprocess.run([sys.executable, script, "daemon", "--child", session_dir, "--latency", str(args.latency),
+                            "--concurrency", str(args.concurrency)], cwd=root, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        spawn_seconds = time.perf_counter() - started
+        print(f"每个会话一个进程: {spawn_seconds:.2f} 秒，{folder_count / spawn_seconds * 60:.1f} 个文件夹/分钟")
+
+        # 方式二：常驻服务，所有会话共用模型和并发
+        original_cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            configure_fake_analyzer(args.latency)
+            import Daemon
+            service = Daemon.AnalysisService(args.concurrency)
+            with contextlib.redirect_stdout(None):
+                service.start()
+                started = time.perf_counter()
+                jobs = [service.submit(session_dir) for session_dir in sessions]
+                while any(job.status not in ("finished", "failed") for job in jobs):
+                    time.sleep(0.01)
+                daemon_seconds = time.perf_counter() - started
+                service.stop()
+        finally:
+            os.chdir(original_cwd)
+        stats = service.scheduler.stats()
+        print(f"常驻服务: {daemon_seconds:.2f} 秒，{folder_count / daemon_seconds * 60:.1f} 个文件夹/分钟"
+              f"（快 {spawn_seconds / daemon_seconds:.2f} 倍）")
+        Daemon.print_stats(stats)
+
+def main():
+    parser = argparse.ArgumentParser(description="性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    preprocess_parser = subparsers.add_parser("preprocess", help="图片预处理的大小/准确率对比")
+    preprocess_parser.add_argument("session_dir", help="城市_时间戳截图文件夹")
+    preprocess_parser.add_argument("--folders", type=int, default=3, help="参与对比的榜单文件夹数量 (默认 3)")
+    preprocess_parser.set_defaults(func=bench_preprocess)
+
+    upload_parser = subparsers.add_parser("upload", help="批量并行上传的吞吐量（使用本地PostgREST替身）")
+    upload_parser.add_argument("--cities", type=int, default=5, help="城市数量 (默认 5)")
+    upload_parser.add_argument("--sessions", type=int, default=4, help="每个城市的会话数量 (默认 4)")
+    upload_parser.add_argument("--records", type=int, default=50, help="每个榜单文件的记录数 (默认 50)")
+    upload_parser.add_argument("--latency", type=float, default=0.05, help="每个请求的模拟延迟秒数 (默认 0.05)")
+    upload_parser.add_argument("--error-rate", type=float, default=0.0, help="模拟503错误的比例 (默认 0)")
+    upload_parser.add_argument("--batch-size", type=int, default=500, help="批次大小 (默认 500)")
+    upload_parser.add_argument("--workers", type=int, default=4, help="并行通道数 (默认 4)")
+    upload_parser.set_defaults(func=bench_upload)
+
+    normalize_parser = subparsers.add_parser("normalize", help="结果文件整理的吞吐量和峰值内存")
+    normalize_parser.add_argument("--archive", help="分析结果文件目录（默认生成假数据）")
+    normalize_parser.add_argument("--cities", type=int, default=10, help="城市数量 (默认 10)")
+    normalize_parser.add_argument("--sessions", type=int, default=5, help="每个城市的会话数量 (默认 5)")
+    normalize_parser.add_argument("--records", type=int, default=200, help="每个榜单文件的记录数 (默认 200)")
+    normalize_parser.set_defaults(func=bench_normalize)
+
+    startup_parser = subparsers.add_parser("startup", help="各入口的启动时间（导入耗时）")
+    startup_parser.add_argument("--runs", type=int, default=5, help="每项运行次数 (默认 5)")
+    startup_parser.set_defaults(func=bench_startup)
+
+    loader_parser = subparsers.add_parser("loader", help="截图加载与预处理的耗时和峰值内存")
+    loader_parser.add_argument("--folder", help="榜单截图文件夹（默认生成合成截图）")
+    loader_parser.add_argument("--frames", type=int, default=40, help="合成截图数量 (默认 40)")
+    loader_parser.add_argument("--width", type=int, default=1080, help="合成截图宽度 (默认 1080)")
+    loader_parser.add_argument("--height", type=int, default=2400, help="合成截图高度 (默认 2400)")
+    loader_parser.add_argument("--runs", type=int, default=3, help="每种方式运行次数 (默认 3)")
+    loader_parser.add_argument("--child", choices=["eager", "streaming"], help=argparse.SUPPRESS)
+    loader_parser.set_defaults(func=bench_loader)
+
+    stream_parser = subparsers.add_parser("stream", help="流式响应的首条记录时间（使用Gemini替身）")
+    stream_parser.add_argument("--images", type=int, default=12, help="每个请求的图片数 (默认 12)")
+    stream_parser.add_argument("--records-per-image", type=int, default=3, help="每张图片的记录数 (默认 3)")
+    stream_parser.add_argument("--latency", type=float, default=2.0, help="替身生成完整响应的秒数 (默认 2.0)")
+    stream_parser.add_argument("--runs", type=int, default=3, help="每种方式运行次数 (默认 3)")
+    stream_parser.set_defaults(func=bench_stream)
+
+    locate_parser = subparsers.add_parser("locate", help="自动定位的耗时和准确性（合成整屏截图）")
+    locate_parser.add_argument("--width", type=int, default=1920, help="屏幕宽度 (默认 1920)")
+    locate_parser.add_argument("--height", type=int, default=1080, help="屏幕高度 (默认 1080)")
+    locate_parser.add_argument("--instances", type=int, default=1, help="屏幕上的模拟器实例数 (默认 1)")
+    locate_parser.add_argument("--trials", type=int, default=10, help="移动窗口的次数 (默认 10)")
+    locate_parser.set_defaults(func=bench_locate)
+
+    settle_parser = subparsers.add_parser("settle", help="用录制帧回放检查界面稳定等待逻辑（静止、一直变化、延迟稳定）")
+    settle_parser.add_argument("--timeout", type=float, default=1.0, help="最长等待秒数 (默认 1.0)")
+    settle_parser.add_argument("--interval", type=float, default=0.02, help="两次截取画面之间的间隔秒数 (默认 0.02)")
+    settle_parser.add_argument("--width", type=int, default=360, help="录制帧宽度 (默认 360)")
+    settle_parser.add_argument("--height", type=int, default=640, help="录制帧高度 (默认 640)")
+    settle_parser.set_defaults(func=bench_settle)
+
+    daemon_parser = subparsers.add_parser("daemon", help="常驻分析服务与每个会话一个进程的吞吐量对比（使用Gemini替身）")
+    daemon_parser.add_argument("--sessions", type=int, default=4, help="会话数量 (默认 4)")
+    daemon_parser.add_argument("--categories", type=int, default=19, help="每个会话的细分榜单数量 (默认 19)")
+    daemon_parser.add_argument("--main-frames", type=int, default=12, help="主榜单截图数量 (默认 12)")
+    daemon_parser.add_argument("--category-frames", type=int, default=4, help="每个细分榜单的截图数量 (默认 4)")
+    daemon_parser.add_argument("--latency", type=float, default=0.3, help="Gemini替身的平均延迟秒数 (默认 0.3)")
+    daemon_parser.add_argument("--concurrency", type=int, default=4, help="分析并发数 (默认 4)")
+    daemon_parser.add_argument("--child", help=argparse.SUPPRESS)
+    daemon_parser.set_defaults(func=bench_daemon)
+
+    e2e_parser = subparsers.add_parser("e2e", help="用替身离线运行采集、分析、上传的完整流程")
+    e2e_parser.add_argument("--corpus", help="回放的录制会话（搜索结果截图/城市_时间戳），默认使用合成画面")
+    e2e_parser.add_argument("--main-frames", type=int, default=12, help="合成画面中主榜单的帧数 (默认 12)")
+    e2e_parser.add_argument("--category-frames", type=int, default=4, help="合成画面中每个细分榜单的帧数 (默认 4)")
+    e2e_parser.add_argument("--gemini-latency", type=float, default=0.5, help="Gemini替身的平均延迟秒数 (默认 0.5)")
+    e2e_parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="Gemini替身返回503的比例 (默认 0)")
+    e2e_parser.add_argument("--gemini-drop-rate", type=float, default=0.0, help="Gemini替身漏掉每条记录的比例，用于测试排名补全 (默认 0)")
+    e2e_parser.add_argument("--gemini-field-error-rate", type=float, default=0.0,
+                            help="级联模式下第一级替身每条记录字段出错的比例 (默认 0)")
+    e2e_parser.add_argument("--cascade", action="store_true", help="分析时使用模型级联（第一级替身更快但会出错）")
+    e2e_parser.add_argument("--db-latency", type=float, default=0.05, help="PostgREST替身的请求延迟秒数 (默认 0.05)")
+    e2e_parser.add_argument("--db-error-rate", type=float, default=0.0, help="PostgREST替身返回503的比例 (默认 0)")
+    e2e_parser.add_argument("--concurrency", type=int, default=4, help="分析并发数 (默认 4)")
+    e2e_parser.add_argument("--rpm", type=int, default=600, help="分析限速，每分钟请求数 (默认 600)")
+    e2e_parser.add_argument("--pack", action="store_true", help="分析时使用打包模式")
+    e2e_parser.add_argument("--stream", action="store_true", help="分析时使用流式响应")
+    e2e_parser.add_argument("--driver", choices=["desktop", "adb"], default="desktop", help="采集使用的设备驱动 (默认 desktop)")
+    e2e_parser.add_argument("--real-waits", action="store_true", help="保留Config中的界面等待参数")
+    e2e_parser.add_argument("--json", help="把结果保存为JSON，可作为之后运行的基准")
+    e2e_parser.add_argument("--baseline", help="与之前保存的JSON结果比较，任一阶段变慢超过容差时返回1")
+    e2e_parser.add_argument("--tolerance", type=float, default=0.2, help="允许的变慢比例 (默认 0.2)")
+    e2e_parser.add_argument("--verbose", action="store_true", help="显示各阶段的输出")
+    e2e_parser.set_defaults(func=bench_e2e)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import io
+import os
+import queue
+import threading
+from collections import defaultdict
+
+import Config
+import Metrics
+
+# 图片格式对应的文件扩展名
+FILE_EXTENSIONS = {"PNG": "png", "JPEG": "jpg"}
+
+def frame_file_name(index, image_format=None):
+    """第index帧截图的文件名，扩展名由截图格式决定"""
+    image_format = (image_format or Config.capture_format).upper()
+    return f"{index}.{FILE_EXTENSIONS.get(image_format, image_format.lower())}"
+
+def encode_frame(image, image_format, compress_level, quality):
+    """把截图编码为指定格式，返回字节"""
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffer, format="PNG", compress_level=compress_level)
+    elif image_format == "JPEG":
+        image.convert("RGB").save(buffer, format="JPEG", quality=quality)
+    else:
+        image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+class CaptureWriter:
+    """截图写入器：截图放入有界队列，由后台线程编码并写入磁盘
+
+    采集循环只需等待截屏本身；写入跟不上时队列满，submit会等待，内存占用有上限。
+    后台线程出错时，下一次submit、wait_folder或close会在采集线程中抛出该异常
+    """
+
+    def __init__(self, threads=None, queue_size=None, image_format=None, compress_level=None, quality=None, fsync=None):
+        self.image_format = (image_format or Config.capture_format).upper()
+        self.compress_level = Config.capture_compress_level if compress_level is None else compress_level
+        self.quality = Config.capture_quality if quality is None else quality
+        self.fsync = Config.capture_fsync if fsync is None else fsync
+
+        self.queue = queue.Queue(maxsize=queue_size or Config.capture_queue_size)
+        self.condition = threading.Condition()
+        self.pending = defaultdict(int)  # 每个文件夹中尚未写完的截图数
+        self.written = []  # 已写入的文件，close时统一同步到磁盘
+        self.error = None
+        self.closed = False
+
+        self.threads = [
+            threading.Thread(target=self._worker, name=f"capture-writer-{i}", daemon=True)
+            for i in range(threads or Config.capture_writer_threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, image, save_path):
+        """把截图交给后台线程保存（队列满时等待）"""
+        self.check_error()
+        folder_path = os.path.dirname(save_path)
+        with self.condition:
+            self.pending[folder_path] += 1
+        with Metrics.span("capture_writer.submit"):
+            self.queue.put((image, save_path))
+
+    def wait_folder(self, folder_path):
+        """等待文件夹中已提交的截图全部写入"""
+        with Metrics.span("capture_writer.wait"):
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending[folder_path] == 0 or self.error is not None)
+        self.check_error()
+
+    def close(self):
+        """等待所有截图写入，同步到磁盘后停止后台线程"""
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+        if self.fsync:
+            with Metrics.span("capture_writer.fsync", files=len(self.written)):
+                self._sync()
+        self.check_error()
+
+    def check_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"保存截图失败: {self.error!r}") from self.error
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            image, save_path = item
+            folder_path = os.path.dirname(save_path)
+            try:
+                with Metrics.span("save_screenshot", format=self.image_format):
+                    data = encode_frame(image, self.image_format, self.compress_level, self.quality)
+                    with open(save_path, 'wb') as f:
+                        f.write(data)
+                print(f"截图已保存: {save_path}")
+                with self.condition:
+                    self.written.append(save_path)
+            except Exception as e:
+                with self.condition:
+                    if self.error is None:
+                        self.error = e
+            finally:
+                with self.condition:
+                    self.pending[folder_path] -= 1
+                    self.condition.notify_all()
+
+    def _sync(self):
+        """把已写入的截图及其所在文件夹同步到磁盘"""
+        for path in self.written:
+            with open(path, 'rb+') as f:
+                os.fsync(f.fileno())
+
+        # Windows不支持对文件夹fsync
+        if os.name != "nt":
+            for folder_path in sorted({os.path.dirname(path) for path in self.written}):
+                fd = os.open(folder_path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
@@ -1,12 +1,18 @@
-import pyperclip
-import pyautogui
-import time
-
 # 基础配置
 search_city = "成都"  # 要搜索的城市
 main_ranking_scroll_times = 9  # 主榜单下滑次数
 category_ranking_scroll_times = 3  # 细分品类榜单下滑次数
 
+# 列表到底检测：一直下滑到新截图与上一张相同为止（关闭时按上面的固定次数下滑）
+scroll_until_end = True
+main_ranking_max_scrolls = 30  # 主榜单最多下滑次数（安全上限）
+category_ranking_max_scrolls = 15  # 细分品类榜单最多下滑次数（安全上限）
+end_of_list_max_distance = 4  # 与上一张截图的dHash汉明距离不超过该值视为已到底
+
+# 采集完成标记（Analyzer --follow 据此判断哪些榜单可以开始分析）
+folder_done_marker = ".done"  # 写在每个榜单文件夹中
+session_done_marker = ".session_done"  # 写在会话文件夹中，表示全部榜单采集完毕
+
 # 坐标配置
 positions = {
     "simulator_top_left": (606, 198),
@@ -20,6 +26,61 @@ positions = {
     "categories": [(717, 337), (783, 337), (861, 338), (651, 374), (723, 373), (791, 372), (853, 376), (648, 415), (727, 411), (785, 409), (853, 411), (650, 448), (722, 450), (790, 449), (853, 448), (649, 482), (713, 480), (788, 483), (864, 484)],
 }
 
+# 自动定位配置（Locate.py --auto）：在整屏截图中匹配首页按钮模板找到模拟器窗口，按参考布局换算全部坐标
+autolocate_template_dir = "定位模板"  # 模板图片、参考布局和坐标缓存所在目录
+autolocate_template_radius = 20  # 模板为按钮周围边长2倍半径的正方形（屏幕像素）
+autolocate_threshold = 0.8  # 归一化互相关得分不低于该值视为匹配
+autolocate_search_radius = 40  # 在预测位置附近查找其他按钮的半径（屏幕像素）
+autolocate_scales = (1.0,)  # 模拟器窗口相对参考布局的缩放比例候选（窗口改变过大小时添加）
+autolocate_validate = True  # 每次采集开始时快速校验坐标，窗口移动后自动重新定位
+
+# 设备驱动：desktop通过pyautogui操作桌面上的模拟器窗口（占用鼠标和前台窗口）；
+# adb通过adb命令直接操作Android模拟器，截图在内存中完成，多个设备可以同时采集
+driver = "desktop"
+adb_path = "adb"  # adb可执行文件
+adb_serial = None  # 设备序列号（adb devices中的名称），只连接了一个设备时可以为None
+adb_timeout = 10  # 单条adb命令的超时秒数
+adb_screencap_format = "raw"  # raw：直接传输像素，不在设备上编码PNG；png：传输PNG（更慢，数据量更小）
+adb_swipe_distance = 0.5  # 每次下滑的滑动距离（占屏幕高度的比例）
+adb_swipe_duration = 300  # 每次下滑的滑动时长（毫秒）
+adb_settle_stable_frames = 1  # adb驱动下连续多少次没有变化视为稳定（每次截图本身就要几百毫秒）
+
+# 设备配置：每个设备（模拟器窗口或实例）一组Config覆盖项，至少包含positions
+# Batch.py为每个设备启动一个采集进程，城市按先到先得分配给空闲设备
+device_profiles = {
+    "默认": {"positions": positions},
+}
+
+# 自适应等待配置（替代固定sleep：画面稳定后立即继续，最长等待到超时）
+settle_enabled = True  # 关闭时按超时时间固定等待
+settle_timeout = 3  # 默认最长等待秒数
+settle_change_timeout = 1  # 操作后等待画面开始变化的最长秒数
+settle_interval = 0.1  # 两次截取画面之间的间隔秒数
+settle_threshold = 1.0  # 两帧平均灰度差低于该值视为没有变化
+settle_stable_frames = 2  # 连续多少次没有变化视为稳定
+settle_downsample = 4  # 比较前把画面缩小的倍数
+scroll_tick_pause = 0.2  # 每次滚轮滚动之间的停顿秒数
+category_load_min_wait = 0.5  # 切换细分品类后至少等待的秒数（加载中可能出现短暂静止的空白页）
+
+# 截图保存配置：截图由后台线程编码并写入磁盘，采集循环只等待截屏本身
+capture_writer_threads = 2  # 编码和写入截图的线程数
+capture_queue_size = 8  # 等待写入的截图数上限，写入跟不上时采集循环会等待
+capture_format = "PNG"  # 截图格式：PNG（无损）或JPEG
+capture_compress_level = 1  # PNG压缩级别0-9，越低编码越快、文件越大
+capture_quality = 90  # JPEG编码质量
+capture_fsync = True  # 采集结束时把所有截图同步到磁盘
+
+# 图片预处理配置（Analyzer发送截图前）
+# 默认关闭：裁剪会去掉提示词中用来定位榜单名称的"大众点评榜单"标题，开启前先用Benchmark.py preprocess确认识别结果不变
+preprocess_enabled = False  # 关闭时按原始PNG发送
+preprocess_crop = True  # 裁剪到榜单区域（细分品类栏及其下方的列表）
+preprocess_crop_top_margin = 30  # 裁剪区域在细分品类下拉按钮上方保留的像素（屏幕坐标）
+preprocess_crop_bottom_margin = 0  # 裁剪区域去掉模拟器底部的像素（屏幕坐标）
+preprocess_grayscale = False  # 转为灰度图（榜单名称是橙色高亮，灰度可能影响识别）
+preprocess_target_width = 480  # 宽度超过该值时等比缩小，None表示不缩放
+preprocess_format = "JPEG"  # 重新编码格式：JPEG、WEBP或PNG
+preprocess_quality = 80  # JPEG/WEBP编码质量
+
 # 获取模拟器中心点坐标
 def get_simulator_center():
     """计算并返回模拟器窗口的中心点坐标"""
@@ -31,13 +92,55 @@ def get_simulator_center():
 
 # 下滑函数
 def scroll_down():
-    """执行一次下滑（滚轮下滑4次，每次500距离）"""
-    # 先将鼠标移动到模拟器中心
-    center = get_simulator_center()
-    pyautogui.moveTo(center[0], center[1])
-    time.sleep(0.5)  # 给一点时间让鼠标到位
-    
-    # 然后执行滚动
-    for _ in range(4):
-        pyautogui.scroll(-500)  # 负值表示向下滚动
-        time.sleep(0.5)  # 短暂停顿避免过快滚动
+    """执行一次下滑（桌面驱动为滚轮下滑4次，adb驱动为一次滑动），并等待列表停止滚动"""
+    # 延迟导入，Analyzer等不操作界面的脚本也会读取本配置
+    from Driver import get_driver
+    from ScreenWait import grab_screen, settle
+
+    before = grab_screen(latest=True) if settle_enabled else None
+    get_driver().scroll_down()
+
+    # 等待惯性滚动结束
+    settle(before, timeout=2)
+
+def format_value(value, indent=""):
+    """把配置值格式化为Python源码（字符串用双引号，字典每个键占一行）"""
+    import json
+
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, dict) and value:
+        items = "".join(f"{indent}    {format_value(key)}: {format_value(item, indent + '    ')},\n"
+                        for key, item in value.items())
+        return "{\n" + items + indent + "}"
+    if isinstance(value, list):
+        return "[" + ", ".join(format_value(item, indent) for item in value) + "]"
+    if isinstance(value, tuple):
+        return "(" + ", ".join(format_value(item, indent) for item in value) + ("," if len(value) == 1 else "") + ")"
+    return repr(value)
+
+def save_config(names=("positions",), path=None):
+    """把当前的配置值写回Config.py（默认只写坐标），文件中的其他配置和注释保持不变"""
+    import os
+    import ast
+
+    path = path or __file__
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    lines = source.splitlines(keepends=True)
+
+    replacements = []
+    for node in ast.parse(source).body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name) and node.targets[0].id in names):
+            # 保留赋值语句之后的行尾注释（end_col_offset按UTF-8字节计算）
+            rest = lines[node.end_lineno - 1].encode("utf-8")[node.end_col_offset:].decode("utf-8")
+            replacements.append((node.lineno - 1, node.end_lineno, node.targets[0].id, rest))
+
+    for start, end, name, rest in sorted(replacements, reverse=True):
+        lines[start:end] = [f"{name} = {format_value(globals()[name])}{rest}"]
+
+    # 先写临时文件再替换，避免中途出错留下不完整的配置文件
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        f.write("".join(lines))
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,578 @@
+import os
+import json
+import time
+import socket
+import argparse
+import threading
+import urllib.request
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import Config
+import Metrics
+
+# 常驻分析服务配置
+spool_dir = "分析队列"  # 采集机器把任务文件放入该目录（可以是共享目录）
+poll_interval = 2  # 扫描任务目录和跟随中的会话的间隔秒数
+default_port = 8765  # 本地HTTP接口端口
+stats_window = 1000  # 延迟统计保留最近多少个样本
+follow_idle_timeout = 900  # 跟随中的会话超过该秒数没有新的榜单完成时停止等待
+spool_lease_timeout = 60  # 认领目录的心跳超过该秒数没有刷新时，视为服务已崩溃，由其他服务收回其中的任务
+heartbeat_file_name = ".heartbeat"
+
+class Job:
+    """一个会话的分析任务：会话中的榜单文件夹依次进入待分析队列"""
+
+    def __init__(self, job_id, session_dir, output_folder, host=None, follow=False, source="http", spool_name=None):
+        self.id = job_id
+        self.session_dir = os.path.abspath(session_dir)
+        self.host = host
+        self.follow = follow
+        self.source = source
+        self.spool_name = spool_name
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.output_folder = output_folder
+        self.pending = deque()  # [(榜单类型, 文件夹路径, 入队时间)]
+        self.queued = set()  # 已经入队的榜单类型
+        self.folder_paths = set()
+        self.in_flight = 0
+        self.done = 0
+        self.failed = 0
+        self.last_served = 0.0
+        self.last_progress = time.monotonic()
+        self.status = "queued"
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "session": self.session_dir,
+            "host": self.host,
+            "follow": self.follow,
+            "source": self.source,
+            "status": self.status,
+            "pending": len(self.pending),
+            "in_flight": self.in_flight,
+            "done": self.done,
+            "failed": self.failed,
+            "output_folder": self.output_folder,
+            "submitted_at": datetime.fromtimestamp(self.submitted_at).isoformat(timespec="seconds"),
+            "seconds": round((self.finished_at or time.time()) - self.submitted_at, 3),
+        }
+
+class Scheduler:
+    """在所有未完成的会话之间公平分配分析并发
+
+    每次取任务时选择正在分析的文件夹最少的会话（相同时选择最久没有被服务的会话），
+    一个榜单很多的会话不会占满所有并发，后提交的会话也能立即开始
+    """
+
+    def __init__(self, on_job_finished=None):
+        self.jobs = {}
+        self.condition = threading.Condition()
+        self.next_id = 1
+        self.stopping = False
+        self.on_job_finished = on_job_finished
+        self.started_at = time.time()
+        self.folders_done = 0
+        self.folders_failed = 0
+        self.samples = {
+            "daemon.folder_wait": deque(maxlen=stats_window),
+            "daemon.folder_analyze": deque(maxlen=stats_window),
+            "daemon.job": deque(maxlen=stats_window),
+        }
+
+    def submit(self, session_dir, output_folder, host=None, follow=False, source="http", spool_name=None):
+        """提交一个会话，结果保存到output_folder，返回任务"""
+        with self.condition:
+            job = Job(str(self.next_id), session_dir, output_folder, host, follow, source, spool_name)
+            self.next_id += 1
+            self.jobs[job.id] = job
+        print(f"[任务{job.id}] 收到会话 {job.session_dir}" + (f"（来自 {host}）" if host else ""))
+        self.refresh(job)
+        return job
+
+    def refresh(self, job):
+        """把会话中新出现的榜单文件夹加入队列；跟随模式下只加入已写完成标记的文件夹"""
+        import Analyzer
+
+        session_done = os.path.exists(os.path.join(job.session_dir, Config.session_done_marker))
+        ready = []
+        for ranking_type, folder_path in Analyzer.list_ranking_folders(job.session_dir):
+            if ranking_type in job.queued:
+                continue
+            if job.follow and not os.path.exists(os.path.join(folder_path, Config.folder_done_marker)):
+                continue
+            ready.append((ranking_type, folder_path))
+
+        with self.condition:
+            if job.status in ("finished", "failed"):
+                return
+            now = time.time()
+            for ranking_type, folder_path in ready:
+                job.queued.add(ranking_type)
+                job.folder_paths.add(folder_path)
+                job.pending.append((ranking_type, folder_path, now))
+            if ready:
+                job.last_progress = time.monotonic()
+            if job.follow and session_done:
+                # 采集已经结束，剩下的文件夹分析完即可结束任务
+                job.follow = False
+            elif job.follow and time.monotonic() - job.last_progress > follow_idle_timeout:
+                print(f"[任务{job.id}] 超过 {follow_idle_timeout} 秒没有新的榜单完成采集，停止等待")
+                job.follow = False
+            if ready:
+                self.condition.notify_all()
+        self.finish_if_done(job)
+
+    def refresh_following(self):
+        with self.condition:
+            following = [job for job in self.jobs.values() if job.follow and job.status not in ("finished", "failed")]
+        for job in following:
+            self.refresh(job)
+
+    def next_task(self):
+        """阻塞直到有可分析的文件夹，返回(任务, 榜单类型, 文件夹路径, 入队时间)；停止时返回None"""
+        with self.condition:
+            while True:
+                if self.stopping:
+                    return None
+                candidates = [job for job in self.jobs.values() if job.pending]
+                if candidates:
+                    job = min(candidates, key=lambda job: (job.in_flight, job.last_served))
+                    ranking_type, folder_path, queued_at = job.pending.popleft()
+                    job.in_flight += 1
+                    job.last_served = time.monotonic()
+                    job.status = "running"
+                    return job, ranking_type, folder_path, queued_at
+                self.condition.wait()
+
+    def task_done(self, job, wait_seconds, analyze_seconds, success):
+        with self.condition:
+            job.in_flight -= 1
+            if success:
+                job.done += 1
+                self.folders_done += 1
+            else:
+                job.failed += 1
+                self.folders_failed += 1
+            self.samples["daemon.folder_wait"].append(wait_seconds)
+            self.samples["daemon.folder_analyze"].append(analyze_seconds)
+        self.finish_if_done(job)
+
+    def finish_if_done(self, job):
+        """会话中的文件夹全部分析完（跟随模式下还需要会话完成标记）时结束任务"""
+        with self.condition:
+            if job.status in ("finished", "failed") or job.follow or job.pending or job.in_flight:
+                return
+            if not job.queued:
+                job.status = "failed"
+            else:
+                job.status = "finished"
+            job.finished_at = time.time()
+            self.samples["daemon.job"].append(job.finished_at - job.submitted_at)
+        if self.on_job_finished is not None:
+            self.on_job_finished(job)
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+
+    def stats(self):
+        """队列深度、并发、吞吐量、延迟统计，以及各模型的请求数、升级率和费用"""
+        import Analyzer
+
+        with self.condition:
+            jobs = list(self.jobs.values())
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+            folders_done = self.folders_done
+            folders_failed = self.folders_failed
+        uptime = time.time() - self.started_at
+        by_status = {}
+        for job in jobs:
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            "uptime_seconds": round(uptime, 1),
+            "queue_depth": sum(len(job.pending) for job in jobs),
+            "in_flight": sum(job.in_flight for job in jobs),
+            "jobs": by_status,
+            "folders_done": folders_done,
+            "folders_failed": folders_failed,
+            "folders_per_minute": round(folders_done / uptime * 60, 2) if uptime else 0.0,
+            "latency": Metrics.summarize(samples),
+            "models": Analyzer.model_report(),
+        }
+
+def format_prometheus(stats):
+    """把服务统计转换为Prometheus文本格式"""
+    lines = [
+        "# HELP dzdp_daemon_queue_depth Ranking folders waiting for analysis.",
+        "# TYPE dzdp_daemon_queue_depth gauge",
+        f"dzdp_daemon_queue_depth {stats['queue_depth']}",
+        "# HELP dzdp_daemon_in_flight Ranking folders being analysed.",
+        "# TYPE dzdp_daemon_in_flight gauge",
+        f"dzdp_daemon_in_flight {stats['in_flight']}",
+        "# HELP dzdp_daemon_jobs Session jobs by status.",
+        "# TYPE dzdp_daemon_jobs gauge",
+    ]
+    for status, count in sorted(stats["jobs"].items()):
+        lines.append(f'dzdp_daemon_jobs{{status="{status}"}} {count}')
+    lines += [
+        "# HELP dzdp_daemon_folders_total Ranking folders analysed since start.",
+        "# TYPE dzdp_daemon_folders_total counter",
+        f'dzdp_daemon_folders_total{{status="ok"}} {stats["folders_done"]}',
+        f'dzdp_daemon_folders_total{{status="error"}} {stats["folders_failed"]}',
+    ]
+    return "\n".join(lines) + "\n" + Metrics.format_prometheus(stats["latency"], session="daemon")
+
+class Spool:
+    """任务目录：采集机器写入*.json任务文件（先写临时文件再改名），服务改名到processing/<主机-进程号>/认领，完成后移到done/
+
+    任务文件内容: {"session": 会话文件夹, "host": 采集机器（可选）, "follow": 是否跟随采集（可选）}
+    每个服务在自己的认领目录中定期刷新心跳文件；心跳超过spool_lease_timeout秒没有刷新（服务崩溃）或已被删除（服务正常退出）时，
+    其他服务把该目录中未完成的任务改名到自己的认领目录重新分析
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.processing_dir = os.path.join(path, "processing")
+        self.done_dir = os.path.join(path, "done")
+        self.owner = f"{socket.gethostname()}-{os.getpid()}"
+        self.owner_dir = os.path.join(self.processing_dir, self.owner)
+        for directory in (path, self.processing_dir, self.done_dir):
+            os.makedirs(directory, exist_ok=True)
+        self.heartbeat()
+
+    def heartbeat(self):
+        # 服务卡顿超过租约时认领目录可能已被其他服务收回删除，这里重新创建
+        os.makedirs(self.owner_dir, exist_ok=True)
+        with open(os.path.join(self.owner_dir, heartbeat_file_name), 'w', encoding='utf-8') as f:
+            f.write(datetime.now().isoformat(timespec="seconds"))
+
+    def release(self):
+        """服务退出时删除心跳文件，未完成的任务立即交给其他服务"""
+        try:
+            os.remove(os.path.join(self.owner_dir, heartbeat_file_name))
+        except OSError:
+            pass
+
+    def stale_dirs(self):
+        """心跳已过期的其他服务的认领目录；processing/本身可能残留旧版本直接放在其中的任务文件，也一并收回"""
+        stale = [self.processing_dir]
+        now = time.time()
+        for name in sorted(os.listdir(self.processing_dir)):
+            directory = os.path.join(self.processing_dir, name)
+            if name == self.owner or not os.path.isdir(directory):
+                continue
+            try:
+                alive = now - os.path.getmtime(os.path.join(directory, heartbeat_file_name)) < spool_lease_timeout
+            except OSError:
+                alive = False
+            if not alive:
+                stale.append(directory)
+        return stale
+
+    def take(self, directory, name):
+        """把任务文件改名到自己的认领目录；改名是原子操作，多个服务同时认领时只有一个能成功"""
+        try:
+            os.replace(os.path.join(directory, name), os.path.join(self.owner_dir, name))
+        except OSError:
+            return False
+        return True
+
+    def claim(self):
+        """刷新心跳，认领新的任务文件和心跳过期的服务未完成的任务，返回[(文件名, 任务内容)]"""
+        self.heartbeat()
+        claimed = []
+        for directory in self.stale_dirs():
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".json") and self.take(directory, name):
+                    print(f"收回未完成的任务 {name}（{os.path.basename(directory)}）")
+                    claimed.append(name)
+            if directory != self.processing_dir:
+                try:
+                    os.remove(os.path.join(directory, heartbeat_file_name))
+                except OSError:
+                    pass
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(".json") and self.take(self.path, name):
+                claimed.append(name)
+
+        jobs = []
+        for name in claimed:
+            try:
+                with open(os.path.join(self.owner_dir, name), 'r', encoding='utf-8') as f:
+                    jobs.append((name, json.load(f)))
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"无法读取任务文件 {name}: {e}")
+                self.complete(name, {"status": "failed", "error": str(e)})
+        return jobs
+
+    def complete(self, name, result):
+        """把任务结果写入done/并删除认领目录中的任务文件"""
+        with open(os.path.join(self.done_dir, name), 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=4)
+        processing_path = os.path.join(self.owner_dir, name)
+        if os.path.exists(processing_path):
+            os.remove(processing_path)
+
+def write_spool_job(spool_path, session_dir, host=None, follow=False):
+    """向任务目录提交一个会话，返回任务文件路径"""
+    os.makedirs(spool_path, exist_ok=True)
+    name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{os.path.basename(os.path.normpath(session_dir))}.json"
+    path = os.path.join(spool_path, name)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump({"session": os.path.abspath(session_dir), "host": host, "follow": follow}, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return path
+
+class AnalysisService:
+    """常驻分析服务：模型、响应缓存和结果库只初始化一次，所有会话共用全局并发和限速"""
+
+    def __init__(self, concurrency, spool_path=None):
+        self.concurrency = concurrency
+        self.scheduler = Scheduler(on_job_finished=self.job_finished)
+        self.spool = Spool(spool_path) if spool_path else None
+        self.workers = []
+        self.stop_event = threading.Event()
+
+    def start(self):
+        for index in range(self.concurrency):
+            worker = threading.Thread(target=self.worker, name=f"analyze-{index + 1}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        if self.spool is not None:
+            self.poll_spool()
+
+    def worker(self):
+        import Analyzer
+
+        while True:
+            task = self.scheduler.next_task()
+            if task is None:
+                return
+            job, ranking_type, folder_path, queued_at = task
+            started = time.time()
+            success = True
+            try:
+                results = Analyzer.process_folder(folder_path)
+                Analyzer.save_results(results, job.output_folder, ranking_type)
+                success = bool(results)
+            except Exception as e:
+                print(f"[任务{job.id}] 处理文件夹 {folder_path} 时出错: {e}")
+                success = False
+            self.scheduler.task_done(job, started - queued_at, time.time() - started, success)
+
+    def submit(self, session_dir, host=None, follow=False, source="http", spool_name=None):
+        import Analyzer
+
+        if not os.path.isdir(session_dir):
+            raise ValueError(f"会话文件夹不存在: {session_dir}")
+        output_folder = Analyzer.prepare_output_folder(session_dir)
+        return self.scheduler.submit(session_dir, output_folder, host, follow, source, spool_name)
+
+    def job_finished(self, job):
+        import Analyzer
+
+        flagged = None
+        if Analyzer.validate_enabled:
+            flagged = Analyzer.save_rank_report(job.output_folder, job.folder_paths)
+            with Analyzer.rank_reports_lock:
+                for folder_path in job.folder_paths:
+                    Analyzer.rank_reports.pop(folder_path, None)
+        summary = job.summary()
+        summary["flagged"] = flagged
+        print(f"[任务{job.id}] 完成: {job.done} 个文件夹成功，{job.failed} 个失败，用时 {summary['seconds']:.1f} 秒")
+        if job.spool_name and self.spool is not None:
+            self.spool.complete(job.spool_name, summary)
+
+    def poll_spool(self):
+        for name, data in self.spool.claim():
+            try:
+                self.submit(data["session"], data.get("host"), bool(data.get("follow")), "spool", name)
+            except (KeyError, ValueError) as e:
+                print(f"任务文件 {name} 无效: {e}")
+                self.spool.complete(name, {"status": "failed", "error": str(e)})
+
+    def run(self):
+        """扫描任务目录并刷新跟随中的会话，直到stop"""
+        while not self.stop_event.wait(poll_interval):
+            if self.spool is not None:
+                self.poll_spool()
+            self.scheduler.refresh_following()
+
+    def stop(self):
+        self.stop_event.set()
+        self.scheduler.stop()
+        for worker in self.workers:
+            worker.join()
+        if self.spool is not None:
+            self.spool.release()
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        """本地HTTP接口：POST /jobs提交会话，GET /jobs、/jobs/<id>、/stats、/metrics查询"""
+
+        def send_json(self, status, data):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path != "/jobs":
+                self.send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                data = json.loads(self.rfile.read(length) or b"{}")
+                job = service.submit(data["session"], data.get("host"), bool(data.get("follow")))
+            except (KeyError, ValueError) as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            self.send_json(201, job.summary())
+
+        def do_GET(self):
+            scheduler = service.scheduler
+            if self.path == "/stats":
+                self.send_json(200, scheduler.stats())
+            elif self.path == "/metrics":
+                body = format_prometheus(scheduler.stats()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif self.path == "/jobs":
+                with scheduler.condition:
+                    jobs = [job.summary() for job in scheduler.jobs.values()]
+                self.send_json(200, jobs)
+            elif self.path.startswith("/jobs/"):
+                job = scheduler.jobs.get(self.path[len("/jobs/"):])
+                if job is None:
+                    self.send_json(404, {"error": "not found"})
+                else:
+                    self.send_json(200, job.summary())
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def print_stats(stats):
+    latency = stats["latency"]
+    print(f"队列 {stats['queue_depth']} 个文件夹，分析中 {stats['in_flight']} 个，"
+          f"已完成 {stats['folders_done']} 个（失败 {stats['folders_failed']} 个），"
+          f"{stats['folders_per_minute']:.1f} 个/分钟")
+    for stage, s in latency.items():
+        print(f"  {stage}: p50 {s['p50']:.2f} 秒，p95 {s['p95']:.2f} 秒（{s['count']} 个样本）")
+    if stats.get("models"):
+        import Analyzer
+        Analyzer.print_model_report(stats["models"])
+
+def serve(args):
+    import Analyzer
+
+    # 模型、缓存和结果库只初始化一次，之后的会话不再有启动开销
+    Analyzer.init_model(args.check_connection)
+    if args.concurrency is None:
+        args.concurrency = Analyzer.max_concurrency
+    if args.rpm is not None and args.rpm != Analyzer.requests_per_minute:
+        Analyzer.requests_per_minute = args.rpm
+        Analyzer.rate_limiter = Analyzer.TokenBucket(args.rpm)
+    Analyzer.stream_enabled = args.stream
+    Analyzer.validate_enabled = not args.no_validate
+    Analyzer.cascade_enabled = args.cascade
+    if args.escalation_threshold is not None:
+        Analyzer.escalation_threshold = args.escalation_threshold
+    if not args.no_cache:
+        Analyzer.enable_cache()
+    if not args.no_store:
+        Analyzer.enable_store()
+
+    service = AnalysisService(args.concurrency, None if args.no_spool else args.spool)
+    service.start()
+    server = None
+    if args.port:
+        server = ThreadingHTTPServer(("127.0.0.1" if not args.public else "0.0.0.0", args.port), make_handler(service))
+        threading.Thread(target=server.serve_forever, name="daemon-http", daemon=True).start()
+        print(f"HTTP接口: http://{server.server_address[0]}:{server.server_address[1]}/jobs")
+    if service.spool is not None:
+        print(f"任务目录: {os.path.abspath(service.spool.path)}")
+    print(f"并发数: {args.concurrency}，限速: 每分钟 {Analyzer.requests_per_minute} 次请求，按Ctrl+C停止")
+
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        print("\n正在停止，等待分析中的文件夹完成...")
+    finally:
+        if server is not None:
+            server.shutdown()
+        service.stop()
+        print_stats(service.scheduler.stats())
+
+def submit(args):
+    if args.url:
+        body = json.dumps({"session": os.path.abspath(args.session), "host": args.host, "follow": args.follow},
+                          ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(args.url.rstrip("/") + "/jobs", data=body,
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            job = json.loads(response.read())
+        print(f"已提交，任务编号 {job['id']}")
+    else:
+        print(f"已写入任务文件: {write_spool_job(args.spool, args.session, args.host, args.follow)}")
+
+def show_stats(args):
+    with urllib.request.urlopen(args.url.rstrip("/") + "/stats") as response:
+        print_stats(json.loads(response.read()))
+
+def main(argv=None):
+    # 分析相关参数的默认值在serve中从Analyzer读取，submit和stats在采集机器上运行，不加载Analyzer
+    parser = argparse.ArgumentParser(description="常驻分析服务：接收多台采集机器提交的会话，共用模型和并发")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="启动服务")
+    serve_parser.add_argument("--spool", default=spool_dir, help=f"任务目录 (默认 {spool_dir})")
+    serve_parser.add_argument("--no-spool", action="store_true", help="只通过HTTP接口接收任务")
+    serve_parser.add_argument("--port", type=int, default=default_port, help=f"HTTP接口端口，0表示不启动 (默认 {default_port})")
+    serve_parser.add_argument("--public", action="store_true", help="HTTP接口监听所有网卡（默认只监听本机）")
+    serve_parser.add_argument("--concurrency", type=int, help="所有会话共用的并发数 (默认 Analyzer.max_concurrency)")
+    serve_parser.add_argument("--rpm", type=int, help="每分钟最多请求数 (默认 Analyzer.requests_per_minute)")
+    serve_parser.add_argument("--stream", action="store_true", help="使用流式响应")
+    serve_parser.add_argument("--no-cache", action="store_true", help="不使用本地响应缓存")
+    serve_parser.add_argument("--no-store", action="store_true", help="只保存JSON文件，不写入本地结果库")
+    serve_parser.add_argument("--cascade", action="store_true", help="模型级联：先用最便宜的模型，得分低于阈值时升级")
+    serve_parser.add_argument("--escalation-threshold", type=float,
+                              help="级联模式下升级模型的得分阈值 (默认 Analyzer.escalation_threshold)")
+    serve_parser.add_argument("--no-validate", action="store_true", help="不校验排名连续性")
+    serve_parser.add_argument("--check-connection", action="store_true", help="启动时调用list_models测试连接")
+    serve_parser.set_defaults(func=serve)
+
+    submit_parser = subparsers.add_parser("submit", help="提交一个会话")
+    submit_parser.add_argument("session", help="会话文件夹（服务所在机器可以访问的路径）")
+    submit_parser.add_argument("--url", help="服务的HTTP地址，如http://127.0.0.1:8765（默认写入任务目录）")
+    submit_parser.add_argument("--spool", default=spool_dir, help=f"任务目录 (默认 {spool_dir})")
+    submit_parser.add_argument("--host", help="采集机器名称，显示在任务信息中")
+    submit_parser.add_argument("--follow", action="store_true", help="会话仍在采集，每个榜单完成后再分析")
+    submit_parser.set_defaults(func=submit)
+
+    stats_parser = subparsers.add_parser("stats", help="查看队列深度和延迟统计")
+    stats_parser.add_argument("--url", default=f"http://127.0.0.1:{default_port}", help="服务的HTTP地址")
+    stats_parser.set_defaults(func=show_stats)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import io
+import time
+import shlex
+import struct
+import platform
+import threading
+import subprocess
+from PIL import Image
+
+import Config
+
+class AdbError(RuntimeError):
+    """adb命令执行失败"""
+
+class DesktopDriver:
+    """通过pyautogui操作桌面上的模拟器窗口（需要前台窗口和鼠标，运行时不能操作鼠标键盘）"""
+
+    name = "desktop"
+
+    def click(self, position):
+        import pyautogui
+        pyautogui.click(position[0], position[1])
+
+    def input_text(self, text):
+        """把文本复制到剪贴板并粘贴"""
+        import pyautogui
+        import pyperclip
+
+        pyperclip.copy(text)
+        time.sleep(0.5)
+        # 根据操作系统选择不同的粘贴热键
+        if platform.system() == "Darwin":  # macOS
+            pyautogui.hotkey('command', 'v')
+        else:  # Windows/Linux
+            pyautogui.hotkey('ctrl', 'v')
+
+    def scroll_down(self):
+        """滚轮下滑4次，每次500距离"""
+        import pyautogui
+
+        # 先将鼠标移动到模拟器中心
+        center = Config.get_simulator_center()
+        pyautogui.moveTo(center[0], center[1])
+        time.sleep(Config.scroll_tick_pause)  # 给一点时间让鼠标到位
+        for _ in range(4):
+            pyautogui.scroll(-500)  # 负值表示向下滚动
+            time.sleep(Config.scroll_tick_pause)  # 短暂停顿避免过快滚动
+
+    def screenshot(self, bbox=None):
+        """截取模拟器窗口（或bbox指定的屏幕区域）"""
+        from PIL import ImageGrab
+        from ScreenWait import simulator_bbox
+
+        return ImageGrab.grab(bbox=bbox or simulator_bbox())
+
+    def latest_screenshot(self, bbox=None):
+        """桌面截图很快，而且画面可能在没有操作时变化，总是重新截取"""
+        return self.screenshot(bbox)
+
+def decode_screencap(data):
+    """解析screencap的原始输出：宽、高、像素格式（Android 9起还有色彩空间）各4字节，之后是RGBA像素"""
+    if len(data) < 12:
+        raise AdbError(f"screencap输出不完整: {len(data)} 字节")
+    width, height, _ = struct.unpack_from("<III", data)
+    header = len(data) - width * height * 4
+    if header not in (12, 16):
+        raise AdbError(f"无法解析screencap输出: {width}x{height}，{len(data)} 字节")
+    image = Image.frombuffer("RGBA", (width, height), memoryview(data)[header:], "raw", "RGBA", 0, 1)
+    return image.convert("RGB")
+
+class AdbDriver:
+    """通过adb直接操作Android模拟器：input tap/swipe/text点击和输入，exec-out screencap在内存中截图
+
+    不占用鼠标和前台窗口，多个设备可以同时采集。Config.positions中的坐标按模拟器窗口区域
+    换算为设备像素，桌面定位得到的坐标可以直接使用；也可以把simulator_top_left设为(0, 0)、
+    simulator_bottom_right设为设备分辨率，直接填写设备像素坐标
+    """
+
+    name = "adb"
+
+    def __init__(self, serial=None, adb_path=None):
+        self.serial = serial
+        self.adb_path = adb_path or Config.adb_path
+        self.screen_size = None
+        self.last_screenshot = None  # 上次点击、输入或滑动之后的最近一次截图
+
+    def run(self, *args):
+        """执行adb命令，返回标准输出的字节"""
+        command = [self.adb_path] + (["-s", self.serial] if self.serial else []) + list(args)
+        try:
+            result = subprocess.run(command, capture_output=True, timeout=Config.adb_timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise AdbError(f"adb命令失败 ({' '.join(args)}): {e}") from e
+        if result.returncode != 0:
+            message = result.stderr.decode("utf-8", "replace").strip() or f"返回码 {result.returncode}"
+            raise AdbError(f"adb命令失败 ({' '.join(args)}): {message}")
+        return result.stdout
+
+    def shell(self, *args):
+        """在设备上执行命令（adb shell会把参数拼接后交给设备上的sh，因此逐个转义）"""
+        return self.run("shell", " ".join(shlex.quote(str(arg)) for arg in args))
+
+    def device_size(self):
+        """设备分辨率（优先使用wm size中的Override size）"""
+        if self.screen_size is None:
+            sizes = {}
+            for line in self.shell("wm", "size").decode("utf-8", "replace").splitlines():
+                name, _, value = line.partition(":")
+                if "x" in value:
+                    width, height = value.strip().split("x")
+                    sizes[name.strip()] = (int(width), int(height))
+            if not sizes:
+                raise AdbError("无法获取设备分辨率")
+            self.screen_size = sizes.get("Override size") or sizes.get("Physical size") or next(iter(sizes.values()))
+        return self.screen_size
+
+    def to_device(self, position):
+        """把模拟器窗口坐标换算为设备像素坐标"""
+        left, top = Config.positions["simulator_top_left"]
+        right, bottom = Config.positions["simulator_bottom_right"]
+        width, height = self.device_size()
+        x = (position[0] - left) * width / max(1, right - left)
+        y = (position[1] - top) * height / max(1, bottom - top)
+        return int(round(x)), int(round(y))
+
+    def click(self, position):
+        x, y = self.to_device(position)
+        self.last_screenshot = None
+        self.shell("input", "tap", x, y)
+
+    def input_text(self, text):
+        self.last_screenshot = None
+        if text.isascii():
+            # input text中的空格需要写成%s
+            self.shell("input", "text", text.replace(" ", "%s"))
+        else:
+            # input text不支持中文，需要在模拟器中安装并启用ADBKeyBoard输入法
+            self.shell("am", "broadcast", "-a", "ADB_INPUT_TEXT", "--es", "msg", text)
+
+    def scroll_down(self):
+        """从屏幕中部向上滑动，滑动距离和时长见Config.adb_swipe_*"""
+        width, height = self.device_size()
+        distance = height * Config.adb_swipe_distance
+        x = width // 2
+        start_y = int(height / 2 + distance / 2)
+        end_y = int(height / 2 - distance / 2)
+        self.last_screenshot = None
+        self.shell("input", "swipe", x, start_y, x, end_y, Config.adb_swipe_duration)
+
+    def screenshot(self, bbox=None):
+        """截取整个设备屏幕，在内存中解码（bbox只对桌面驱动有意义，这里忽略）"""
+        if Config.adb_screencap_format == "png":
+            image = Image.open(io.BytesIO(self.run("exec-out", "screencap", "-p")))
+            image.load()
+            image = image.convert("RGB")
+        else:
+            image = decode_screencap(self.run("exec-out", "screencap"))
+            if self.screen_size is None:
+                self.screen_size = image.size
+        self.last_screenshot = image
+        return image
+
+    def latest_screenshot(self, bbox=None):
+        """上次操作之后已经截过图（例如等待界面稳定时的最后一帧）时直接复用，省去一次screencap"""
+        if self.last_screenshot is None:
+            return self.screenshot(bbox)
+        return self.last_screenshot
+
+# 当前进程使用的驱动，按Config.driver和Config.adb_serial创建
+current_driver = None
+current_key = None
+driver_lock = threading.Lock()
+
+def get_driver():
+    """返回与当前配置对应的驱动（配置变化时重新创建）"""
+    global current_driver, current_key
+    key = (Config.driver, Config.adb_serial, Config.adb_path)
+    with driver_lock:
+        if current_driver is None or current_key != key:
+            if Config.driver == "desktop":
+                current_driver = DesktopDriver()
+            elif Config.driver == "adb":
+                current_driver = AdbDriver(Config.adb_serial, Config.adb_path)
+            else:
+                raise ValueError(f"未知的设备驱动: {Config.driver}（可选 desktop、adb）")
+            current_key = key
+        return current_driver
@@ -0,0 +1,493 @@
+import os
+import sys
+import re
+import json
+import time
+import types
+import shlex
+import random
+import struct
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from PIL import Image
+
+from FrameLoader import frame_index
+
+class ReplayScreen:
+    """按顺序回放录制的画面帧，回放结束后一直停留在最后一帧
+
+    可作为ScreenWait.wait_until_stable的grab参数，在没有模拟器的环境下测试等待逻辑
+    """
+
+    def __init__(self, frames):
+        if not frames:
+            raise ValueError("至少需要一帧画面")
+        self.frames = [np.asarray(frame, dtype=np.int16) for frame in frames]
+        self.index = 0
+        self.grab_count = 0
+
+    @classmethod
+    def from_folder(cls, folder_path, downsample=4):
+        """从截图文件夹加载录制帧（按帧序号排序），缩小为灰度数组"""
+        image_files = [f for f in os.listdir(folder_path) if f.endswith('.png') or f.endswith('.jpg')]
+        image_files.sort(key=frame_index)
+        frames = []
+        for image_file in image_files:
+            with Image.open(os.path.join(folder_path, image_file)) as image:
+                frames.append(np.asarray(image.convert("L").reduce(downsample)))
+        return cls(frames)
+
+    def __call__(self):
+        frame = self.frames[min(self.index, len(self.frames) - 1)]
+        self.index += 1
+        self.grab_count += 1
+        return frame
+
+class FakeDevice:
+    """模拟器替身：根据点击的坐标切换榜单，根据滚轮距离翻到下一帧，截屏时返回当前帧
+
+    frames为{"主榜单": [帧...], "细分榜单1": [...], ...}，帧为PIL图片。
+    到达列表末尾后继续下滑时停留在最后一帧，与真实列表到底时的表现一致
+    """
+
+    scroll_per_frame = 2000  # 每次scroll_down共滚动4 × 500
+
+    def __init__(self, frames, positions):
+        self.frames = frames
+        self.positions = positions
+        self.home = next(iter(frames.values()))[0].point(lambda value: 255 - value)
+        self.ranking = None
+        self.scrolled = 0
+        self.lock = threading.Lock()
+        self.clicks = 0
+        self.grabs = 0
+
+    @classmethod
+    def synthetic(cls, positions, main_frames=12, category_frames=4, categories=19, seed=0):
+        """生成与模拟器窗口同样大小的随机色块帧，相邻帧的感知哈希差异足够大"""
+        left, top = positions["simulator_top_left"]
+        right, bottom = positions["simulator_bottom_right"]
+        width, height = right - left, bottom - top
+        rng = np.random.default_rng(seed)
+
+        def make_frames(count):
+            frames = []
+            for _ in range(count):
+                blocks = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+                image = Image.fromarray(blocks).resize((blocks.shape[1] * 16, blocks.shape[0] * 16), Image.NEAREST)
+                frames.append(image.crop((0, 0, width, height)))
+            return frames
+
+        frames = {"主榜单": make_frames(main_frames)}
+        for index in range(categories):
+            frames[f"细分榜单{index + 1}"] = make_frames(category_frames)
+        return cls(frames, positions)
+
+    @classmethod
+    def from_session(cls, session_dir, positions):
+        """回放录制的截图会话（主榜单和细分榜单1-19文件夹）"""
+        frames = {}
+        for ranking in ["主榜单"] + [f"细分榜单{index + 1}" for index in range(19)]:
+            folder_path = os.path.join(session_dir, ranking)
+            if not os.path.isdir(folder_path):
+                raise ValueError(f"录制会话中缺少榜单文件夹: {folder_path}")
+            image_files = sorted((f for f in os.listdir(folder_path) if f.endswith('.png') or f.endswith('.jpg')),
+                                 key=frame_index)
+            if not image_files:
+                raise ValueError(f"榜单文件夹中没有截图: {folder_path}")
+            frames[ranking] = []
+            for image_file in image_files:
+                with Image.open(os.path.join(folder_path, image_file)) as image:
+                    frames[ranking].append(image.convert("RGB"))
+        return cls(frames, positions)
+
+    def click(self, x=None, y=None, *args, **kwargs):
+        with self.lock:
+            self.clicks += 1
+            position = (x, y)
+            if position == tuple(self.positions["food_ranking_button"]):
+                self.ranking, self.scrolled = "主榜单", 0
+            elif position in [tuple(p) for p in self.positions["categories"]]:
+                index = [tuple(p) for p in self.positions["categories"]].index(position)
+                self.ranking, self.scrolled = f"细分榜单{index + 1}", 0
+
+    def scroll(self, clicks, *args, **kwargs):
+        with self.lock:
+            self.scrolled += -clicks
+
+    def grab(self, bbox=None, *args, **kwargs):
+        with self.lock:
+            self.grabs += 1
+            if self.ranking is None:
+                return self.home.copy()
+            frames = self.frames[self.ranking]
+            return frames[min(self.scrolled // self.scroll_per_frame, len(frames) - 1)].copy()
+
+def install_fake_gui(device):
+    """用FakeDevice替换pyautogui、pyperclip和PIL.ImageGrab，使Search可以在没有模拟器和桌面的环境下运行"""
+    import PIL
+
+    gui = types.ModuleType("pyautogui")
+    gui.click = device.click
+    gui.scroll = device.scroll
+    gui.moveTo = lambda *args, **kwargs: None
+    gui.hotkey = lambda *args, **kwargs: None
+    gui.position = lambda: (0, 0)
+
+    clipboard = types.ModuleType("pyperclip")
+    clipboard.copy = lambda text: None
+
+    image_grab = types.ModuleType("PIL.ImageGrab")
+    image_grab.grab = device.grab
+
+    sys.modules["pyautogui"] = gui
+    sys.modules["pyperclip"] = clipboard
+    sys.modules["PIL.ImageGrab"] = image_grab
+    PIL.ImageGrab = image_grab
+
+def screencap_bytes(image):
+    """把图片编码为adb exec-out screencap的原始输出（16字节头 + RGBA像素）"""
+    image = image.convert("RGBA")
+    return struct.pack("<IIII", image.width, image.height, 1, 0) + image.tobytes()
+
+def write_fake_adb(directory, device):
+    """把FakeDevice写成一个假的adb可执行文件，返回其路径
+
+    帧预先保存为screencap原始输出，点击坐标换算为设备像素（帧与模拟器窗口同样大小）。
+    每个设备序列号的状态（当前榜单、下滑次数、命令计数）保存在state_<序列号>.json中
+    """
+    frames_dir = os.path.join(directory, "frames")
+    os.makedirs(frames_dir, exist_ok=True)
+    left, top = device.positions["simulator_top_left"]
+
+    def to_device(position):
+        return [position[0] - left, position[1] - top]
+
+    with open(os.path.join(frames_dir, "home.raw"), 'wb') as f:
+        f.write(screencap_bytes(device.home))
+    for ranking, frames in device.frames.items():
+        for index, frame in enumerate(frames):
+            with open(os.path.join(frames_dir, f"{ranking}_{index}.raw"), 'wb') as f:
+                f.write(screencap_bytes(frame))
+
+    spec = {
+        "size": list(device.home.size),
+        "rankings": {ranking: len(frames) for ranking, frames in device.frames.items()},
+        "food_ranking_button": to_device(device.positions["food_ranking_button"]),
+        "categories": [to_device(p) for p in device.positions["categories"]],
+    }
+    with open(os.path.join(directory, "device.json"), 'w', encoding='utf-8') as f:
+        json.dump(spec, f, ensure_ascii=False)
+
+    fakes_path = os.path.abspath(__file__)
+    if os.name == "nt":
+        path = os.path.join(directory, "adb.bat")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f'@"{sys.executable}" "{fakes_path}" adb "{directory}" %*\n')
+    else:
+        path = os.path.join(directory, "adb")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{fakes_path}" adb "{directory}" "$@"\n')
+        os.chmod(path, 0o755)
+    return path
+
+def fake_adb_main(directory, args):
+    """假adb的入口：支持devices、shell（wm size、input tap/swipe/text、am broadcast）和exec-out screencap"""
+    with open(os.path.join(directory, "device.json"), 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+
+    serial = "emulator-5554"
+    if args[:1] == ["-s"]:
+        serial, args = args[1], args[2:]
+    if args == ["devices"]:
+        print(f"List of devices attached\n{serial}\tdevice\n")
+        return 0
+
+    state_path = os.path.join(directory, f"state_{serial}.json")
+    state = {"ranking": None, "scrolled": 0, "taps": 0, "swipes": 0, "screencaps": 0, "texts": []}
+    if os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+    if args[:2] == ["exec-out", "screencap"]:
+        state["screencaps"] += 1
+        if state["ranking"] is None:
+            frame_name = "home"
+        else:
+            frame_name = f"{state['ranking']}_{min(state['scrolled'], spec['rankings'][state['ranking']] - 1)}"
+        with open(os.path.join(directory, "frames", f"{frame_name}.raw"), 'rb') as f:
+            data = f.read()
+        if "-p" in args[2:]:
+            # 设备上编码PNG（只用于测试png格式）
+            import io
+            width, height = struct.unpack_from("<II", data)
+            buffer = io.BytesIO()
+            Image.frombuffer("RGBA", (width, height), data[16:], "raw", "RGBA", 0, 1).save(buffer, format="PNG")
+            data = buffer.getvalue()
+        sys.stdout.buffer.write(data)
+    elif args[:1] == ["shell"]:
+        command = shlex.split(" ".join(args[1:]))
+        if command == ["wm", "size"]:
+            print(f"Physical size: {spec['size'][0]}x{spec['size'][1]}")
+        elif command[:2] == ["input", "tap"]:
+            state["taps"] += 1
+            position = [int(command[2]), int(command[3])]
+            if position == spec["food_ranking_button"]:
+                state["ranking"], state["scrolled"] = "主榜单", 0
+            elif position in spec["categories"]:
+                state["ranking"], state["scrolled"] = f"细分榜单{spec['categories'].index(position) + 1}", 0
+        elif command[:2] == ["input", "swipe"]:
+            state["swipes"] += 1
+            if int(command[3]) > int(command[5]):  # 向上滑动，列表下滑
+                state["scrolled"] += 1
+        elif command[:2] == ["input", "text"]:
+            state["texts"].append(command[2].replace("%s", " "))
+        elif command[:4] == ["am", "broadcast", "-a", "ADB_INPUT_TEXT"]:
+            state["texts"].append(command[command.index("--es") + 2])
+        else:
+            print(f"/system/bin/sh: {command[0] if command else ''}: not found", file=sys.stderr)
+            return 127
+    else:
+        print(f"adb: unknown command {' '.join(args)}", file=sys.stderr)
+        return 1
+
+    temp_path = state_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(temp_path, state_path)
+    return 0
+
+class FakeAPIError(Exception):
+    """模拟API错误，消息以HTTP状态码开头，与Gemini SDK的异常格式一致"""
+
+class FakeGemini:
+    """GenerativeModel替身：按请求中的图片数返回固定格式的JSON
+
+    latency为每个请求的平均延迟秒数（上下浮动jitter），error_rate为随机返回503的比例。
+    流式请求（stream=True）在latency的first_chunk_ratio之后返回第一个片段，其余片段在剩余时间内均匀到达，
+    truncate_rate为流式响应在中途断开的比例，drop_rate为每条记录被漏掉的比例（用于测试排名校验），
+    field_error_rate为每条记录缺少品牌或价格识别成字符串的比例（用于测试模型级联）。
+    补全请求（提示词要求只返回部分排名）只返回所要求的排名。
+    榜单名称由第一张图片的内容决定，同一个文件夹每次得到相同的结果
+    """
+
+    first_chunk_ratio = 0.2
+
+    def __init__(self, latency=0.5, jitter=0.0, error_rate=0.0, records_per_image=3, seed=None,
+                 chunk_size=64, truncate_rate=0.0, drop_rate=0.0, field_error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.records_per_image = records_per_image
+        self.chunk_size = chunk_size
+        self.truncate_rate = truncate_rate
+        self.drop_rate = drop_rate
+        self.field_error_rate = field_error_rate
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.error_count = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, content_parts, stream=False):
+        with self.lock:
+            self.request_count += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            failed = self.random.random() < self.error_rate
+            truncated = stream and self.random.random() < self.truncate_rate
+            if failed:
+                self.error_count += 1
+
+        if not stream:
+            time.sleep(delay)
+            if failed:
+                raise FakeAPIError("503 Service Unavailable")
+            return types.SimpleNamespace(text=self.response_text(content_parts))
+
+        time.sleep(delay * self.first_chunk_ratio)
+        if failed:
+            raise FakeAPIError("503 Service Unavailable")
+        return self.stream_chunks(self.response_text(content_parts), delay * (1 - self.first_chunk_ratio), truncated)
+
+    def stream_chunks(self, text, duration, truncated):
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        interval = duration / len(pieces)
+        for index, piece in enumerate(pieces):
+            if truncated and index >= len(pieces) // 2:
+                raise FakeAPIError("500 Stream interrupted")
+            if index:
+                time.sleep(interval)
+            yield types.SimpleNamespace(text=piece)
+
+    def response_text(self, content_parts):
+        # 打包请求中每组图片前面有"第N组"标记
+        groups = []
+        for part in content_parts[1:]:
+            if isinstance(part, str):
+                groups.append([])
+            elif groups:
+                groups[-1].append(part)
+            else:
+                groups.append([part])
+
+        wanted = self.wanted_ranks(content_parts[0]) if isinstance(content_parts[0], str) else None
+        if wanted is not None:
+            images = groups[0] if groups else []
+            return json.dumps(self.repair_records(images, *wanted), ensure_ascii=False)
+
+        results = [self.drop(self.records_for(images)) for images in groups]
+        if any(isinstance(part, str) for part in content_parts[1:]):
+            return json.dumps({str(index + 1): records for index, records in enumerate(results)}, ensure_ascii=False)
+        return json.dumps(results[0] if results else [], ensure_ascii=False)
+
+    def wanted_ranks(self, prompt):
+        """补全提示词中要求的排名，返回(排名列表, 大于该排名的都要)；普通提示词返回None"""
+        if "只需要返回" not in prompt:
+            return None
+        listed = re.search(r"排名为([\d、]+)", prompt)
+        after = re.search(r"排名大于(\d+)", prompt)
+        ranks = [int(rank) for rank in listed.group(1).split("、")] if listed else []
+        return ranks, int(after.group(1)) if after else None
+
+    def repair_records(self, images, ranks, after):
+        ranking = "榜单" + hashlib.md5(images[0]["data"]).hexdigest()[:6] if images else "榜单"
+        if after is not None:
+            ranks = ranks + list(range(after + 1, after + len(images) * self.records_per_image + 1))
+        return [fake_record(ranking, rank) for rank in ranks]
+
+    def drop(self, records):
+        if not self.drop_rate and not self.field_error_rate:
+            return records
+        kept = []
+        with self.lock:
+            for record in records:
+                if self.random.random() < self.drop_rate:
+                    continue
+                if self.random.random() < self.field_error_rate:
+                    record = dict(record)
+                    if self.random.random() < 0.5:
+                        del record["品牌"]
+                    else:
+                        record["价格"] = f"¥{record['价格']}"
+                kept.append(record)
+        return kept
+
+    def records_for(self, images):
+        if not images:
+            return []
+        ranking = "榜单" + hashlib.md5(images[0]["data"]).hexdigest()[:6]
+        return [fake_record(ranking, rank) for rank in range(1, len(images) * self.records_per_image + 1)]
+
+class FakePostgREST:
+    """本地PostgREST替身：接受Supabase客户端的upsert请求，按主键合并保存在内存中
+
+    latency为每个请求的额外延迟秒数，error_rate为随机返回503的比例，用于测试重试
+    """
+
+    def __init__(self, key_fields=("城市", "榜单", "品牌"), latency=0.0, error_rate=0.0, seed=None):
+        self.key_fields = key_fields
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.tables = {}
+        self.request_count = 0
+        self.error_count = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    def start(self):
+        """在随机端口启动服务，返回可传给create_client的URL"""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, body=None):
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status, response = fake.handle_upsert(self.path, json.loads(body or b"[]"), self.headers.get("Prefer", ""))
+                self.send_json(status, response)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def handle_upsert(self, path, rows, prefer):
+        if self.latency:
+            time.sleep(self.latency)
+
+        table = path.split("?")[0].rstrip("/").split("/")[-1]
+        rows = rows if isinstance(rows, list) else [rows]
+        with self.lock:
+            self.request_count += 1
+            if self.random.random() < self.error_rate:
+                self.error_count += 1
+                return 503, {"message": "Service Unavailable", "code": "503", "hint": None, "details": None}
+
+            keys = [tuple(row.get(field) for field in self.key_fields) for row in rows]
+            if len(set(keys)) != len(keys):
+                # 与PostgreSQL一致：同一条upsert语句不能两次更新同一行
+                return 500, {"message": "ON CONFLICT DO UPDATE command cannot affect row a second time",
+                             "code": "21000", "hint": None, "details": None}
+
+            stored = self.tables.setdefault(table, {})
+            for key, row in zip(keys, rows):
+                stored[key] = row
+
+        if "return=representation" in prefer:
+            return 201, rows
+        return 201, None
+
+    def rows(self, table="dzdpdata"):
+        with self.lock:
+            return list(self.tables.get(table, {}).values())
+
+def fake_record(ranking, rank):
+    """生成一条与Gemini输出格式一致的假记录"""
+    return {
+        "榜单": ranking,
+        "排名": rank,
+        "店铺名称": f"{ranking}店{rank}·总店",
+        "品牌": f"{ranking}店{rank}",
+        "评分": round(4.0 + (rank % 10) / 10, 1),
+        "位置": "春熙路",
+        "细分榜单": ranking,
+        "价格": 50 + rank,
+    }
+
+def write_fake_results(root, cities=("成都",), sessions=1, rankings=20, records=50):
+    """在root下生成与Analyzer输出结构相同的假分析结果，返回会话目录列表"""
+    session_dirs = []
+    for city in cities:
+        for session in range(sessions):
+            session_dir = os.path.join(root, f"{city}_20240101_{session:06d}")
+            os.makedirs(session_dir, exist_ok=True)
+            for ranking_index in range(rankings):
+                ranking = "主榜单" if ranking_index == 0 else f"榜单{ranking_index}"
+                data = [fake_record(ranking, rank) for rank in range(1, records + 1)]
+                with open(os.path.join(session_dir, f"{ranking}.json"), 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=4)
+            session_dirs.append(session_dir)
+    return session_dirs
+
+if __name__ == "__main__":
+    # 假adb：python Fakes.py adb <目录> [-s 序列号] 命令...
+    if sys.argv[1:2] == ["adb"]:
+        sys.exit(fake_adb_main(sys.argv[2], sys.argv[3:]))
+    print("用法: python Fakes.py adb <目录> [-s 序列号] 命令...", file=sys.stderr)
+    sys.exit(2)
@@ -0,0 +1,105 @@
+import numpy as np
+from PIL import Image
+
+# 去重配置
+hash_size = 16  # dHash边长，哈希共hash_size*hash_size位
+max_hamming_distance = 8  # 与上一张保留帧的汉明距离不超过该值时视为重复帧
+row_signature_width = 32  # 计算行特征时把每一行压缩成的列数
+row_diff_tolerance = 3.0  # 两行特征平均灰度差小于该值时视为同一行
+min_overlap_rows = 20  # 少于该行数的重叠不裁剪，避免误判
+
+def dhash(image, size=hash_size):
+    """计算图片的差值哈希（dHash），返回长度为size*size的布尔数组"""
+    gray = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+def hamming_distance(hash_a, hash_b):
+    """两个哈希之间不同的位数"""
+    return int(np.count_nonzero(hash_a != hash_b))
+
+def row_signatures(image):
+    """把图片每一行压缩成固定宽度的灰度特征，用于快速比较行是否相同"""
+    gray = image.convert("L")
+    gray = gray.resize((row_signature_width, gray.height), Image.BILINEAR)
+    return np.asarray(gray, dtype=np.float32)
+
+def static_band(prev_rows, curr_rows, from_top=True):
+    """计算两帧在顶部（或底部）位置完全相同的行数，即固定不动的标题栏/底栏高度"""
+    same = np.abs(prev_rows - curr_rows).mean(axis=1) < row_diff_tolerance
+    if not from_top:
+        same = same[::-1]
+    changed = np.flatnonzero(~same)
+    return int(changed[0]) if changed.size else len(same)
+
+def find_overlap(prev_rows, curr_rows):
+    """在滚动区域中寻找上一帧底部与当前帧顶部重合的最大行数，找不到时返回0"""
+    height = min(len(prev_rows), len(curr_rows))
+    for overlap in range(height - 1, min_overlap_rows - 1, -1):
+        diff = np.abs(prev_rows[height - overlap:height] - curr_rows[:overlap]).mean(axis=1)
+        if diff.max() < row_diff_tolerance:
+            return overlap
+    return 0
+
+def crop_overlap(prev_image, curr_image):
+    """裁掉当前帧中与上一帧重合的内容带，保留顶部固定标题栏，返回(新图片, 裁掉的行数)"""
+    if prev_image.size != curr_image.size:
+        return curr_image, 0
+
+    prev_rows = row_signatures(prev_image)
+    curr_rows = row_signatures(curr_image)
+    top = static_band(prev_rows, curr_rows, from_top=True)
+    bottom = static_band(prev_rows, curr_rows, from_top=False)
+    if top + bottom >= len(curr_rows):
+        # 整帧没有变化，交给去重处理
+        return curr_image, 0
+
+    content_end = len(curr_rows) - bottom
+    overlap = find_overlap(prev_rows[top:content_end], curr_rows[top:content_end])
+    if overlap == 0:
+        return curr_image, 0
+
+    width, height = curr_image.size
+    header = curr_image.crop((0, 0, width, top))
+    content = curr_image.crop((0, top + overlap, width, content_end))
+    cropped = Image.new(curr_image.mode, (width, header.height + content.height))
+    cropped.paste(header, (0, 0))
+    cropped.paste(content, (0, header.height))
+    return cropped, overlap
+
+def iter_dedup_frames(indexed_images, max_distance=max_hamming_distance, crop=False):
+    """逐帧剔除与上一张保留帧几乎相同的帧，可选裁掉相邻帧的重叠部分
+
+    indexed_images为(下标, 图片)序列，产出(下标, 输出图片, 裁掉的行数)；
+    只保留上一张保留帧，可以配合逐张解码使用，内存占用与帧数无关
+    """
+    prev_hash = None
+    prev_image = None
+
+    for index, image in indexed_images:
+        frame_hash = dhash(image)
+        if prev_hash is not None and hamming_distance(prev_hash, frame_hash) <= max_distance:
+            print(f"  跳过重复帧: 第{index}张")
+            continue
+
+        output, overlap = image, 0
+        if crop and prev_image is not None:
+            output, overlap = crop_overlap(prev_image, image)
+            if overlap:
+                print(f"  第{index}张裁掉与上一帧重叠的 {overlap} 行")
+
+        yield index, output, overlap
+        prev_hash = frame_hash
+        prev_image = image
+
+def dedup_frames(images, max_distance=max_hamming_distance, crop=False):
+    """按顺序剔除与上一张保留帧几乎相同的帧，可选裁掉相邻帧的重叠部分
+
+    返回(保留的图片列表, 保留帧在原列表中的下标列表)
+    """
+    kept_images = []
+    kept_indices = []
+    for index, output, _ in iter_dedup_frames(enumerate(images), max_distance, crop):
+        kept_images.append(output)
+        kept_indices.append(index)
+    return kept_images, kept_indices
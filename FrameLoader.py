@@ -0,0 +1,71 @@
+import io
+import os
+from PIL import Image
+
+# 文件头和文件尾标记：截图写了一半时文件尾不完整
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_TRAILER = b"IEND\xaeB`\x82"
+JPEG_SIGNATURE = b"\xff\xd8\xff"
+JPEG_TRAILER = b"\xff\xd9"
+
+# 图片格式对应的MIME类型
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg"}
+
+def frame_index(filename):
+    """截图文件名中的帧序号，无法解析时为-1"""
+    stem = filename.split('.')[0]
+    return int(stem) if stem.isdigit() else -1
+
+def list_frame_files(folder_path):
+    """按帧序号返回文件夹中的截图路径"""
+    image_files = [f for f in os.listdir(folder_path) if f.endswith('.png') or f.endswith('.jpg')]
+    image_files.sort(key=frame_index)
+    return [os.path.join(folder_path, f) for f in image_files]
+
+def check_frame_bytes(data):
+    """只检查文件头和文件尾判断截图是否完整，不解码像素，返回图片格式"""
+    if data.startswith(PNG_SIGNATURE):
+        if not data.endswith(PNG_TRAILER):
+            raise ValueError("PNG文件不完整（缺少IEND块）")
+        return "PNG"
+    if data.startswith(JPEG_SIGNATURE):
+        # 部分编码器会在EOI之后补零
+        if not data.rstrip(b"\x00").endswith(JPEG_TRAILER):
+            raise ValueError("JPEG文件不完整（缺少EOI标记）")
+        return "JPEG"
+    raise ValueError("不是PNG或JPEG文件")
+
+def load_frames(folder_path):
+    """读取文件夹中所有截图的原始字节（每个文件只读一次），返回[(路径, 格式, 字节)]
+
+    不完整或无法识别的截图会被跳过；此时内存中只有编码后的字节，不保留解码后的图片
+    """
+    frames = []
+    for image_path in list_frame_files(folder_path):
+        try:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            frames.append((image_path, check_frame_bytes(data), data))
+            print(f"已加载图片: {image_path}")
+        except Exception as e:
+            print(f"加载图片 {image_path} 时出错: {e}")
+    return frames
+
+def decode_frame(data):
+    """把截图字节解码为PIL图片（只解码一次）"""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+def iter_decoded_frames(frames):
+    """按顺序逐张解码截图，产出(下标, PIL图片)；同一时间只有当前这一张被解码
+
+    解码失败的截图打印错误后跳过
+    """
+    for index, (image_path, _, data) in enumerate(frames):
+        try:
+            image = decode_frame(data)
+        except Exception as e:
+            print(f"解码图片 {image_path} 时出错: {e}")
+            continue
+        yield index, image
@@ -0,0 +1,93 @@
+import json
+
+# 每次从文件读取的字符数
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+
+class NotAnArrayError(ValueError):
+    """文件内容的顶层不是JSON数组"""
+
+def iter_json_array(fp, chunk_size=CHUNK_SIZE):
+    """增量解析文件中的顶层JSON数组，逐个产出数组元素
+
+    内存中只保留一个读取块和当前正在解析的元素，与文件大小无关。
+    文件内容不是JSON数组时抛出NotAnArrayError（ValueError的子类）。
+    """
+    return iter_json_array_chunks(iter(lambda: fp.read(chunk_size), ""))
+
+def iter_json_array_chunks(chunks, skip_prefix=False):
+    """增量解析依次到达的文本块中的顶层JSON数组，每个元素一闭合就产出
+
+    chunks可以是任意文本块迭代器（文件读取块、流式响应的片段），块可以在任意位置切分。
+    skip_prefix为True时跳过数组之前的任意文本（如模型响应开头的说明文字和```json标记）。
+    文本在数组结束前中断时，已产出的元素不受影响，之后抛出json.JSONDecodeError。
+    """
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            chunk = ""
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def next_char():
+        """跳过空白，返回下一个非空白字符（文件结束时返回空字符串）"""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            fill()
+
+    if skip_prefix:
+        while True:
+            start = buffer.find("[", pos)
+            if start != -1:
+                pos = start
+                break
+            pos = len(buffer)
+            if eof:
+                break
+            fill()
+
+    if next_char() != "[":
+        raise NotAnArrayError("JSON content is not an array")
+    pos += 1
+    if next_char() == "]":
+        return
+
+    while True:
+        next_char()
+        try:
+            value, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # 元素跨越了读取块，读入更多内容后重新解析
+            fill()
+            continue
+        if not eof and (end == len(buffer) or buffer[end] not in _DELIMITERS):
+            # 数字可能在块尾被截断（如"12"只读到"1"、"1.5"只读到"1."），读入更多内容后重新解析
+            fill()
+            continue
+
+        pos = end
+        yield value
+
+        separator = next_char()
+        if separator == ",":
+            pos += 1
+        elif separator == "]":
+            return
+        else:
+            raise ValueError(f"Unexpected character in JSON array: {separator!r}")
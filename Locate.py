@@ -1,6 +1,6 @@
-import pyautogui
 import time
 import os
+import argparse
 import importlib
 import sys
 
@@ -14,14 +14,56 @@ import Config
 
 def get_position(prompt):
     """让用户通过鼠标点击获取位置"""
+    import pyautogui
+
     print(f"{prompt}，请将鼠标移动到该位置并按下回车键...")
     input()  # 等待用户按回车
     x, y = pyautogui.position()
     print(f"位置已记录: ({x}, {y})")
     return (x, y)
 
-def main():
+def save_templates():
+    """在首页截取整屏，保存自动定位使用的按钮模板和参考布局"""
+    from AutoLocate import Templates, grab_desktop
+
+    input("请把模拟器切换到大众点评首页，准备好后按回车保存自动定位模板...")
+    Templates.save(grab_desktop(), Config.positions)
+    print(f"自动定位模板已保存到: {Config.autolocate_template_dir}")
+
+def auto_locate():
+    """用一张整屏截图自动定位全部界面元素，并保存到Config.py"""
+    import AutoLocate
+
+    print("=== 自动定位（模拟器需停留在大众点评首页） ===")
+    started = time.perf_counter()
+    try:
+        positions = AutoLocate.auto_locate(near=Config.positions["simulator_top_left"])
+    except FileNotFoundError as e:
+        print(e)
+        sys.exit(1)
+    if positions is None:
+        print("没有在屏幕上找到模拟器，请确认模拟器停留在首页且没有被遮挡")
+        sys.exit(1)
+
+    print(f"定位完成: {AutoLocate.geometry_key(positions)} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    Config.positions = positions
+    Config.save_config()
+    print("配置已保存到Config.py文件")
+
+def main(argv=None):
     """主定位函数"""
+    parser = argparse.ArgumentParser(description="依次定位模拟器中的界面元素，并保存到Config.py")
+    parser.add_argument("--auto", action="store_true", help="根据已保存的模板自动定位（模拟器需停留在首页）")
+    parser.add_argument("--save-templates", action="store_true", help="用当前坐标在首页截取自动定位模板")
+    args = parser.parse_args(argv)
+
+    if args.auto:
+        auto_locate()
+        return
+    if args.save_templates:
+        save_templates()
+        return
+
     print("=== 大众点评搜索界面定位工具 ===")
     print("请按照提示依次定位各个元素")
     print("定位过程中请勿移动或调整模拟器窗口")
@@ -54,5 +96,10 @@ def main():
     Config.save_config()
     print("配置已保存到Config.py文件")
 
+    # 顺便保存自动定位模板，之后窗口移动时可以用 --auto 重新定位
+    print("\n请关闭细分品类列表，把模拟器切换回首页")
+    save_templates()
+    print("之后模拟器窗口移动时，运行 python Locate.py --auto 即可重新定位")
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
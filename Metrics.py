@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from collections import defaultdict
+
+# 是否记录耗时（默认关闭，由enable开启）
+enabled = False
+
+trace_file_name = "trace.jsonl"
+prometheus_file_name = "metrics.prom"
+
+lock = threading.Lock()
+output_dir = None
+session_name = ""
+trace_file = None
+durations = defaultdict(list)
+
+class NullSpan:
+    """关闭记录时使用的空span，不做任何事"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+null_span = NullSpan()
+
+class Span:
+    """记录一个步骤的耗时，退出时写入跟踪文件"""
+
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.stage, time.perf_counter() - self.started, self.started_at,
+               status="error" if exc_type else "ok", **self.attrs)
+        return False
+
+def span(stage, **attrs):
+    """记录with块的耗时：with Metrics.span("click_position"): ...
+
+    关闭记录时返回共享的空span，几乎没有额外开销
+    """
+    if not enabled:
+        return null_span
+    return Span(stage, attrs)
+
+def record(stage, seconds, started_at=None, **attrs):
+    """记录一个已经测得的耗时"""
+    if not enabled:
+        return
+    entry = {
+        "ts": round(started_at if started_at is not None else time.time() - seconds, 6),
+        "session": session_name,
+        "stage": stage,
+        "seconds": round(seconds, 6),
+        "thread": threading.current_thread().name,
+    }
+    entry.update(attrs)
+    line = json.dumps(entry, ensure_ascii=False)
+    with lock:
+        durations[stage].append(seconds)
+        if trace_file is not None:
+            trace_file.write(line + "\n")
+            trace_file.flush()
+
+def enable(directory, session=None):
+    """开启记录，跟踪文件和Prometheus文本文件写入directory"""
+    global enabled, output_dir, session_name, trace_file
+    with lock:
+        if trace_file is not None:
+            trace_file.close()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        output_dir = directory
+        session_name = session or os.path.basename(os.path.normpath(directory))
+        trace_file = open(os.path.join(directory, trace_file_name), 'a', encoding='utf-8')
+        durations.clear()
+        enabled = True
+
+def percentile(values, q):
+    """最近秩法计算百分位数，values需已排序"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(q * len(values)) - 1))
+    return values[index]
+
+def summarize(stage_durations):
+    """按步骤汇总次数、总耗时、p50、p95和最大值"""
+    result = {}
+    for stage, values in stage_durations.items():
+        values = sorted(values)
+        result[stage] = {
+            "count": len(values),
+            "total": sum(values),
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "max": values[-1] if values else 0.0,
+        }
+    return result
+
+def summary():
+    with lock:
+        return summarize({stage: list(values) for stage, values in durations.items()})
+
+def print_report(stage_summary):
+    """打印各步骤的耗时报告，按总耗时从高到低排序"""
+    print("\n=== 耗时报告 ===")
+    print(f"{'步骤':<28}{'次数':>8}{'总计(秒)':>12}{'p50(秒)':>10}{'p95(秒)':>10}{'最大(秒)':>10}")
+    for stage, s in sorted(stage_summary.items(), key=lambda item: item[1]["total"], reverse=True):
+        print(f"{stage:<28}{s['count']:>8}{s['total']:>12.2f}{s['p50']:>10.3f}{s['p95']:>10.3f}{s['max']:>10.3f}")
+
+def format_prometheus(stage_summary, session=""):
+    """把汇总结果转换为Prometheus文本格式（summary类型）"""
+    lines = [
+        "# HELP dzdp_stage_duration_seconds Duration of instrumented pipeline steps.",
+        "# TYPE dzdp_stage_duration_seconds summary",
+    ]
+    for stage, s in sorted(stage_summary.items()):
+        labels = f'session="{session}",stage="{stage}"'
+        lines.append(f'dzdp_stage_duration_seconds{{{labels},quantile="0.5"}} {s["p50"]:.6f}')
+        lines.append(f'dzdp_stage_duration_seconds{{{labels},quantile="0.95"}} {s["p95"]:.6f}')
+        lines.append(f'dzdp_stage_duration_seconds_sum{{{labels}}} {s["total"]:.6f}')
+        lines.append(f'dzdp_stage_duration_seconds_count{{{labels}}} {s["count"]}')
+    return "\n".join(lines) + "\n"
+
+def close(report=True):
+    """写入Prometheus文本文件、打印报告并停止记录"""
+    global enabled, trace_file
+    if not enabled:
+        return
+    stage_summary = summary()
+    with lock:
+        enabled = False
+        if trace_file is not None:
+            trace_file.close()
+            trace_file = None
+
+    # 先写临时文件再替换，避免采集器读到写了一半的文件
+    prometheus_path = os.path.join(output_dir, prometheus_file_name)
+    with open(prometheus_path + ".tmp", 'w', encoding='utf-8') as f:
+        f.write(format_prometheus(stage_summary, session_name))
+    os.replace(prometheus_path + ".tmp", prometheus_path)
+
+    if report:
+        print_report(stage_summary)
+        print(f"耗时记录已保存到: {os.path.join(output_dir, trace_file_name)}")
+
+def load_traces(paths):
+    """读取一个或多个跟踪文件（或包含trace.jsonl的文件夹），返回{步骤: 耗时列表}"""
+    stage_durations = defaultdict(list)
+    for path in paths:
+        if os.path.isdir(path):
+            path = os.path.join(path, trace_file_name)
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    stage_durations[entry["stage"]].append(entry["seconds"])
+    return stage_durations
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="汇总耗时记录，显示各步骤的p50/p95")
+    parser.add_argument("paths", nargs="+", help="trace.jsonl文件或包含它的会话文件夹（可以指定多个）")
+    args = parser.parse_args(argv)
+
+    try:
+        stage_durations = load_traces(args.paths)
+    except OSError as e:
+        print(f"读取耗时记录失败: {e}")
+        sys.exit(1)
+    print_report(summarize(stage_durations))
+
+if __name__ == "__main__":
+    main()
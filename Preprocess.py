@@ -0,0 +1,71 @@
+import io
+from PIL import Image
+
+import Config
+
+# 编码格式对应的MIME类型
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+def ranking_crop_box(image_size, positions=None, top_margin=None, bottom_margin=None):
+    """根据Config.positions计算截图中榜单区域的裁剪框
+
+    截图以模拟器左上角为原点，Retina屏幕下截图像素会是屏幕坐标的整数倍，
+    因此按截图宽度与模拟器宽度的比例换算。
+    """
+    positions = positions or Config.positions
+    top_margin = Config.preprocess_crop_top_margin if top_margin is None else top_margin
+    bottom_margin = Config.preprocess_crop_bottom_margin if bottom_margin is None else bottom_margin
+
+    left, top = positions["simulator_top_left"]
+    right, _ = positions["simulator_bottom_right"]
+    width, height = image_size
+    scale = width / max(1, right - left)
+
+    crop_top = int((positions["category_dropdown"][1] - top - top_margin) * scale)
+    crop_bottom = height - int(bottom_margin * scale)
+    crop_top = min(max(0, crop_top), height - 1)
+    crop_bottom = max(crop_top + 1, min(height, crop_bottom))
+    return (0, crop_top, width, crop_bottom)
+
+def encode_image(image, image_format=None, quality=None):
+    """把PIL图片编码为Gemini可接受的blob字典 {"mime_type": ..., "data": ...}"""
+    image_format = (image_format or Config.preprocess_format).upper()
+    quality = Config.preprocess_quality if quality is None else quality
+    if image_format not in MIME_TYPES:
+        raise ValueError(f"不支持的编码格式: {image_format}")
+
+    if image_format in ("JPEG", "WEBP") and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format=image_format, quality=quality)
+    return {"mime_type": MIME_TYPES[image_format], "data": buffer.getvalue()}
+
+def preprocess_image(image, crop=None, grayscale=None, target_width=None, image_format=None, quality=None):
+    """裁剪、灰度化、缩放并重新编码一张截图，返回blob字典"""
+    crop = Config.preprocess_crop if crop is None else crop
+    grayscale = Config.preprocess_grayscale if grayscale is None else grayscale
+    target_width = Config.preprocess_target_width if target_width is None else target_width
+
+    if crop:
+        image = image.crop(ranking_crop_box(image.size))
+    if grayscale:
+        image = image.convert("L")
+    if target_width and image.width > target_width:
+        target_height = max(1, round(image.height * target_width / image.width))
+        image = image.resize((target_width, target_height), Image.LANCZOS)
+
+    return encode_image(image, image_format, quality)
+
+def preprocess_signature():
+    """当前预处理设置的描述字符串，用于区分缓存条目"""
+    if not Config.preprocess_enabled:
+        return "raw"
+    return (
+        f"crop={Config.preprocess_crop}:{Config.preprocess_crop_top_margin}:{Config.preprocess_crop_bottom_margin},"
+        f"gray={Config.preprocess_grayscale},width={Config.preprocess_target_width},"
+        f"format={Config.preprocess_format}:{Config.preprocess_quality}"
+    )
@@ -0,0 +1,140 @@
+from collections import Counter
+
+# 排名校验配置
+rank_field = "排名"  # 记录中排名所在的字段
+ranking_field = "榜单"  # 记录中榜单名称所在的字段
+frame_margin = 1  # 重新分析时在估算出的帧前后各多带几帧，避免店铺卡片跨越两帧时漏掉
+frame_margin_min_frames = 5  # 帧数少于该值的文件夹（细分榜单通常只有4帧）不带前后帧
+max_repair_fraction = 0.5  # 最多重新分析文件夹中这一比例的帧，否则与重新上传整个文件夹差不多
+
+def record_rank(record):
+    """记录的排名（整数），无法识别时返回None"""
+    if not isinstance(record, dict):
+        return None
+    rank = record.get(rank_field)
+    if isinstance(rank, bool):
+        return None
+    try:
+        rank = int(str(rank).strip())
+    except (TypeError, ValueError):
+        return None
+    return rank if rank > 0 else None
+
+def check_ranks(records, expected_count=None, complete=True):
+    """检查排名是否从1连续、有无重复以及是否达到预期数量，返回可直接保存为JSON的报告
+
+    complete为False表示响应被截断，最大排名之后可能还有记录
+    """
+    ranks = [record_rank(record) for record in records]
+    valid = [rank for rank in ranks if rank is not None]
+    counts = Counter(valid)
+    max_rank = max(valid, default=0)
+    last_rank = max(max_rank, expected_count or 0)
+    missing = [rank for rank in range(1, last_rank + 1) if rank not in counts]
+    duplicates = sorted(rank for rank, count in counts.items() if count > 1)
+    return {
+        "records": len(records),
+        "max_rank": max_rank,
+        "expected_count": expected_count,
+        "missing": missing,
+        "duplicates": duplicates,
+        "invalid": len(ranks) - len(valid),
+        "truncated": not complete,
+        "ok": bool(valid) and not missing and not duplicates and complete,
+    }
+
+def frame_index(rank, last_rank, frame_count):
+    """按排名在榜单中的位置估算它出现在第几帧（店铺卡片在各帧中大致均匀分布）"""
+    return min(frame_count - 1, (rank - 1) * frame_count // max(1, last_rank))
+
+def frames_for_ranks(report, frame_count, margin=None):
+    """根据校验报告估算需要重新分析的帧序号，返回升序列表；没有可参考的排名时返回[]
+
+    缺失的排名按位置换算到帧，前后各带margin帧（帧数少于frame_margin_min_frames时不带）；
+    响应被截断时最大排名所在帧之后的帧全部重新分析。帧数超过max_repair_fraction时先去掉前后帧，
+    仍然超过时只保留靠前的帧，其余缺失的排名留在报告中
+    """
+    margin = frame_margin if margin is None else margin
+    if frame_count < frame_margin_min_frames:
+        margin = 0
+    last_rank = max(report["max_rank"], report["expected_count"] or 0)
+    if frame_count == 0 or last_rank == 0:
+        return []
+
+    def collect(margin):
+        indices = set()
+        for rank in report["missing"]:
+            index = frame_index(rank, last_rank, frame_count)
+            indices.update(range(max(0, index - margin), min(frame_count, index + margin + 1)))
+        if report["truncated"]:
+            indices.update(range(frame_index(report["max_rank"], last_rank, frame_count), frame_count))
+        return sorted(indices)
+
+    limit = max(1, int(frame_count * max_repair_fraction))
+    indices = collect(margin)
+    if len(indices) > limit and margin:
+        indices = collect(0)
+    return indices[:limit]
+
+def dedupe_records(records):
+    """去掉完全相同的记录（相邻帧重叠部分常被识别两次），保持原有顺序"""
+    seen = set()
+    unique = []
+    for record in records:
+        key = repr(sorted(record.items())) if isinstance(record, dict) else repr(record)
+        if key not in seen:
+            seen.add(key)
+            unique.append(record)
+    return unique
+
+def merge_records(records, extra_records, wanted_ranks=None):
+    """把重新分析得到的记录补进原记录，返回(合并后的记录, 补上的排名)
+
+    只补原记录中没有的排名（wanted_ranks不为None时只补其中的排名）；榜单名称只出现在第一帧顶部，
+    中间的帧识别不到，补上的记录统一使用原记录中最常见的榜单名称。结果按排名排序
+    """
+    records = dedupe_records(records)
+    present = {record_rank(record) for record in records}
+    names = Counter(record.get(ranking_field) for record in records if isinstance(record, dict) and record.get(ranking_field))
+    ranking_name = names.most_common(1)[0][0] if names else None
+
+    added = []
+    for record in extra_records:
+        rank = record_rank(record)
+        if rank is None or rank in present or (wanted_ranks is not None and rank not in wanted_ranks):
+            continue
+        record = dict(record)
+        if ranking_name is not None:
+            record[ranking_field] = ranking_name
+        records.append(record)
+        present.add(rank)
+        added.append(rank)
+
+    # 无法识别排名的记录排在最后
+    records.sort(key=lambda record: (record_rank(record) is None, record_rank(record) or 0))
+    return records, sorted(added)
+
+def field_complete(record):
+    """记录是否包含榜单、品牌，且排名和价格都是整数"""
+    if not isinstance(record, dict):
+        return False
+    if not record.get(ranking_field) or not record.get("品牌"):
+        return False
+    return all(isinstance(record.get(field), int) and not isinstance(record.get(field), bool)
+               for field in (rank_field, "价格"))
+
+def score_records(records, complete=True, expected_count=None):
+    """给识别结果打分（0到1），用于决定是否升级到更强的模型，返回(得分, 各项得分)
+
+    得分为三项的乘积：JSON是否完整解析（被截断时记0.8）、字段完整的记录比例、排名连续性（缺失和重复的排名越多越低）
+    """
+    if not records:
+        return 0.0, {"json": 1.0 if complete else 0.0, "fields": 0.0, "ranks": 0.0}
+    report = check_ranks(records, expected_count, complete)
+    last_rank = max(report["max_rank"], expected_count or 0, 1)
+    parts = {
+        "json": 1.0 if complete else 0.8,
+        "fields": sum(1 for record in records if field_complete(record)) / len(records),
+        "ranks": max(0.0, 1 - (len(report["missing"]) + len(report["duplicates"])) / last_rank),
+    }
+    return parts["json"] * parts["fields"] * parts["ranks"], parts
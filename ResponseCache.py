@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import threading
+
+# 默认缓存配置
+default_cache_path = os.path.join("分析缓存", "responses.sqlite")
+default_max_age_days = 30  # 超过该天数的缓存条目会被清除
+default_max_size_mb = 200  # 缓存总大小上限，超过后按最近最少使用淘汰
+
+def make_cache_key(model_name, prompt, image_blobs, variant=""):
+    """根据模型名称、提示词和所有图片的原始字节计算缓存键
+
+    variant用于区分同一批图片的不同预处理方式（如去重、裁剪设置）
+    """
+    digest = hashlib.sha256()
+    for part in [model_name.encode("utf-8"), prompt.encode("utf-8"), variant.encode("utf-8")] + list(image_blobs):
+        # 写入长度前缀，避免不同切分方式产生相同的哈希
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+class ResponseCache:
+    """以SQLite保存Gemini原始响应文本的内容寻址缓存（线程安全）"""
+
+    def __init__(self, path=default_cache_path, max_age_days=default_max_age_days, max_size_mb=default_max_size_mb):
+        self.path = path
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+
+    def get(self, key):
+        """查询缓存，命中时返回原始响应文本，否则返回None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, model_name, response_text):
+        """写入一条响应"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response_text, len(response_text.encode("utf-8")), now, now),
+            )
+            self.conn.commit()
+
+    def evict(self):
+        """清除过期条目，并在总大小超限时按最近最少使用顺序淘汰，返回删除的条目数"""
+        with self.lock:
+            removed = self.conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+            ).rowcount
+
+            total_size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_size > self.max_size_bytes:
+                stale_keys = []
+                for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                    if total_size <= self.max_size_bytes:
+                        break
+                    stale_keys.append((key,))
+                    total_size -= size
+                self.conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+                removed += len(stale_keys)
+
+            self.conn.commit()
+            return removed
+
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+
+    def stats(self):
+        """返回缓存条目数、总大小以及本次运行的命中统计"""
+        with self.lock:
+            entries, total_size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "size_bytes": total_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "evict", "clear"):
+        print("使用方法: python ResponseCache.py <stats|evict|clear> [缓存文件路径]")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    cache = ResponseCache(sys.argv[2] if len(sys.argv) > 2 else default_cache_path)
+
+    if command == "evict":
+        print(f"已清除 {cache.evict()} 条缓存")
+    elif command == "clear":
+        cache.clear()
+        print("缓存已清空")
+
+    stats = cache.stats()
+    print(f"缓存条目: {stats['entries']}，总大小: {stats['size_bytes'] / 1024 / 1024:.2f} MB")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
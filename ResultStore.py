@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+from JsonStream import iter_json_array
+
+# 默认结果库位置
+default_store_path = os.path.join("分析结果文件", "results.sqlite")
+
+# 会话文件夹名称格式：城市_年月日_时分秒
+session_pattern = re.compile(r'^([^_]+)_(\d{8})_(\d{6})$')
+time_format = "%Y-%m-%d %H:%M:%S"
+
+def parse_session_name(session):
+    """从会话名称解析城市和采集时间，无法解析时城市为"未知"、时间为None"""
+    match = session_pattern.match(session)
+    if not match:
+        return "未知", None
+    captured_at = datetime.strptime(match.group(2) + match.group(3), "%Y%m%d%H%M%S")
+    return match.group(1), captured_at
+
+def parse_rank(value):
+    """把排名转换为整数，无法转换时返回None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class ResultStore:
+    """以SQLite保存所有会话的分析结果，按城市、榜单、品牌和采集时间建立索引（线程安全）
+
+    每个(会话, 榜单)对应一个结果文件，记录按原样保存，整理和去重在上传时进行
+    """
+
+    def __init__(self, path=default_store_path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        store_dir = os.path.dirname(path)
+        if store_dir and not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            """CREATE TABLE IF NOT EXISTS records (
+                session TEXT NOT NULL,
+                city TEXT NOT NULL,
+                ranking TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                brand TEXT,
+                rank INTEGER,
+                captured_at TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (session, ranking, position)
+            );
+            CREATE INDEX IF NOT EXISTS idx_records_ranking ON records (city, ranking, captured_at);
+            CREATE INDEX IF NOT EXISTS idx_records_brand ON records (city, brand, captured_at);
+            CREATE INDEX IF NOT EXISTS idx_records_time ON records (captured_at);"""
+        )
+        self.conn.commit()
+
+    def save_ranking(self, session, ranking, records, captured_at=None):
+        """保存一个会话中一个榜单的全部记录，替换该榜单原有的记录"""
+        city, session_time = parse_session_name(session)
+        captured_at = (captured_at or session_time or datetime.now()).strftime(time_format)
+        rows = [
+            (session, city, ranking, position, record.get("品牌") if isinstance(record, dict) else None,
+             parse_rank(record.get("排名")) if isinstance(record, dict) else None,
+             captured_at, json.dumps(record, ensure_ascii=False))
+            for position, record in enumerate(records)
+        ]
+        with self.lock:
+            self.conn.execute("DELETE FROM records WHERE session = ? AND ranking = ?", (session, ranking))
+            self.conn.executemany(
+                "INSERT INTO records (session, city, ranking, position, brand, rank, captured_at, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.commit()
+        return len(rows)
+
+    def import_session(self, session_dir):
+        """把已有的结果文件夹导入结果库，返回导入的记录数"""
+        session = os.path.basename(os.path.normpath(session_dir))
+        count = 0
+        for filename in sorted(os.listdir(session_dir)):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(session_dir, filename), 'r', encoding='utf-8') as f:
+                count += self.save_ranking(session, os.path.splitext(filename)[0], iter_json_array(f))
+        return count
+
+    def sessions(self, city=None, days=None):
+        """按采集时间顺序返回会话列表，可按城市和最近天数筛选"""
+        query = "SELECT session, city, MIN(captured_at), COUNT(DISTINCT ranking), COUNT(*) FROM records"
+        conditions, params = self._filters(city=city, days=days)
+        query += conditions + " GROUP BY session ORDER BY MIN(captured_at), session"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [
+            {"session": s, "city": c, "captured_at": t, "rankings": r, "records": n}
+            for s, c, t, r, n in rows
+        ]
+
+    def rankings(self, session):
+        """返回一个会话中的榜单名称"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT ranking FROM records WHERE session = ? ORDER BY ranking", (session,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def iter_ranking(self, session, ranking):
+        """按原始顺序逐条产出一个榜单的记录"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT data FROM records WHERE session = ? AND ranking = ? ORDER BY position", (session, ranking)
+            ).fetchall()
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def top(self, ranking, city=None, days=30, n=10):
+        """某榜单在最近days天内的前N名品牌，按平均排名排序
+
+        返回每个品牌的平均排名、最好排名、上榜次数和最近一次上榜时间
+        """
+        conditions, params = self._filters(city=city, days=days, ranking=ranking)
+        query = (
+            "SELECT brand, AVG(rank), MIN(rank), COUNT(*), MAX(captured_at) FROM records"
+            + conditions + " AND brand IS NOT NULL AND rank IS NOT NULL"
+            " GROUP BY brand ORDER BY AVG(rank), MIN(rank), brand LIMIT ?"
+        )
+        with self.lock:
+            rows = self.conn.execute(query, params + [n]).fetchall()
+        return [
+            {"品牌": brand, "平均排名": round(avg_rank, 2), "最好排名": best, "上榜次数": count, "最近上榜": last}
+            for brand, avg_rank, best, count, last in rows
+        ]
+
+    def history(self, brand, city=None, ranking=None, days=None):
+        """某品牌每次上榜的时间、城市、榜单和排名"""
+        conditions, params = self._filters(city=city, days=days, ranking=ranking)
+        query = (
+            "SELECT captured_at, city, ranking, rank FROM records" + conditions
+            + " AND brand = ? ORDER BY captured_at, ranking"
+        )
+        with self.lock:
+            rows = self.conn.execute(query, params + [brand]).fetchall()
+        return [{"采集时间": t, "城市": c, "榜单": r, "排名": rank} for t, c, r, rank in rows]
+
+    def _filters(self, city=None, days=None, ranking=None):
+        conditions = ["1 = 1"]
+        params = []
+        if city:
+            conditions.append("city = ?")
+            params.append(city)
+        if ranking:
+            conditions.append("ranking = ?")
+            params.append(ranking)
+        if days:
+            conditions.append("captured_at >= ?")
+            params.append((datetime.now() - timedelta(days=days)).strftime(time_format))
+        return " WHERE " + " AND ".join(conditions), params
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def print_rows(rows):
+    for row in rows:
+        print("\t".join(str(value) for value in row.values()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查询本地分析结果库")
+    parser.add_argument("--store", default=default_store_path, help=f"结果库路径 (默认 {default_store_path})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="导入已有的结果文件夹")
+    import_parser.add_argument("directories", nargs="+", help="分析结果文件/城市_时间戳，或包含多个会话的分析结果文件目录")
+
+    sessions_parser = subparsers.add_parser("sessions", help="列出会话")
+    sessions_parser.add_argument("--city", help="城市")
+    sessions_parser.add_argument("--days", type=int, help="最近天数")
+
+    top_parser = subparsers.add_parser("top", help="榜单前N名，例如: top 火锅 --city 成都 --days 30")
+    top_parser.add_argument("ranking", help="榜单名称")
+    top_parser.add_argument("--city", help="城市")
+    top_parser.add_argument("--days", type=int, default=30, help="最近天数 (默认 30)")
+    top_parser.add_argument("-n", type=int, default=10, help="返回数量 (默认 10)")
+
+    history_parser = subparsers.add_parser("history", help="品牌的历史排名")
+    history_parser.add_argument("brand", help="品牌名称")
+    history_parser.add_argument("--city", help="城市")
+    history_parser.add_argument("--ranking", help="榜单名称")
+    history_parser.add_argument("--days", type=int, help="最近天数")
+
+    args = parser.parse_args(argv)
+    store = ResultStore(args.store)
+
+    if args.command == "import":
+        for directory in args.directories:
+            if not os.path.isdir(directory):
+                print(f"Directory not found: {directory}")
+                continue
+            # 既可以是单个会话文件夹，也可以是包含多个会话的根目录
+            if any(name.endswith('.json') for name in os.listdir(directory)):
+                session_dirs = [directory]
+            else:
+                session_dirs = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                                if os.path.isdir(os.path.join(directory, name))]
+            for session_dir in session_dirs:
+                try:
+                    count = store.import_session(session_dir)
+                    print(f"已导入 {session_dir}: {count} 条记录")
+                except Exception as e:
+                    print(f"导入 {session_dir} 失败: {repr(e)}")
+    elif args.command == "sessions":
+        print_rows(store.sessions(args.city, args.days))
+    elif args.command == "top":
+        print_rows(store.top(args.ranking, args.city, args.days, args.n))
+    elif args.command == "history":
+        print_rows(store.history(args.brand, args.city, args.ranking, args.days))
+
+    store.close()
+
+if __name__ == "__main__":
+    main()
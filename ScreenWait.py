@@ -0,0 +1,83 @@
+import time
+import numpy as np
+
+import Config
+import Metrics
+
+def simulator_bbox():
+    """模拟器窗口在屏幕上的区域"""
+    left, top = Config.positions["simulator_top_left"]
+    right, bottom = Config.positions["simulator_bottom_right"]
+    return (left, top, right, bottom)
+
+def grab_screen(bbox=None, latest=False):
+    """截取模拟器区域并缩小为灰度数组，用于快速比较画面是否变化
+
+    latest为True时允许复用上次操作之后的最近一次截图（adb截图要传输整个屏幕，操作前的画面不必重新截取）
+    """
+    from Driver import get_driver
+
+    driver = get_driver()
+    image = (driver.latest_screenshot(bbox) if latest else driver.screenshot(bbox)).convert("L")
+    factor = max(1, Config.settle_downsample)
+    if factor > 1:
+        image = image.reduce(factor)
+    return np.asarray(image, dtype=np.int16)
+
+def frame_difference(frame_a, frame_b):
+    """两帧之间的平均灰度差（0-255），尺寸不同视为完全不同"""
+    frame_a = np.asarray(frame_a, dtype=np.int16)
+    frame_b = np.asarray(frame_b, dtype=np.int16)
+    if frame_a.shape != frame_b.shape:
+        return 255.0
+    return float(np.abs(frame_a - frame_b).mean())
+
+def wait_until_stable(grab=None, before=None, timeout=None, min_wait=0.0, change_timeout=None):
+    """等待画面稳定：连续几帧之间几乎没有差别时返回True，超时返回False
+
+    grab: 返回当前画面数组的函数，默认截取模拟器区域（测试时可传入回放录制帧的函数）
+    before: 操作前的画面。提供时先等待画面出现变化（最多change_timeout秒），
+            避免界面还没来得及响应就被误判为稳定
+    min_wait: 至少等待的秒数，用于加载期间可能出现短暂静止的页面
+    """
+    grab = grab or grab_screen
+    timeout = Config.settle_timeout if timeout is None else timeout
+    change_timeout = Config.settle_change_timeout if change_timeout is None else change_timeout
+    interval = Config.settle_interval
+    threshold = Config.settle_threshold
+    # adb每次截图本身就要几百毫秒，相邻两帧相同已经跨过了桌面驱动连续几帧的时间
+    stable_frames = Config.adb_settle_stable_frames if Config.driver == "adb" else Config.settle_stable_frames
+
+    started = time.monotonic()
+    deadline = started + timeout
+    previous = grab()
+
+    # 等待操作生效：画面开始变化或等待超时（例如点击后界面本来就不会变化）
+    if before is not None:
+        change_deadline = min(deadline, started + change_timeout)
+        while frame_difference(before, previous) < threshold and time.monotonic() < change_deadline:
+            time.sleep(interval)
+            previous = grab()
+
+    stable_count = 0
+    while time.monotonic() < deadline:
+        time.sleep(interval)
+        current = grab()
+        if frame_difference(previous, current) < threshold:
+            stable_count += 1
+            if stable_count >= stable_frames and time.monotonic() - started >= min_wait:
+                return True
+        else:
+            stable_count = 0
+        previous = current
+
+    return False
+
+def settle(before=None, timeout=None, min_wait=0.0):
+    """按配置等待界面稳定；关闭自适应等待时退化为固定等待timeout秒"""
+    timeout = Config.settle_timeout if timeout is None else timeout
+    with Metrics.span("settle"):
+        if not Config.settle_enabled:
+            time.sleep(timeout)
+            return True
+        return wait_until_stable(before=before, timeout=timeout, min_wait=min_wait)
@@ -1,12 +1,13 @@
-import pyautogui
-import pyperclip
 import time
 import os
 import sys
+import queue
+import argparse
+import threading
 from datetime import datetime
 import importlib
-from PIL import Image, ImageGrab
-import platform
+import json
+import shutil
 
 # 确保Config.py存在
 if not os.path.exists("Config.py"):
@@ -15,133 +16,409 @@ if not os.path.exists("Config.py"):
 
 # 导入配置
 import Config
+import Metrics
 
 # 检查位置是否已经定位
 if None in [Config.positions["simulator_top_left"], Config.positions["simulator_bottom_right"]]:
     print("位置尚未完全定位，请先运行Locate.py进行定位")
     sys.exit(1)
 
-# 创建保存截图的根目录
+# 保存截图的根目录（开始采集时创建）
 results_dir = "搜索结果截图"
-if not os.path.exists(results_dir):
-    os.makedirs(results_dir)
+# 坐标每个进程只校验一次：第一个城市采集完后模拟器停留在排行页面，首页按钮不再可见（批量采集）
+positions_checked = False
+
+def click_position(position, description="位置", timeout=1, min_wait=0.0):
+    """点击指定坐标，并等待界面稳定（最长timeout秒）"""
+    # 延迟导入：驱动和等待模块会加载PIL和numpy，--help时不需要
+    from Driver import get_driver
+    from ScreenWait import grab_screen, settle
 
-def click_position(position, description="位置"):
-    """点击指定坐标"""
     print(f"点击{description}: {position}")
-    pyautogui.click(position[0], position[1])
-    time.sleep(1)  # 点击后稍作等待
+
+    with Metrics.span("click_position", target=description):
+        before = grab_screen(latest=True) if Config.settle_enabled else None
+        get_driver().click(position)
+        settle(before, timeout, min_wait)  # 点击后等待界面响应
 
 def copy_and_paste(text):
-    """将文本复制到剪贴板并粘贴"""
+    """输入文本（桌面驱动通过剪贴板粘贴，adb驱动直接发送到设备）"""
+    from Driver import get_driver
+    from ScreenWait import grab_screen, settle
+
     print(f"粘贴文本: {text}")
-    pyperclip.copy(text)
-    time.sleep(0.5)
-    
-    # 根据操作系统选择不同的粘贴热键
-    if platform.system() == "Darwin":  # macOS
-        pyautogui.hotkey('command', 'v')
-    else:  # Windows/Linux
-        pyautogui.hotkey('ctrl', 'v')
-    
-    time.sleep(1)
+    before = grab_screen(latest=True) if Config.settle_enabled else None
+    get_driver().input_text(text)
+    settle(before, timeout=2)  # 等待搜索结果出现
 
-def take_screenshot(save_path):
-    """截取模拟器窗口的截图并保存"""
-    left, top = Config.positions["simulator_top_left"]
-    right, bottom = Config.positions["simulator_bottom_right"]
-    
-    # 截取指定区域
-    screenshot = ImageGrab.grab(bbox=(left, top, right, bottom))
-    screenshot.save(save_path)
+def grab_screenshot():
+    """截取模拟器窗口的截图（不保存）；adb驱动下直接使用等待界面稳定时的最后一帧"""
+    from Driver import get_driver
+
+    with Metrics.span("grab_screenshot"):
+        return get_driver().latest_screenshot()
+
+def save_screenshot(screenshot, save_path, writer=None):
+    """保存截图：提供writer时交给后台线程编码和写入，否则直接保存"""
+    if writer is not None:
+        writer.submit(screenshot, save_path)
+        return
+    with Metrics.span("save_screenshot"):
+        screenshot.save(save_path)
     print(f"截图已保存: {save_path}")
-    time.sleep(0.5)
 
-def main():
-    """主搜索逻辑"""
-    print("=== 大众点评搜索自动化脚本 ===")
+def take_screenshot(save_path, writer=None):
+    """截取模拟器窗口的截图并保存，返回截图"""
+    with Metrics.span("take_screenshot"):
+        screenshot = grab_screenshot()
+        save_screenshot(screenshot, save_path, writer)
+    return screenshot
+
+def capture_ranking(folder_path, label, fixed_scrolls, max_scrolls, writer=None):
+    """采集一个榜单：截图并反复下滑，返回记录采集情况的元数据
+
+    开启scroll_until_end时一直下滑到新截图与上一张相同（列表到底）或达到max_scrolls；
+    否则按fixed_scrolls固定下滑。元数据同时写入文件夹中的meta.json。
+    提供writer时截图由后台线程保存，返回时可能还没有全部写入
+    """
+    from FrameDedup import dhash, hamming_distance
+    from CaptureWriter import frame_file_name
+
+    started = time.monotonic()
+    until_end = Config.scroll_until_end
+    scroll_limit = max_scrolls if until_end else fixed_scrolls
+    stop_reason = "max_scrolls" if until_end else "fixed"
+
+    # 第一次截图
+    previous_hash = dhash(take_screenshot(os.path.join(folder_path, frame_file_name(0)), writer))
+    frames = 1
+    scrolls = 0
+
+    # 循环滚动和截图
+    for i in range(scroll_limit):
+        print(f"{label}下滑 ({i+1}/{scroll_limit})")
+        with Metrics.span("scroll_down"):
+            Config.scroll_down()  # 执行下滑
+        scrolls += 1
+
+        screenshot = grab_screenshot()
+        current_hash = dhash(screenshot)
+        if until_end and hamming_distance(previous_hash, current_hash) <= Config.end_of_list_max_distance:
+            # 画面没有变化，说明已经到达列表底部，这一帧是重复的不再保存
+            print(f"{label}已到达列表底部，共 {frames} 张截图")
+            stop_reason = "end_of_list"
+            break
+
+        save_screenshot(screenshot, os.path.join(folder_path, frame_file_name(frames)), writer)
+        frames += 1
+        previous_hash = current_hash
+
+    metadata = {
+        "frames": frames,
+        "scrolls": scrolls,
+        "stop_reason": stop_reason,
+        "duration_seconds": round(time.monotonic() - started, 2),
+        "captured_at": datetime.now().isoformat(),
+    }
+    with open(os.path.join(folder_path, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=4)
+    return metadata
+
+def mark_complete(folder_path, marker):
+    """在文件夹中写入完成标记，供Analyzer --follow 判断可以开始分析"""
+    with open(os.path.join(folder_path, marker), 'w', encoding='utf-8') as f:
+        f.write(datetime.now().isoformat())
+
+def start_analysis_consumer(session_dir):
+    """在后台线程中启动分析消费者，返回(文件夹队列, 线程, 结果字典)
+
+    采集循环每完成一个榜单就放入队列，放入None表示采集结束
+    """
+    # 延迟导入：只有边采集边分析时才需要Analyzer
+    import Analyzer
+    # 在主线程中加载模型，配置出错时直接退出而不是在分析线程中失败
+    Analyzer.init_model()
+    Analyzer.enable_cache()
+    Analyzer.enable_store()
+    output_folder = Analyzer.prepare_output_folder(session_dir)
+    with Analyzer.rank_reports_lock:
+        Analyzer.rank_reports.clear()
+
+    folder_queue = queue.Queue()
+    result = {"folder_count": 0, "output_folder": output_folder}
+
+    def consume():
+        result["folder_count"] = Analyzer.analyze_stream(iter(folder_queue.get, None), output_folder)
+
+    thread = threading.Thread(target=consume, name="analysis-consumer", daemon=True)
+    thread.start()
+    return folder_queue, thread, result
+
+class SessionJournal:
+    """采集会话日志：每完成一个步骤追加一行JSON并立即落盘，用于崩溃后续采"""
+
+    file_name = "journal.jsonl"
+
+    def __init__(self, session_dir):
+        self.path = os.path.join(session_dir, self.file_name)
+        self.entries = []
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # 崩溃时最后一行可能只写了一半
+                        break
+
+    def record(self, step, **data):
+        entry = {"step": step, "time": datetime.now().isoformat(), **data}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries.append(entry)
+
+    def city(self):
+        for entry in self.entries:
+            if entry["step"] == "session_started":
+                return entry.get("city")
+        return None
+
+    def completed_folders(self):
+        return {entry["folder"] for entry in self.entries if entry["step"] == "folder_done"}
+
+def validate_folder(folder_path):
+    """检查已完成的榜单文件夹：有完成标记，截图都能正常读取，且数量与meta.json一致"""
+    if not os.path.exists(os.path.join(folder_path, Config.folder_done_marker)):
+        return False
+
+    image_files = [f for f in os.listdir(folder_path) if f.endswith('.png') or f.endswith('.jpg')]
+    if not image_files:
+        return False
+
+    from PIL import Image
+    for image_file in image_files:
+        try:
+            with Image.open(os.path.join(folder_path, image_file)) as img:
+                img.verify()
+        except Exception as e:
+            print(f"截图已损坏: {os.path.join(folder_path, image_file)} ({e})")
+            return False
+
+    meta_path = os.path.join(folder_path, "meta.json")
+    if os.path.exists(meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                if json.load(f).get("frames") != len(image_files):
+                    return False
+        except (OSError, json.JSONDecodeError):
+            return False
+    return True
+
+def prepare_folder(folder_path):
+    """创建榜单文件夹；续采时清空上次写了一半的内容"""
+    if os.path.exists(folder_path):
+        print(f"清理未完成的文件夹: {folder_path}")
+        shutil.rmtree(folder_path)
+    os.makedirs(folder_path)
+
+def main(analyze=False, resume_dir=None, metrics=False):
+    """主搜索逻辑
+
+    analyze为True时边采集边分析：每个榜单采集完成后立即交给Analyzer处理
+    resume_dir为中断的会话文件夹时，从第一个未完成的榜单继续采集
+    metrics为True时记录各步骤耗时，保存到会话文件夹中的trace.jsonl和metrics.prom
+    """
+    global positions_checked
+
+    if resume_dir:
+        session_dir = resume_dir
+        journal = SessionJournal(session_dir)
+        Config.search_city = journal.city() or os.path.basename(os.path.normpath(session_dir)).split('_')[0]
+        print("=== 大众点评搜索自动化脚本（续采） ===")
+        print(f"续采会话: {session_dir}")
+    else:
+        print("=== 大众点评搜索自动化脚本 ===")
+
     print(f"搜索城市: {Config.search_city}")
-    print(f"主榜单下滑次数: {Config.main_ranking_scroll_times}")
-    print(f"细分品类榜单下滑次数: {Config.category_ranking_scroll_times}")
-    
-    # 每次运行时创建带时间戳的文件夹
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    session_dir = os.path.join(results_dir, f"{Config.search_city}_{timestamp}")
-    os.makedirs(session_dir)
+    if Config.driver != "desktop":
+        print(f"设备驱动: {Config.driver}" + (f"（{Config.adb_serial}）" if Config.adb_serial else ""))
+    elif Config.autolocate_validate and not positions_checked:
+        # 模拟器窗口移动过时自动重新定位（需要先用Locate.py保存定位模板）；续采时模拟器可能不在首页，不做整屏定位
+        from AutoLocate import ensure_positions
+        Config.positions = ensure_positions(Config.positions, relocate=not resume_dir)
+        positions_checked = True
+    if Config.scroll_until_end:
+        print(f"下滑到列表底部为止（主榜单最多 {Config.main_ranking_max_scrolls} 次，细分品类最多 {Config.category_ranking_max_scrolls} 次）")
+    else:
+        print(f"主榜单下滑次数: {Config.main_ranking_scroll_times}")
+        print(f"细分品类榜单下滑次数: {Config.category_ranking_scroll_times}")
     
+    if not resume_dir:
+        # 每次运行时创建带时间戳的文件夹
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        session_dir = os.path.join(results_dir, f"{Config.search_city}_{timestamp}")
+        os.makedirs(session_dir)  # 同时创建results_dir
+        journal = SessionJournal(session_dir)
+        journal.record("session_started", city=Config.search_city)
+
+    if metrics:
+        Metrics.enable(session_dir)
+    analysis = start_analysis_consumer(session_dir) if analyze else None
+    try:
+        capture_session(session_dir, analysis[0] if analysis else None, journal)
+        journal.record("session_done")
+        mark_complete(session_dir, Config.session_done_marker)
+        print("\n所有数据采集完成!")
+        print(f"数据已保存到: {session_dir}")
+    except Exception:
+        print(f"采集中断，可以使用 python Search.py --resume {session_dir} 从中断处继续采集")
+        raise
+    finally:
+        if analysis:
+            # 通知分析线程采集已结束（出错时也要等待，已完成的榜单照常分析）
+            import Analyzer
+            folder_queue, thread, result = analysis
+            folder_queue.put(None)
+            print("\n等待剩余榜单分析完成...")
+            thread.join()
+            flagged = Analyzer.save_rank_report(result["output_folder"]) if Analyzer.validate_enabled else None
+            Analyzer.print_summary(result["folder_count"], flagged)
+        if metrics:
+            Metrics.close()
+
+    return session_dir
+
+def navigate_to_ranking_page():
+    """切换到目标城市并打开美食排行页面"""
     # 1. 点击城市下拉按钮(点击两次确认焦点)
     click_position(Config.positions["city_dropdown_button"], "城市下拉按钮")
-    click_position(Config.positions["city_dropdown_button"], "城市下拉按钮")
-    time.sleep(1)
+    click_position(Config.positions["city_dropdown_button"], "城市下拉按钮", timeout=2)
     
     # 2. 点击城市搜索框
-    click_position(Config.positions["city_search_box"], "城市搜索框")
-    time.sleep(1)
+    click_position(Config.positions["city_search_box"], "城市搜索框", timeout=2)
     
     # 3-4. 复制搜索城市到剪贴板并粘贴
     copy_and_paste(Config.search_city)
-    time.sleep(1)
     
     # 5. 点击城市结果
-    click_position(Config.positions["city_result"], "城市搜索结果")
-    time.sleep(2)  # 等待城市切换完成
+    click_position(Config.positions["city_result"], "城市搜索结果", timeout=3)  # 等待城市切换完成
     
     # 6. 点击美食按钮
-    click_position(Config.positions["food_button"], "美食按钮")
-    time.sleep(2)
+    click_position(Config.positions["food_button"], "美食按钮", timeout=3)
     
     # 7. 点击美食排行按钮
     click_position(Config.positions["food_ranking_button"], "美食排行按钮")
     click_position(Config.positions["food_ranking_button"], "美食排行按钮")
-    click_position(Config.positions["food_ranking_button"], "美食排行按钮")
-    time.sleep(3)  # 等待页面加载
-    
-    # 8. 主榜单截屏和下滑
-    main_ranking_dir = os.path.join(session_dir, "主榜单")
-    os.makedirs(main_ranking_dir)
-    print(f"\n开始采集主榜单数据，将保存到 {main_ranking_dir}")
-    
-    # 第一次截图
-    take_screenshot(os.path.join(main_ranking_dir, "0.png"))
-    
-    # 循环滚动和截图
-    for i in range(Config.main_ranking_scroll_times):
-        print(f"主榜单下滑 ({i+1}/{Config.main_ranking_scroll_times})")
-        Config.scroll_down()  # 执行下滑
-        take_screenshot(os.path.join(main_ranking_dir, f"{i+1}.png"))
-    
-    # 9-12. 遍历19个细分品类
-    for category_index in range(19):
-        # 9. 点击细分品类下拉
-        click_position(Config.positions["category_dropdown"], "细分品类下拉")
-        time.sleep(1)
-        
-        # 10. 点击具体细分品类
-        category_position = Config.positions["categories"][category_index]
-        click_position(category_position, f"细分品类 {category_index+1}/19")
-        time.sleep(3)  # 等待页面加载
-        
-        # 创建该细分品类的文件夹
-        category_dir = os.path.join(session_dir, f"细分榜单{category_index+1}")
-        os.makedirs(category_dir)
-        print(f"\n开始采集细分品类 {category_index+1}/19 数据，将保存到 {category_dir}")
-        
-        # 第一次截图
-        take_screenshot(os.path.join(category_dir, "0.png"))
-        
-        # 循环滚动和截图
-        for i in range(Config.category_ranking_scroll_times):
-            print(f"细分品类下滑 ({i+1}/{Config.category_ranking_scroll_times})")
-            Config.scroll_down()  # 执行下滑
-            take_screenshot(os.path.join(category_dir, f"{i+1}.png"))
-    
-    print("\n所有数据采集完成!")
-    print(f"数据已保存到: {session_dir}")
+    click_position(Config.positions["food_ranking_button"], "美食排行按钮", timeout=4)  # 等待页面加载
+
+def capture_session(session_dir, folder_queue=None, journal=None):
+    """执行完整的采集流程，每完成一个榜单文件夹就写入完成标记、记录日志并放入分析队列
+
+    日志中已记录完成且校验通过的榜单会被跳过（续采）
+    """
+    from CaptureWriter import CaptureWriter
+
+    journal = journal or SessionJournal(session_dir)
+    completed = journal.completed_folders()
+    writer = CaptureWriter()
+    # 已采集但截图可能还在后台写入的榜单，在下一个榜单的导航点击之后再标记完成
+    unfinished = []
+
+    def folder_complete(ranking_type, folder_path):
+        # 截图全部写入后才能标记完成，Analyzer --follow 看到标记就会读取
+        writer.wait_folder(folder_path)
+        mark_complete(folder_path, Config.folder_done_marker)
+        journal.record("folder_done", folder=ranking_type)
+        if folder_queue is not None:
+            folder_queue.put((ranking_type, folder_path))
+
+    def finish_folders():
+        while unfinished:
+            folder_complete(*unfinished.pop(0))
+
+    def already_done(ranking_type, folder_path):
+        if ranking_type not in completed:
+            return False
+        if not validate_folder(folder_path):
+            print(f"{ranking_type} 校验未通过，重新采集")
+            return False
+        print(f"{ranking_type} 已采集完成，跳过")
+        finish_folders()
+        if folder_queue is not None:
+            folder_queue.put((ranking_type, folder_path))
+        return True
+
+    try:
+        # 1-7. 切换城市并进入美食排行页面（续采时也需要重新导航）
+        navigate_to_ranking_page()
+        journal.record("ranking_page_opened")
+
+        # 8. 主榜单截屏和下滑
+        main_ranking_dir = os.path.join(session_dir, "主榜单")
+        if not already_done("主榜单", main_ranking_dir):
+            prepare_folder(main_ranking_dir)
+            print(f"\n开始采集主榜单数据，将保存到 {main_ranking_dir}")
+            capture_ranking(main_ranking_dir, "主榜单", Config.main_ranking_scroll_times, Config.main_ranking_max_scrolls, writer)
+            unfinished.append(("主榜单", main_ranking_dir))
+
+        # 9-12. 遍历19个细分品类
+        for category_index in range(19):
+            ranking_type = f"细分榜单{category_index+1}"
+            category_dir = os.path.join(session_dir, ranking_type)
+            if already_done(ranking_type, category_dir):
+                continue
+
+            # 9. 点击细分品类下拉
+            click_position(Config.positions["category_dropdown"], "细分品类下拉", timeout=2)
+
+            # 10. 点击具体细分品类
+            category_position = Config.positions["categories"][category_index]
+            click_position(category_position, f"细分品类 {category_index+1}/19",
+                           timeout=4, min_wait=Config.category_load_min_wait)  # 等待页面加载
+            finish_folders()
+
+            # 创建该细分品类的文件夹
+            prepare_folder(category_dir)
+            print(f"\n开始采集细分品类 {category_index+1}/19 数据，将保存到 {category_dir}")
+            capture_ranking(category_dir, "细分品类", Config.category_ranking_scroll_times, Config.category_ranking_max_scrolls, writer)
+            unfinished.append((ranking_type, category_dir))
+
+        finish_folders()
+    except Exception:
+        # 下一个榜单的导航点击出错时，已经采集完的榜单照常标记完成，续采和边采集边分析不会漏掉它们
+        writer.close()
+        finish_folders()
+        raise
+    finally:
+        # 等待剩余截图写入并同步到磁盘（出错时已提交的截图也照常保存）
+        writer.close()
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="大众点评榜单截图采集")
+    parser.add_argument("--analyze", action="store_true", help="边采集边分析：每个榜单采集完成后立即调用Analyzer")
+    parser.add_argument("--resume", metavar="SESSION_DIR", help="从中断的会话文件夹继续采集")
+    parser.add_argument("--metrics", action="store_true", help="记录各步骤耗时，保存到会话文件夹中的trace.jsonl和metrics.prom")
+    parser.add_argument("--driver", choices=["desktop", "adb"], help="设备驱动（默认使用Config.driver）")
+    parser.add_argument("--serial", help="adb设备序列号（使用adb驱动时）")
+    args = parser.parse_args(argv)
+
+    if args.driver:
+        Config.driver = args.driver
+    if args.serial:
+        Config.adb_serial = args.serial
+
+    if args.resume and not os.path.isdir(args.resume):
+        print(f"会话文件夹不存在: {args.resume}")
+        sys.exit(1)
 
-if __name__ == "__main__":
     try:
-        main()
+        main(analyze=args.analyze, resume_dir=args.resume, metrics=args.metrics)
     except Exception as e:
         print(f"程序运行出错: {e}")
         import traceback
-        traceback.print_exc() 
\ No newline at end of file
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    cli()
@@ -2,10 +2,19 @@ import os
 import json
 import sys
 import re
-from supabase import create_client, Client
 from dotenv import load_dotenv
 import traceback
+import time
+import random
+import queue
+import argparse
+import threading
+from datetime import datetime
 from collections import defaultdict
+from UploadManifest import UploadManifest
+from JsonStream import iter_json_array, NotAnArrayError
+from ResultStore import ResultStore, default_store_path
+import Metrics
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,17 +23,26 @@ load_dotenv()
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
 
-# 检查API密钥是否存在
-if not supabase_url or not supabase_key:
-    print("错误: 未找到Supabase凭据。请在.env文件中添加SUPABASE_URL和SUPABASE_KEY")
-    sys.exit(1)
-
-# Initialize Supabase client
-supabase: Client = create_client(supabase_url, supabase_key)
+# Supabase客户端在第一次上传时才创建（导入supabase SDK较慢）
+supabase = None
+supabase_lock = threading.Lock()
 
 # Required fields that must be present in each record
 REQUIRED_FIELDS = ["榜单", "品牌"]
 
+# Fields that identify a record in the dzdpdata table
+RECORD_KEY_FIELDS = ("城市", "榜单", "品牌")
+
+# 批量上传配置
+BATCH_SIZE = 500  # 每个批次的最大记录数
+UPLOAD_WORKERS = 4  # 并行上传的通道数（共享同一个连接池）
+MAX_RETRIES = 5  # 每个批次的最大尝试次数
+BACKOFF_BASE = 1  # 指数退避的基础等待秒数
+BACKOFF_MAX = 30  # 指数退避的最大等待秒数
+FAILED_BATCH_DIR = "上传失败"  # 重试后仍失败的批次保存位置
+METRICS_DIR = os.path.join("上传记录", "耗时")  # 上传耗时记录的保存位置
+MANIFEST_PATH = os.path.join("上传记录", "manifest.sqlite")  # 本地上传清单（已上传记录的内容哈希）
+
 def extract_city_from_path(file_path):
     """从文件路径中提取城市名称"""
     # 解析文件路径获取目录名
@@ -54,95 +72,119 @@ def validate_data(data):
     
     return True
 
-def handle_duplicate_keys(data):
-    """Handle duplicate primary key combinations"""
+def handle_duplicate_keys(records):
+    """Handle duplicate primary key combinations (generator stage)"""
     # Keep track of seen (榜单, 品牌) combinations
     seen_keys = defaultdict(int)
-    modified_data = []
-    
-    for record in data:
+
+    for record in records:
         key = (record["榜单"], record["品牌"])
         seen_keys[key] += 1
-        
+
         # If this is a duplicate, append a counter to make it unique
         if seen_keys[key] > 1:
             new_record = record.copy()
             new_record["品牌"] = f"{record['品牌']}_{seen_keys[key]}"
-            modified_data.append(new_record)
             print(f"  Renamed duplicate key: {record['品牌']} → {new_record['品牌']}")
+            yield new_record
         else:
-            modified_data.append(record)
-    
-    return modified_data
+            yield record
 
-def handle_missing_required_fields(data):
-    """处理缺失必要字段的记录"""
-    valid_records = []
+def handle_missing_required_fields(records):
+    """跳过缺失必要字段的记录（生成器阶段），全部读完后打印跳过的数量"""
     skipped_count = 0
-    
-    for record in data:
-        is_valid = True
-        for field in REQUIRED_FIELDS:
-            if field not in record or not record[field]:
-                is_valid = False
-                skipped_count += 1
-                break
-                
-        if is_valid:
-            valid_records.append(record)
-    
+
+    for record in records:
+        if isinstance(record, dict) and any(field not in record or not record[field] for field in REQUIRED_FIELDS):
+            skipped_count += 1
+            continue
+        yield record
+
     if skipped_count > 0:
         print(f"  警告: 跳过了 {skipped_count} 条缺少必要字段的记录")
-        
-    return valid_records
 
-def process_json_file(file_path):
+def apply_file_fields(records, filename, ranking, city):
+    """用文件名和城市填充榜单、城市字段（生成器阶段）"""
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"Invalid record format in {filename}: Each item must be an object")
+
+        # Replace "榜单" field with filename
+        record["榜单"] = ranking
+
+        # 添加城市字段
+        record["城市"] = city
+        yield record
+
+def require_records(records, message):
+    """没有产出任何记录时抛出ValueError（生成器阶段）"""
+    empty = True
+    for record in records:
+        empty = False
+        yield record
+    if empty:
+        raise ValueError(message)
+
+def normalize_records(records, source_name, ranking, city):
+    """把一个榜单的原始记录依次经过各处理步骤，逐条产出可上传的记录"""
+    records = require_records(records, f"Invalid JSON format in {source_name}: Must be a non-empty list")
+    records = handle_missing_required_fields(records)
+    records = apply_file_fields(records, source_name, ranking, city)
+    records = handle_duplicate_keys(records)
+    return require_records(records, "Data must be a non-empty list")
+
+def iter_json_file_records(file_path):
+    """单次遍历读取并整理一个结果文件，逐条产出可上传的记录
+
+    增量解析JSON数组，各处理步骤都是生成器，内存中只保留当前记录和重复键计数
+    """
     # Get filename without extension to replace "榜单" field
     filename = os.path.basename(file_path)
     filename_without_ext = os.path.splitext(filename)[0]
-    
+
     # 从文件路径提取城市
     city = extract_city_from_path(file_path)
     print(f"  城市: {city}")
-    
-    # Read JSON file
+
     with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Validate data format
-    if not data or not isinstance(data, list):
-        raise ValueError(f"Invalid JSON format in {filename}: Must be a non-empty list")
-    
-    # 处理缺失必要字段的记录
-    data = handle_missing_required_fields(data)
-    
-    # Process each record in the JSON file
-    for record in data:
-        if not isinstance(record, dict):
-            raise ValueError(f"Invalid record format in {filename}: Each item must be an object")
-        
-        # Replace "榜单" field with filename
-        record["榜单"] = filename_without_ext
-        
-        # 添加城市字段
-        record["城市"] = city
-    
-    # Handle potential duplicate keys
-    data = handle_duplicate_keys(data)
-    
-    return data
+        try:
+            yield from normalize_records(iter_json_array(f), filename, filename_without_ext, city)
+        except NotAnArrayError as e:
+            raise ValueError(f"Invalid JSON format in {filename}: Must be a non-empty list") from e
+
+def process_json_file(file_path):
+    """读取并整理一个结果文件，返回记录列表
+
+    文件中任何一条记录有问题时整个文件都不上传，因此逐个文件收集后再交给上传引擎
+    """
+    return list(iter_json_file_records(file_path))
+
+def get_supabase():
+    """返回Supabase客户端，第一次调用时检查凭据并创建"""
+    global supabase
+    with supabase_lock:
+        if supabase is None:
+            # 检查API密钥是否存在
+            if not supabase_url or not supabase_key:
+                print("错误: 未找到Supabase凭据。请在.env文件中添加SUPABASE_URL和SUPABASE_KEY")
+                sys.exit(1)
+
+            from supabase import create_client
+            supabase = create_client(supabase_url, supabase_key)
+    return supabase
 
 def upload_to_supabase(data):
+    # Validate data before uploading (ValueError propagates unchanged so callers don't retry bad data)
+    validate_data(data)
+
     try:
-        # Validate data before uploading
-        validate_data(data)
-        
         # Print first record for debugging
         if data:
             print(f"Sample record: {json.dumps(data[0], ensure_ascii=False)}")
         
         # Upload data to Supabase - use lowercase table name
-        result = supabase.table("dzdpdata").upsert(data).execute()
+        with Metrics.span("upload_to_supabase", records=len(data)):
+            result = get_supabase().table("dzdpdata").upsert(data, returning="minimal").execute()
         return result
     except Exception as e:
         # Capture and re-raise with more details
@@ -151,47 +193,235 @@ def upload_to_supabase(data):
         traceback.print_exc()  # Print the full stack trace
         raise Exception(error_details)
 
-def process_directory(directory_path):
-    if not os.path.exists(directory_path):
-        print(f"Directory not found: {directory_path}")
-        return
-    
-    # Keep track of total records processed
+def upload_with_retry(batch):
+    """上传一个批次，失败时按指数退避重试，返回是否成功"""
+    for attempt in range(MAX_RETRIES):
+        try:
+            upload_to_supabase(batch)
+            return True
+        except ValueError:
+            # 数据校验失败，重试没有意义
+            return False
+        except Exception:
+            if attempt < MAX_RETRIES - 1:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+                print(f"  Batch of {len(batch)} records failed (attempt {attempt+1}/{MAX_RETRIES}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+    return False
+
+def record_key(record):
+    """记录在数据库中的唯一键"""
+    return tuple(record.get(field) for field in RECORD_KEY_FIELDS)
+
+class UploadEngine:
+    """把记录合并成固定大小的批次，通过共享的Supabase连接池并行上传
+
+    记录按唯一键的哈希分配到各个上传通道，同一键的记录总在同一通道内按顺序上传，
+    因此多个会话中重复的记录仍然是后处理的覆盖先处理的，与逐个文件串行上传一致。
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, workers=UPLOAD_WORKERS, manifest=None):
+        self.batch_size = batch_size
+        self.manifest = manifest
+        self.lock = threading.Lock()
+        self.stats = {"batches": 0, "uploaded": 0, "failed": 0, "failed_batches": 0}
+        # 已加入但还没上传完的键（只包含待上传和上传中的批次，与归档大小无关）
+        self.in_flight = defaultdict(int)
+        self.started = time.monotonic()
+
+        # 提前初始化PostgREST客户端，避免多个线程同时创建
+        get_supabase().postgrest
+
+        self.pending = [dict() for _ in range(workers)]
+        self.queues = [queue.Queue(maxsize=2) for _ in range(workers)]
+        self.threads = [
+            threading.Thread(target=self._lane_worker, args=(q,), name=f"upload-{i}", daemon=True)
+            for i, q in enumerate(self.queues)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def add(self, record):
+        """加入一条记录，所在通道的批次满了就交给上传线程"""
+        key = record_key(record)
+        lane = hash(key) % len(self.pending)
+        batch = self.pending[lane]
+        # 同一批次中的重复键保留最后一条（同一次upsert不能包含重复键）
+        if batch.pop(key, None) is None:
+            with self.lock:
+                self.in_flight[key] += 1
+        batch[key] = record
+        if len(batch) >= self.batch_size:
+            self._flush(lane)
+
+    def _flush(self, lane):
+        if self.pending[lane]:
+            self.queues[lane].put(list(self.pending[lane].values()))
+            self.pending[lane] = dict()
+
+    def _lane_worker(self, lane_queue):
+        while True:
+            batch = lane_queue.get()
+            if batch is None:
+                break
+            success = upload_with_retry(batch)
+            with self.lock:
+                self.stats["batches"] += 1
+                if success:
+                    self.stats["uploaded"] += len(batch)
+                    if self.manifest is not None:
+                        self.manifest.mark_uploaded(batch)
+                else:
+                    self.stats["failed"] += len(batch)
+                    self.stats["failed_batches"] += 1
+                    save_failed_batch(batch, self.stats["failed_batches"])
+                # 上传成功时清单已经更新，之后同一键的记录与清单比较即可
+                for record in batch:
+                    key = record_key(record)
+                    self.in_flight[key] -= 1
+                    if not self.in_flight[key]:
+                        del self.in_flight[key]
+
+    def is_queued(self, key):
+        """该键是否有记录已加入但还没上传完"""
+        with self.lock:
+            return key in self.in_flight
+
+    def close(self):
+        """上传剩余批次并等待所有通道完成，返回统计信息"""
+        for lane in range(len(self.pending)):
+            self._flush(lane)
+            self.queues[lane].put(None)
+        for thread in self.threads:
+            thread.join()
+
+        elapsed = time.monotonic() - self.started
+        stats = dict(self.stats)
+        stats["seconds"] = elapsed
+        stats["records_per_second"] = stats["uploaded"] / elapsed if elapsed > 0 else 0.0
+        return stats
+
+def save_failed_batch(batch, index):
+    """把重试后仍然失败的批次保存下来，方便排查后重新上传"""
+    if not os.path.exists(FAILED_BATCH_DIR):
+        os.makedirs(FAILED_BATCH_DIR)
+    path = os.path.join(FAILED_BATCH_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{index}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(batch, f, ensure_ascii=False, indent=4)
+    print(f"  Failed batch of {len(batch)} records saved to {path}")
+
+def iter_json_files(directory_path):
+    """按文件名顺序列出目录下所有JSON文件（跳过隐藏文件）"""
+    for root, dirs, files in os.walk(directory_path):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith('.json') and not file.startswith('.'):  # Skip hidden files
+                yield os.path.join(root, file)
+
+def iter_directory_units(directory_paths):
+    """按顺序产出结果目录中每个文件的(名称, 读取函数)"""
+    for directory_path in directory_paths:
+        if not os.path.exists(directory_path):
+            print(f"Directory not found: {directory_path}")
+            continue
+
+        # Process all JSON files in the directory
+        for file_path in iter_json_files(directory_path):
+            yield file_path, lambda file_path=file_path: process_json_file(file_path)
+
+def iter_store_units(store, city=None, days=None):
+    """按采集时间顺序产出结果库中每个(会话, 榜单)的(名称, 读取函数)"""
+    for session in store.sessions(city, days):
+        for ranking in store.rankings(session["session"]):
+            def load(session=session, ranking=ranking):
+                print(f"  城市: {session['city']}")
+                return list(normalize_records(store.iter_ranking(session["session"], ranking),
+                                              f"{session['session']}/{ranking}", ranking, session["city"]))
+            yield f"{session['session']}/{ranking}", load
+
+def upload_units(units, batch_size=BATCH_SIZE, workers=UPLOAD_WORKERS, full=False):
+    """读取每个结果文件（或结果库中的榜单），把所有记录合并成批次并行上传
+
+    默认只上传与本地上传清单相比新增或变化的记录；full为True时全部重新上传
+    """
     total_records = 0
     total_files = 0
     successful_files = 0
     failed_files = 0
-    
-    # Process all JSON files in the directory
-    for root, _, files in os.walk(directory_path):
-        for file in files:
-            if file.endswith('.json') and not file.startswith('.'):  # Skip hidden files
-                file_path = os.path.join(root, file)
-                print(f"Processing {file_path}...")
-                
-                try:
-                    # Process JSON file and get modified data
-                    data = process_json_file(file_path)
-                    
-                    # Upload to Supabase
-                    result = upload_to_supabase(data)
-                    
-                    total_records += len(data)
-                    total_files += 1
-                    successful_files += 1
-                    
-                    print(f"Successfully uploaded {len(data)} records from {file}")
-                except Exception as e:
-                    failed_files += 1
-                    total_files += 1
-                    print(f"Error processing {file}: {repr(e)}")
-    
-    print(f"\nSummary: Processed {total_files} files, {successful_files} successful, {failed_files} failed, {total_records} records uploaded")
+    unchanged_records = 0
+
+    manifest = UploadManifest(supabase_url, MANIFEST_PATH)
+    engine = UploadEngine(batch_size, workers, manifest)
+    for name, load in units:
+        print(f"Processing {name}...")
+        total_files += 1
+        try:
+            # Process JSON file and get modified data
+            data = load()
+            validate_data(data)
+        except Exception as e:
+            failed_files += 1
+            print(f"Error processing {os.path.basename(name)}: {repr(e)}")
+            continue
+
+        for record in data:
+            # 同一键已有记录在上传中时必须按顺序上传，保证多个会话中以最后一次为准；
+            # 已上传完的记录已经写入清单，直接与清单比较
+            if not full and not engine.is_queued(record_key(record)) and manifest.is_unchanged(record):
+                unchanged_records += 1
+                continue
+            engine.add(record)
+            total_records += 1
+        successful_files += 1
+
+    stats = engine.close()
+    manifest.close()
+    stats["unchanged"] = unchanged_records
+    print(f"\nSummary: Processed {total_files} files, {successful_files} successful, {failed_files} failed, {total_records} records queued")
+    if not full:
+        print(f"Skipped {unchanged_records} unchanged records already in the upload manifest (use --full to re-upload)")
+    print(f"Uploaded {stats['uploaded']} records in {stats['batches']} batches, {stats['failed']} records failed "
+          f"({stats['seconds']:.1f}s, {stats['records_per_second']:.1f} records/sec)")
+    return stats
+
+def process_directories(directory_paths, batch_size=BATCH_SIZE, workers=UPLOAD_WORKERS, full=False):
+    """处理多个会话目录，把所有记录合并成批次并行上传"""
+    return upload_units(iter_directory_units(directory_paths), batch_size, workers, full)
+
+def process_store(store_path=default_store_path, city=None, days=None, batch_size=BATCH_SIZE, workers=UPLOAD_WORKERS, full=False):
+    """从本地结果库读取（可按城市和最近天数筛选）并上传"""
+    store = ResultStore(store_path)
+    try:
+        return upload_units(iter_store_units(store, city, days), batch_size, workers, full)
+    finally:
+        store.close()
+
+def process_directory(directory_path):
+    return process_directories([directory_path])
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Upload analysis results to Supabase")
+    parser.add_argument("directory_paths", nargs="*", help="分析结果目录（可以同时指定多个会话）")
+    parser.add_argument("--store", nargs="?", const=default_store_path, help=f"从本地结果库读取而不是结果目录 (默认 {default_store_path})")
+    parser.add_argument("--city", help="与--store一起使用：只上传该城市")
+    parser.add_argument("--days", type=int, help="与--store一起使用：只上传最近几天的会话")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"每个批次的最大记录数 (默认 {BATCH_SIZE})")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS, help=f"并行上传的通道数 (默认 {UPLOAD_WORKERS})")
+    parser.add_argument("--full", action="store_true", help="忽略本地上传清单，重新上传所有记录")
+    parser.add_argument("--metrics", action="store_true", help=f"记录每个批次的上传耗时，保存到{METRICS_DIR}/时间戳/")
+    args = parser.parse_args(argv)
+    if not args.store and not args.directory_paths:
+        parser.error("请指定分析结果目录或--store")
+
+    if args.metrics:
+        Metrics.enable(os.path.join(METRICS_DIR, datetime.now().strftime("%Y%m%d_%H%M%S")))
+
+    if args.store:
+        process_store(args.store, args.city, args.days, args.batch_size, args.workers, args.full)
+    else:
+        process_directories(args.directory_paths, args.batch_size, args.workers, args.full)
+    if args.metrics:
+        Metrics.close()
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python Upload.py <directory_path>")
-        sys.exit(1)
-    
-    directory_path = sys.argv[1]
-    process_directory(directory_path) 
\ No newline at end of file
+    cli()
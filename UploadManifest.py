@@ -0,0 +1,74 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# 默认清单位置
+default_manifest_path = os.path.join("上传记录", "manifest.sqlite")
+
+def record_hash(record):
+    """记录内容的哈希（字段顺序无关）"""
+    payload = json.dumps(record, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class UploadManifest:
+    """本地保存每条记录最后一次成功上传时的内容哈希，用于只上传新增或变化的记录
+
+    以(目标数据库, 城市, 榜单, 品牌)为键，不同Supabase项目的上传记录互不影响
+    """
+
+    def __init__(self, target, path=default_manifest_path):
+        self.target = target
+        self.path = path
+        self.lock = threading.Lock()
+
+        manifest_dir = os.path.dirname(path)
+        if manifest_dir and not os.path.exists(manifest_dir):
+            os.makedirs(manifest_dir)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS uploaded (
+                target TEXT NOT NULL,
+                city TEXT NOT NULL,
+                ranking TEXT NOT NULL,
+                brand TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                uploaded_at REAL NOT NULL,
+                PRIMARY KEY (target, city, ranking, brand)
+            )"""
+        )
+        self.conn.commit()
+
+    def is_unchanged(self, record):
+        """记录与上次成功上传的内容完全相同时返回True"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT hash FROM uploaded WHERE target = ? AND city = ? AND ranking = ? AND brand = ?",
+                (self.target, record.get("城市"), record.get("榜单"), record.get("品牌")),
+            ).fetchone()
+        return row is not None and row[0] == record_hash(record)
+
+    def mark_uploaded(self, records):
+        """记录一批已成功上传的记录"""
+        now = time.time()
+        rows = [
+            (self.target, r.get("城市"), r.get("榜单"), r.get("品牌"), record_hash(r), now)
+            for r in records
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO uploaded (target, city, ranking, brand, hash, uploaded_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.commit()
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM uploaded WHERE target = ?", (self.target,)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
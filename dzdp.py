@@ -0,0 +1,41 @@
+import sys
+import importlib
+
+# 子命令: (模块, 入口函数, 说明)，入口函数接收参数列表
+COMMANDS = {
+    "locate": ("Locate", "main", "界面定位"),
+    "search": ("Search", "cli", "采集榜单截图"),
+    "analyze": ("Analyzer", "main", "使用Gemini分析截图"),
+    "daemon": ("Daemon", "main", "常驻分析服务"),
+    "upload": ("Upload", "cli", "上传分析结果到Supabase"),
+    "batch": ("Batch", "main", "多城市批量采集"),
+    "store": ("ResultStore", "main", "查询本地结果库"),
+    "metrics": ("Metrics", "main", "汇总耗时记录"),
+}
+
+def print_usage():
+    print("使用方法: python dzdp.py <子命令> [参数...]\n")
+    print("子命令:")
+    for name, (_, _, description) in COMMANDS.items():
+        print(f"  {name:<8} {description}")
+    print("\n查看子命令的参数: python dzdp.py <子命令> --help")
+
+def main(argv=None):
+    """统一入口：只导入所执行子命令的模块，各SDK在第一次使用时才加载"""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print_usage()
+        return
+    if argv[0] not in COMMANDS:
+        print(f"未知的子命令: {argv[0]}\n")
+        print_usage()
+        sys.exit(2)
+
+    command, args = argv[0], argv[1:]
+    module_name, function_name, _ = COMMANDS[command]
+    # 让argparse的帮助信息显示为"dzdp.py 子命令"
+    sys.argv = [f"dzdp.py {command}"] + args
+    getattr(importlib.import_module(module_name), function_name)(args)
+
+if __name__ == "__main__":
+    main()